@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import uuid
+import logging
+from typing import List, Optional
+
+from redis_client import get_redis
+from prompts import build_batch_prompt
+from token_ledger import token_ledger, current_usage_context, finish_reason
+from metrics import observe_gemini
+
+logger = logging.getLogger(__name__)
+
+# Micro-batching is opt-in: it only pays off when many predict_disease tasks
+# are queued at once and worker concurrency is at least GEMINI_BATCH_MAX.
+GEMINI_BATCH_ENABLED = os.getenv("GEMINI_BATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+GEMINI_BATCH_WINDOW = float(os.getenv("GEMINI_BATCH_WINDOW", "0.25"))  # seconds to collect items
+GEMINI_BATCH_MAX = int(os.getenv("GEMINI_BATCH_MAX", "4"))  # items per Gemini call
+# Per-item output budget; capped at the model's 8192 output token limit
+GEMINI_BATCH_TOKENS_PER_ITEM = int(os.getenv("GEMINI_BATCH_TOKENS_PER_ITEM", "2048"))
+# How long a submitter waits for its result before computing on its own
+GEMINI_BATCH_RESULT_TIMEOUT = float(os.getenv("GEMINI_BATCH_RESULT_TIMEOUT", "90"))
+
+PENDING_KEY = "diagnosis:batch:pending"
+LEADER_KEY = "diagnosis:batch:leader"
+RESULT_KEY_PREFIX = "diagnosis:batch:result:"
+LEADER_TTL_MS = 120000
+RESULT_TTL = 300
+
+# Atomically take up to N items from the head of the pending list
+_TAKE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+end
+return items
+"""
+
+class MicroBatcher:
+    """
+    Collects concurrently queued diagnoses across worker processes into one
+    Gemini call returning a JSON array, then fans results back out.
+
+    Every submitter pushes its item onto a shared Redis list and waits on its
+    own result key. Whichever submitter grabs the leader lock waits for the
+    batch window (or until GEMINI_BATCH_MAX items are queued), takes up to
+    GEMINI_BATCH_MAX items, makes the call and publishes per-item results.
+    submit() returns None whenever the item could not be batched so the
+    caller falls back to the regular single-prompt path.
+    """
+
+    def __init__(self, enabled: bool = GEMINI_BATCH_ENABLED, window: float = GEMINI_BATCH_WINDOW,
+                 max_items: int = GEMINI_BATCH_MAX):
+        self.enabled = enabled
+        self.window = window
+        self.max_items = max_items
+        self._take = None
+
+    def submit(self, symptoms: str, models_to_try: List[str]) -> Optional[dict]:
+        client = get_redis()
+        if client is None:
+            return None
+        item_id = uuid.uuid4().hex[:12]
+        # Carry the submitter's user/consultation so the leader can attribute tokens
+        context = current_usage_context()
+        item = json.dumps({"id": item_id, "symptoms": symptoms,
+                           "user_id": context.get("user_id"), "consultation_id": context.get("consultation_id")})
+        result_key = RESULT_KEY_PREFIX + item_id
+        try:
+            client.rpush(PENDING_KEY, item)
+            deadline = time.monotonic() + GEMINI_BATCH_RESULT_TIMEOUT
+            while time.monotonic() < deadline:
+                token = uuid.uuid4().hex
+                if client.set(LEADER_KEY, token, nx=True, px=LEADER_TTL_MS):
+                    try:
+                        self._lead(client, models_to_try)
+                    finally:
+                        client.eval("if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0",
+                                    1, LEADER_KEY, token)
+                popped = client.blpop([result_key], timeout=1)
+                if popped is not None:
+                    return self._usable(json.loads(popped[1]))
+        except Exception as e:
+            logger.warning(f"Micro-batch submit failed, falling back to single call: {e}")
+
+        # Not batched in time: withdraw the item if nobody took it yet
+        try:
+            if client.lrem(PENDING_KEY, 1, item) == 0:
+                # A leader already took it; give its result one last chance
+                popped = client.blpop([result_key], timeout=1)
+                if popped is not None:
+                    return self._usable(json.loads(popped[1]))
+        except Exception:
+            pass
+        return None
+
+    @staticmethod
+    def _usable(result: dict) -> Optional[dict]:
+        # Failed batch items are retried on the single-prompt path
+        return result if result.get("status") == "success" else None
+
+    def _lead(self, client, models_to_try: List[str]):
+        window_end = time.monotonic() + self.window
+        while time.monotonic() < window_end and client.llen(PENDING_KEY) < self.max_items:
+            time.sleep(0.02)
+
+        if self._take is None:
+            self._take = client.register_script(_TAKE_SCRIPT)
+        items = [json.loads(raw) for raw in self._take(keys=[PENDING_KEY], args=[self.max_items])]
+        if not items:
+            return
+
+        logger.info(f"Micro-batch leader: sending {len(items)} diagnoses in one Gemini call")
+        missing = {"status": "error", "error": "Missing from batch response"}
+        try:
+            results = self._call(items, models_to_try)
+        except Exception as e:
+            # The items are off the pending list: answer every waiter with an
+            # error so it falls back now instead of at its result timeout
+            logger.error(f"Micro-batch leader failed with {len(items)} items taken: {e}")
+            results = {}
+            missing = {"status": "error", "error": f"Batch leader failed: {e}"}
+        pipe = client.pipeline()
+        for item in items:
+            payload = results.get(item["id"]) or missing
+            pipe.rpush(RESULT_KEY_PREFIX + item["id"], json.dumps(payload))
+            pipe.expire(RESULT_KEY_PREFIX + item["id"], RESULT_TTL)
+        pipe.execute()
+
+    def _call(self, items: List[dict], models_to_try: List[str]) -> dict:
+        from inference import engine
+        from diagnosis_schema import BATCH_RESPONSE_SCHEMA
+        from response_parser import parse_batch
+
+        prompt = build_batch_prompt(items)
+        max_output_tokens = min(8192, GEMINI_BATCH_TOKENS_PER_ITEM * len(items))
+        last_error = None
+        for model_name in models_to_try:
+            try:
+                start_time = time.time()
+                response = engine.generate(model_name, prompt, max_output_tokens=max_output_tokens,
+                                           response_schema=BATCH_RESPONSE_SCHEMA)
+                elapsed = time.time() - start_time
+                logger.info(f"Batched Gemini call ({model_name}, {len(items)} items) completed in {elapsed:.2f}s")
+                # One ledger row per patient with an equal share of the call
+                outcome = "truncated" if finish_reason(response) == "MAX_TOKENS" else "success"
+                observe_gemini(model_name, outcome, elapsed)
+                for item in items:
+                    token_ledger.record(model_name, response, outcome, max_output_tokens, latency=elapsed,
+                                        share=1 / len(items), user_id=item.get("user_id"),
+                                        consultation_id=item.get("consultation_id"), source="batch")
+
+                results = parse_batch(response.text)
+                for entry in results.values():
+                    entry["status"] = "success"
+                return results
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Batched call with {model_name} failed: {e}. Trying next...")
+                continue
+        logger.error(f"Micro-batch failed on all models: {last_error}")
+        return {}
+
+
+# Shared instance used by the Celery worker
+micro_batcher = MicroBatcher()
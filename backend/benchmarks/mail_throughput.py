@@ -0,0 +1,86 @@
+"""
+Bulk email throughput through the pooled mailer.
+
+Sends --messages reminder-sized emails in one batch and prints the batch
+report (messages/sec, SMTP connections opened). By default it starts an
+in-process SMTP sink (requires `pip install aiosmtpd`) with an artificial
+per-message delay to mimic a remote provider; pass --no-sink to send to the
+MAIL_* server from the environment instead (e.g. a mailpit container).
+
+    cd backend
+    python benchmarks/mail_throughput.py --messages 500 --pool-size 1
+    python benchmarks/mail_throughput.py --messages 500 --pool-size 8
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=None, help="MAIL_POOL_SIZE for the run")
+    parser.add_argument("--sink-port", type=int, default=10250)
+    parser.add_argument("--sink-delay", type=float, default=0.02, help="seconds the sink spends per message")
+    parser.add_argument("--no-sink", action="store_true", help="use the configured MAIL_* server")
+    return parser.parse_args()
+
+
+def start_sink(port: int, delay: float):
+    from aiosmtpd.controller import Controller
+
+    class Handler:
+        received = 0
+
+        async def handle_DATA(self, server, session, envelope):
+            await asyncio.sleep(delay)
+            Handler.received += 1
+            return "250 OK"
+
+    controller = Controller(Handler(), hostname="127.0.0.1", port=port)
+    controller.start()
+    return controller, Handler
+
+
+def main():
+    args = parse_args()
+    if args.pool_size is not None:
+        os.environ["MAIL_POOL_SIZE"] = str(args.pool_size)
+    sink = handler = None
+    if not args.no_sink:
+        os.environ.update({
+            "MAIL_SERVER": "127.0.0.1", "MAIL_PORT": str(args.sink_port),
+            "MAIL_STARTTLS": "false", "MAIL_SSL_TLS": "false", "MAIL_USE_CREDENTIALS": "false",
+            "MAIL_FROM": "bench@medifusion.local",
+        })
+        sink, handler = start_sink(args.sink_port, args.sink_delay)
+
+    from mailer import mailer, build_message
+
+    messages = [
+        build_message(f"user{i}@example.com", "Reminder: Time to take Bench", "<p>Bench reminder</p>")
+        for i in range(args.messages)
+    ]
+    try:
+        started = time.perf_counter()
+        report = mailer.send_batch(messages, label="benchmark")
+        elapsed = time.perf_counter() - started
+        print(f"pool size:            {mailer.pool_size}")
+        print(f"sent/failed:          {report.sent}/{report.failed}")
+        print(f"batch time:           {elapsed:.2f}s ({report.per_second:.1f} msg/s)")
+        print(f"SMTP connections:     {report.connections_opened}")
+        if handler is not None:
+            print(f"sink received:        {handler.received}")
+        mailer.close()
+    finally:
+        if sink is not None:
+            sink.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Cold-start time of the API and worker processes.
+
+Each run starts a fresh interpreter and measures, for the API: importing
+main, app startup (lifespan) and the first two requests (GET /health, and a
+login for an unknown user, which touches the DB and bcrypt); for the worker:
+importing worker and running the first reminder tick. Runs against a scratch
+SQLite database whose schema is created beforehand (not timed), as the
+deploy-time `python schema.py` step would. --top lists the slowest imports.
+
+    cd backend
+    python benchmarks/startup_time.py --runs 5 --top 10
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+API_PROBE = """
+import time, json
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    ready = time.perf_counter()
+    client.get("/health")
+    first = time.perf_counter()
+    client.post("/api/login", data={"username": "nobody@example.com", "password": "x"})
+    login = time.perf_counter()
+print(json.dumps({"import": imported - started, "startup": ready - imported,
+                  "first request": first - ready, "first login": login - first}))
+"""
+
+WORKER_PROBE = """
+import time, json
+started = time.perf_counter()
+import worker
+imported = time.perf_counter()
+worker.check_medicine_reminders()
+ticked = time.perf_counter()
+print(json.dumps({"import": imported - started, "first reminder tick": ticked - imported}))
+"""
+
+SCHEMA_SETUP = "from database import engine\nfrom schema import sync_schema\nsync_schema(engine)\n"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="show the N slowest top-level imports of each process")
+    return parser.parse_args()
+
+
+def run_python(code: str, env: dict, *flags) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *flags, "-c", code], cwd=BACKEND_DIR, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def probe(code: str, env: dict) -> dict:
+    output = run_python(code, env).stdout.strip().splitlines()
+    return json.loads(output[-1])
+
+
+def slowest_imports(module: str, env: dict, top: int):
+    """Cumulative -X importtime of modules imported directly by `module`'s import tree roots."""
+    stderr = run_python(f"import {module}", env, "-X", "importtime").stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1:
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def report(name: str, samples: list):
+    print(f"\n{name} ({len(samples)} runs)")
+    total = [sum(s.values()) for s in samples]
+    for phase in samples[0]:
+        values = [s[phase] * 1000 for s in samples]
+        print(f"  {phase:<22} median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms")
+    print(f"  {'total':<22} median {statistics.median(total) * 1000:8.1f} ms   max {max(total) * 1000:8.1f} ms")
+
+
+def main():
+    args = parse_args()
+    db_path = os.path.join(tempfile.mkdtemp(prefix="medifusion-startup-"), "bench.db")
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{db_path}", REDIS_URL="redis://127.0.0.1:1/0",
+               TRACE_FILE="", WORKER_METRICS_ENABLED="false", SCHEMA_SYNC_ON_STARTUP="false")
+    env.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    run_python(SCHEMA_SETUP, env)
+
+    report("API", [probe(API_PROBE, env) for _ in range(args.runs)])
+    report("Worker", [probe(WORKER_PROBE, env) for _ in range(args.runs)])
+
+    if args.top:
+        for module in ("main", "worker"):
+            print(f"\nslowest imports under {module}:")
+            for ms, name in slowest_imports(module, env, args.top):
+                print(f"  {ms:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import os
+
+from kombu import Queue
+
+# Workload queues. Long Gemini calls never sit in front of reminders or mail:
+# each queue gets its own worker pool (see start_worker.py).
+QUEUE_AI = "ai"                # predict_disease: up to 300s, rate-limited external API
+QUEUE_MAIL = "mail"            # transactional email: short, I/O-bound
+QUEUE_REMINDERS = "reminders"  # periodic ticks: check_medicine_reminders (time-critical), reconcile_consultations
+QUEUE_DEFAULT = "celery"       # anything unrouted (Celery's default name, so old messages drain)
+
+TASK_QUEUES = tuple(Queue(name, routing_key=name) for name in (QUEUE_AI, QUEUE_MAIL, QUEUE_REMINDERS, QUEUE_DEFAULT))
+
+# Used by both the API producer (send_task by name) and the worker app
+TASK_ROUTES = {
+    "predict_disease": {"queue": QUEUE_AI, "routing_key": QUEUE_AI},
+    "send_welcome_email": {"queue": QUEUE_MAIL, "routing_key": QUEUE_MAIL},
+    "check_medicine_reminders": {"queue": QUEUE_REMINDERS, "routing_key": QUEUE_REMINDERS},
+    "reconcile_consultations": {"queue": QUEUE_REMINDERS, "routing_key": QUEUE_REMINDERS},
+}
+
+
+def _int_env(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+# Worker profiles: which queues a worker consumes and how it pulls from them.
+# Prefetch 1 on long tasks (with acks_late) stops one process hoarding
+# messages other idle processes could run; short mail tasks prefetch more to
+# hide broker round trips. Reminders run one tick at a time by design.
+WORKER_PROFILES = {
+    "ai": {
+        "queues": [QUEUE_AI],
+        "concurrency": _int_env("CELERY_AI_CONCURRENCY", 4),
+        "prefetch_multiplier": _int_env("CELERY_AI_PREFETCH", 1),
+    },
+    "mail": {
+        "queues": [QUEUE_MAIL],
+        "concurrency": _int_env("CELERY_MAIL_CONCURRENCY", 4),
+        "prefetch_multiplier": _int_env("CELERY_MAIL_PREFETCH", 8),
+    },
+    "reminders": {
+        "queues": [QUEUE_REMINDERS],
+        "concurrency": _int_env("CELERY_REMINDERS_CONCURRENCY", 1),
+        "prefetch_multiplier": _int_env("CELERY_REMINDERS_PREFETCH", 1),
+    },
+    # Single worker for development / small deployments: every queue, no isolation
+    "all": {
+        "queues": [QUEUE_REMINDERS, QUEUE_MAIL, QUEUE_AI, QUEUE_DEFAULT],
+        "concurrency": _int_env("CELERY_ALL_CONCURRENCY", 4),
+        "prefetch_multiplier": _int_env("CELERY_ALL_PREFETCH", 1),
+    },
+}
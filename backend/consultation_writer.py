@@ -0,0 +1,155 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from sqlalchemy import bindparam, update
+
+from models import Consultation, diagnosis_columns
+from metrics import CONSULTATION_WRITE_BATCH_SIZE
+import tracing
+
+logger = logging.getLogger(__name__)
+
+CONSULTATION_WRITE_BEHIND = os.getenv("CONSULTATION_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+# Flush as soon as this many finished diagnoses are buffered...
+CONSULTATION_WRITE_BATCH = int(os.getenv("CONSULTATION_WRITE_BATCH", "50"))
+# ...or once the oldest has waited this long (seconds)
+CONSULTATION_WRITE_DELAY = float(os.getenv("CONSULTATION_WRITE_DELAY", "0.5"))
+# Reconciliation sweep: job rows still pending this long after creation
+# (seconds) are checked against the result backend, up to this many per tick
+CONSULTATION_RECONCILE_AFTER = float(os.getenv("CONSULTATION_RECONCILE_AFTER", "120"))
+CONSULTATION_RECONCILE_BATCH = int(os.getenv("CONSULTATION_RECONCILE_BATCH", "200"))
+# Rows older than this (seconds) are left alone: their results have expired
+# from the backend (result_expires) long before
+CONSULTATION_RECONCILE_WINDOW = float(os.getenv("CONSULTATION_RECONCILE_WINDOW", "21600"))
+
+_consultations = Consultation.__table__
+# Core executemany by primary key: a row deleted meanwhile matches nothing
+# instead of failing the whole batch (as the ORM's bulk UPDATE would)
+_UPDATE = update(_consultations).where(_consultations.c.id == bindparam("consultation_id"))
+
+
+class ConsultationWriter:
+    """
+    Write-behind buffer for finished diagnoses in a worker process.
+
+    submit() only records the result. A background thread writes buffered
+    results as one executemany UPDATE and one commit when CONSULTATION_WRITE_BATCH
+    are waiting or the oldest is CONSULTATION_WRITE_DELAY seconds old, and
+    close() writes whatever is left at process shutdown. A failed flush keeps
+    its rows for the next attempt. Clients are not delayed by the buffer: the
+    API reads the Celery result backend before the consultation row.
+
+    A process killed outright loses what it had buffered (at most
+    CONSULTATION_WRITE_DELAY worth); the reconcile_consultations sweep in the
+    worker writes those rows from the result backend.
+    """
+
+    def __init__(self, session_factory, enabled: bool = CONSULTATION_WRITE_BEHIND,
+                 max_batch: int = CONSULTATION_WRITE_BATCH, max_delay: float = CONSULTATION_WRITE_DELAY):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending: Dict[int, dict] = {}
+        self._oldest: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread_pid: Optional[int] = None
+
+    def submit(self, consultation_id: int, diagnosis_data: dict):
+        if not self.enabled or self._closed:
+            self.write({consultation_id: diagnosis_data})
+            return
+        row = {"consultation_id": consultation_id, **diagnosis_columns(diagnosis_data)}
+        with self._lock:
+            first = not self._pending
+            # A retried task's later result for the same row replaces the earlier one
+            self._pending[consultation_id] = row
+            if first:
+                self._oldest = time.monotonic()
+            due = first or len(self._pending) >= self.max_batch
+        self._ensure_thread()
+        if due:
+            self._wakeup.set()
+
+    def write(self, results: Dict[int, dict]):
+        """Write results now, bypassing the buffer (one executemany UPDATE)."""
+        if results:
+            self._write([{"consultation_id": consultation_id, **diagnosis_columns(diagnosis_data)}
+                         for consultation_id, diagnosis_data in results.items()])
+
+    def flush(self) -> int:
+        """Write everything buffered now; returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending, self._oldest = self._pending, {}, None
+            if not batch:
+                return 0
+            try:
+                self._write(list(batch.values()))
+            except Exception as e:
+                with self._lock:
+                    # Results submitted while this flush ran are newer: keep those
+                    for consultation_id, row in batch.items():
+                        self._pending.setdefault(consultation_id, row)
+                    self._oldest = time.monotonic()
+                logger.error(f"Failed to write {len(batch)} consultation results, will retry: {e}")
+                return 0
+            return len(batch)
+
+    def close(self):
+        """Stop the flush thread and write what is left (worker process shutdown)."""
+        self._closed = True
+        self._wakeup.set()
+        self.flush()
+        with self._lock:
+            lost = sorted(self._pending)
+        if lost:
+            logger.error(f"Consultation results not written at shutdown (still in the result backend): {lost}")
+
+    def _write(self, rows: List[dict]):
+        with tracing.tracer.start_as_current_span("db.update_consultations", attributes={
+            "consultation.count": len(rows),
+            "consultation.ids": [row["consultation_id"] for row in rows],
+        }):
+            db = self.session_factory()
+            try:
+                db.execute(_UPDATE, rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+        CONSULTATION_WRITE_BATCH_SIZE.observe(len(rows))
+        logger.info(f"✓ Wrote {len(rows)} consultation result(s)")
+
+    def _ensure_thread(self):
+        # Threads don't survive fork: one flush thread per pool process
+        if self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._run, name="consultation-writer", daemon=True).start()
+
+    def _run(self):
+        while not self._closed:
+            with self._lock:
+                if not self._pending:
+                    wait = None
+                elif len(self._pending) >= self.max_batch:
+                    wait = 0.0
+                else:
+                    wait = self._oldest + self.max_delay - time.monotonic()
+            if wait is not None and wait <= 0:
+                self.flush()
+                continue
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
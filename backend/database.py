@@ -1,20 +1,85 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
 
+import metrics
+import tracing
+
 load_dotenv()
 
 # Get DATABASE_URL from environment
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://medifusion_user:securepassword123@db:5432/medifusion_db")
 
-# Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+# Connection pool settings (per process; the sync and async engines each get their own pool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))       # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))       # seconds before a connection is replaced
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side cap per statement (Postgres statement_timeout); 0 disables it
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+
+def _async_url(url: str) -> str:
+    """Map the sync DATABASE_URL onto its async driver (asyncpg / aiosqlite)."""
+    scheme, sep, rest = url.partition("://")
+    driver = scheme.split("+")[0]
+    if driver in ("postgresql", "postgres"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    if driver == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    return url
+
+
+def _pool_kwargs(url: str) -> dict:
+    if url.startswith("sqlite"):
+        # SQLite is file-local: no pool sizing, only wait on the file lock
+        return {"connect_args": {"timeout": DB_POOL_TIMEOUT}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def sync_engine_kwargs(url: str) -> dict:
+    """create_engine() arguments for a sync engine: pool settings plus the statement timeout."""
+    kwargs = _pool_kwargs(url)
+    if url.startswith("postgres") and DB_STATEMENT_TIMEOUT_MS:
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return kwargs
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Sync engine: schema sync at startup and scripts (the Celery worker builds
+# its own with the same settings)
+engine = create_engine(DATABASE_URL, **sync_engine_kwargs(DATABASE_URL))
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: every API route, so DB waits overlap instead of blocking the loop
+async_kwargs = _pool_kwargs(ASYNC_DATABASE_URL)
+if ASYNC_DATABASE_URL.startswith("postgresql+asyncpg") and DB_STATEMENT_TIMEOUT_MS:
+    async_kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_kwargs)
+
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and, under asyncio, illegal) lazy refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+# Statement timings for /metrics and per-statement spans (async engines emit
+# events on their sync core)
+for _instrumented, _name in ((engine, "sync"), (async_engine.sync_engine, "async")):
+    metrics.instrument_engine(_instrumented, _name)
+    tracing.instrument_engine(_instrumented, _name)
+
 # Create Base class for models
 Base = declarative_base()
 
@@ -25,3 +90,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Dependency to get an async DB session (API routes)
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
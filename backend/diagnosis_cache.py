@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from redis_client import get_redis
+from metrics import record_cache_lookup
+from prompts import PROMPT_VERSION
+
+logger = logging.getLogger(__name__)
+
+DIAGNOSIS_CACHE_TTL = int(os.getenv("DIAGNOSIS_CACHE_TTL", "86400"))          # Redis tier (seconds)
+DIAGNOSIS_CACHE_LOCAL_TTL = int(os.getenv("DIAGNOSIS_CACHE_LOCAL_TTL", "600"))  # In-process tier (seconds)
+DIAGNOSIS_CACHE_SIZE = int(os.getenv("DIAGNOSIS_CACHE_SIZE", "1024"))         # In-process tier (entries)
+DIAGNOSIS_CACHE_ENABLED = os.getenv("DIAGNOSIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+REDIS_KEY_PREFIX = "diagnosis:cache:"
+
+# Words that carry no symptom meaning and can be dropped from the key
+_STOPWORDS = {"a", "an", "and", "the", "i", "im", "have", "has", "had", "am", "is", "are",
+              "my", "with", "of", "also", "some", "feel", "feeling", "since", "been"}
+# Negations bind to the following token so "no fever" never matches "fever"
+_NEGATIONS = {"no", "not", "without", "denies", "never", "non"}
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def canonicalize_symptoms(text: str) -> str:
+    """
+    Order- and punctuation-insensitive form of a symptom string:
+    "Fever, headache" and "headache fever" both become "fever headache".
+    """
+    tokens = []
+    negate = False
+    for token in _TOKEN_RE.findall((text or "").lower()):
+        if token in _NEGATIONS:
+            negate = True
+            continue
+        if token in _STOPWORDS:
+            continue
+        tokens.append(f"no_{token}" if negate else token)
+        negate = False
+    return " ".join(sorted(set(tokens)))
+
+
+def cache_key(symptoms: str, model_name: str, prompt_version: str = PROMPT_VERSION) -> str:
+    raw = f"{prompt_version}|{model_name}|{canonicalize_symptoms(symptoms)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class DiagnosisCache:
+    """
+    Two-tier cache of successful diagnoses: a bounded in-process LRU with TTL
+    in front of a shared Redis tier. Redis errors degrade to misses.
+    """
+
+    def __init__(self, max_size: int = DIAGNOSIS_CACHE_SIZE, local_ttl: int = DIAGNOSIS_CACHE_LOCAL_TTL,
+                 ttl: int = DIAGNOSIS_CACHE_TTL, enabled: bool = DIAGNOSIS_CACHE_ENABLED):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.ttl = ttl
+        self.enabled = enabled
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _local_get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, key: str, value: dict):
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl, value)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, symptoms: str, model_name: str, record_stats: bool = True) -> Optional[dict]:
+        """Look up a cached diagnosis. record_stats=False for internal polling."""
+        if not self.enabled:
+            return None
+        key = cache_key(symptoms, model_name)
+
+        value = self._local_get(key)
+        if value is not None:
+            if record_stats:
+                with self._lock:
+                    self.hits_local += 1
+                record_cache_lookup("diagnosis", "hit_local")
+            return dict(value)
+
+        client = get_redis()
+        if client is not None:
+            try:
+                raw = client.get(REDIS_KEY_PREFIX + key)
+                if raw is not None:
+                    value = json.loads(raw)
+                    self._local_set(key, value)
+                    if record_stats:
+                        with self._lock:
+                            self.hits_redis += 1
+                        record_cache_lookup("diagnosis", "hit_redis")
+                    return dict(value)
+            except Exception as e:
+                logger.warning(f"Diagnosis cache Redis read failed: {e}")
+
+        if record_stats:
+            with self._lock:
+                self.misses += 1
+            record_cache_lookup("diagnosis", "miss")
+        return None
+
+    def set(self, symptoms: str, model_name: str, diagnosis: dict):
+        """Store a successful diagnosis (error payloads and truncated documents are never cached)."""
+        if not self.enabled or not diagnosis or diagnosis.get("status") != "success" or diagnosis.get("truncated"):
+            return
+        key = cache_key(symptoms, model_name)
+        value = dict(diagnosis)
+        self._local_set(key, value)
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(REDIS_KEY_PREFIX + key, json.dumps(value), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Diagnosis cache Redis write failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.hits_local + self.hits_redis
+            lookups = hits + self.misses
+            return {
+                "hits_local": self.hits_local,
+                "hits_redis": self.hits_redis,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._local),
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+            }
+
+
+# Shared instance used by the API router and the Celery worker
+diagnosis_cache = DiagnosisCache()
@@ -0,0 +1,127 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, field_validator
+
+SEVERITIES = ("high", "medium", "low")
+
+
+def _as_list(value):
+    """Models occasionally answer a list field with a single string."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    return value
+
+
+class Condition(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    name: str
+    confidence: Optional[int] = None
+    severity: Optional[str] = None
+    reasoning: Optional[str] = None
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _confidence(cls, value):
+        if value is None or value == "":
+            return None
+        if isinstance(value, str):
+            value = value.strip().rstrip("%")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        # Some answers use 0-1 probabilities instead of percentages. Only
+        # fractions are rescaled: an integer 1 is 1%, not 100%
+        if 0 < value < 1:
+            value *= 100
+        return int(round(min(max(value, 0), 100)))
+
+    @field_validator("severity", mode="before")
+    @classmethod
+    def _severity(cls, value):
+        value = str(value or "").strip().lower()
+        return value if value in SEVERITIES else None
+
+
+class Diagnosis(BaseModel):
+    """Validated shape of one diagnosis document (see prompts.DIAGNOSIS_SCHEMA_TEXT)."""
+    model_config = ConfigDict(extra="ignore")
+
+    diagnosis: str
+    diagnosis_summary: Optional[str] = None
+    detailed_diagnosis: Optional[str] = None
+    conditions: List[Condition] = []
+    recommended_tests: List[str] = []
+    consult_doctor: Optional[str] = None
+    precautions: List[str] = []
+    prevention: List[str] = []
+    lifestyle_tips: List[str] = []
+    tips: List[str] = []
+
+    @field_validator("conditions", "recommended_tests", "precautions", "prevention", "lifestyle_tips", "tips",
+                     mode="before")
+    @classmethod
+    def _lists(cls, value):
+        return _as_list(value)
+
+    @field_validator("conditions", mode="after")
+    @classmethod
+    def _drop_unnamed(cls, conditions):
+        return [c for c in conditions if c.name.strip()]
+
+
+def _string_list(description: str) -> dict:
+    return {"type": "array", "items": {"type": "string"}, "description": description}
+
+
+# Gemini response_schema (OpenAPI subset) matching Diagnosis. Constrained
+# decoding guarantees field names/types, so parsing only has to cope with
+# truncation.
+DIAGNOSIS_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "diagnosis": {"type": "string", "description": "Name of the most likely condition"},
+        "diagnosis_summary": {"type": "string", "description": "A brief 1-2 sentence summary of the diagnosis"},
+        "detailed_diagnosis": {"type": "string", "description": "A comprehensive explanation of the condition"},
+        "conditions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "confidence": {"type": "integer", "description": "0-100"},
+                    "severity": {"type": "string", "format": "enum", "enum": list(SEVERITIES)},
+                    "reasoning": {"type": "string"},
+                },
+                "required": ["name", "confidence", "severity", "reasoning"],
+            },
+        },
+        "recommended_tests": _string_list("Recommended medical tests"),
+        "consult_doctor": {"type": "string", "description": "Type of specialist to consult"},
+        "precautions": _string_list("Immediate precautions"),
+        "prevention": _string_list("Prevention tips"),
+        "lifestyle_tips": _string_list("Lifestyle changes"),
+        "tips": _string_list("General health tips"),
+    },
+    "required": ["diagnosis", "diagnosis_summary", "conditions", "consult_doctor", "detailed_diagnosis",
+                 "recommended_tests", "precautions", "prevention", "lifestyle_tips", "tips"],
+}
+
+# Micro-batch responses: one tagged diagnosis per patient
+BATCH_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": dict(DIAGNOSIS_RESPONSE_SCHEMA["properties"], id={"type": "string"}),
+        "required": ["id"] + DIAGNOSIS_RESPONSE_SCHEMA["required"],
+    },
+}
+
+
+def supports_response_schema(model_name: str) -> bool:
+    """Gemini 1.0 models reject response_schema; they get the prompt-only contract."""
+    name = model_name.split("/")[-1]
+    return not (name.startswith("gemini-1.0") or name in ("gemini-pro", "gemini-pro-vision"))
@@ -0,0 +1,82 @@
+import os
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+from metrics import GEMINI_HEDGES
+
+# Off by default: a hedged call that loses still runs to completion and is billed
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() in ("1", "true", "yes")
+# Hedge once the primary has been slower than this quantile of its recent successful calls
+GEMINI_HEDGE_QUANTILE = float(os.getenv("GEMINI_HEDGE_QUANTILE", "0.9"))
+GEMINI_HEDGE_WINDOW = int(os.getenv("GEMINI_HEDGE_WINDOW", "200"))          # latencies kept per model
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+# Delay used until a model has GEMINI_HEDGE_MIN_SAMPLES latencies, and the floor under the quantile (seconds)
+GEMINI_HEDGE_DEFAULT_DELAY = float(os.getenv("GEMINI_HEDGE_DEFAULT_DELAY", "10"))
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "2"))
+# Budget: each diagnosis earns GEMINI_HEDGE_RATIO of a hedge, so hedges stay
+# under that fraction of calls (10% by default) with bursts of up to
+# GEMINI_HEDGE_BURST when many calls are slow at once
+GEMINI_HEDGE_RATIO = float(os.getenv("GEMINI_HEDGE_RATIO", "0.1"))
+GEMINI_HEDGE_BURST = float(os.getenv("GEMINI_HEDGE_BURST", "5"))
+
+
+class HedgePolicy:
+    """
+    When to send a backup Gemini request for a slow one, and whether one may
+    be sent at all.
+
+    The delay adapts per model to the GEMINI_HEDGE_QUANTILE of its last
+    GEMINI_HEDGE_WINDOW successful latencies in this process, so only the slow
+    tail is hedged. A token bucket caps hedges at GEMINI_HEDGE_RATIO of
+    diagnoses; on top of that the backup only goes out if the fleet-wide rate
+    limiter has a permit free right away (see InferenceEngine.run_models).
+    """
+
+    def __init__(self, enabled: bool = GEMINI_HEDGE_ENABLED, quantile: float = GEMINI_HEDGE_QUANTILE,
+                 ratio: float = GEMINI_HEDGE_RATIO, burst: float = GEMINI_HEDGE_BURST):
+        self.enabled = enabled
+        self.quantile = quantile
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model_name: str, seconds: float):
+        """Model latency of a successful call, excluding quota waits (hedge winners and losers alike)."""
+        with self._lock:
+            window = self._latencies.get(model_name)
+            if window is None:
+                window = self._latencies[model_name] = deque(maxlen=GEMINI_HEDGE_WINDOW)
+            window.append(seconds)
+
+    def delay(self, model_name: str) -> float:
+        with self._lock:
+            samples = sorted(self._latencies.get(model_name, ()))
+        if len(samples) < GEMINI_HEDGE_MIN_SAMPLES:
+            return GEMINI_HEDGE_DEFAULT_DELAY
+        index = min(len(samples) - 1, math.ceil(self.quantile * len(samples)) - 1)
+        return max(GEMINI_HEDGE_MIN_DELAY, samples[index])
+
+    def start(self, model_name: str):
+        """A hedgeable call began: earn its share of the budget."""
+        GEMINI_HEDGES.labels(model_name, "eligible").inc()
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_hedge(self, model_name: str) -> bool:
+        with self._lock:
+            allowed = self._tokens >= 1
+            if allowed:
+                self._tokens -= 1
+        GEMINI_HEDGES.labels(model_name, "fired" if allowed else "skipped_budget").inc()
+        return allowed
+
+    def record(self, model_name: str, outcome: str):
+        GEMINI_HEDGES.labels(model_name, outcome).inc()
+
+
+# Shared instance used by the inference engine
+hedge_policy = HedgePolicy()
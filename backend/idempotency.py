@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Optional
+
+from redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# How long an in-progress claim blocks retries if the holder dies mid-request
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", "300"))
+
+KEY_PREFIX = "idempotency:"
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+
+def fingerprint(payload: str) -> str:
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _key(scope: str, user_id: int, idempotency_key: str) -> str:
+    return f"{KEY_PREFIX}{scope}:{user_id}:{idempotency_key}"
+
+
+def claim(scope: str, user_id: int, idempotency_key: str, request_fingerprint: str) -> Optional[dict]:
+    """
+    Try to claim an Idempotency-Key. Returns None if this request now owns the
+    key, otherwise the stored record ({"state", "fingerprint", "response"}).
+    Without Redis, idempotency is best-effort and every request proceeds.
+    """
+    client = get_redis()
+    if client is None:
+        return None
+    key = _key(scope, user_id, idempotency_key)
+    record = {"state": IN_PROGRESS, "fingerprint": request_fingerprint}
+    try:
+        if client.set(key, json.dumps(record), nx=True, ex=IDEMPOTENCY_LOCK_TTL):
+            return None
+        raw = client.get(key)
+    except Exception as e:
+        logger.warning(f"Idempotency store unavailable, proceeding without replay: {e}")
+        return None
+    if raw is None:
+        # Claim expired between SET and GET; retry once
+        return claim(scope, user_id, idempotency_key, request_fingerprint)
+    return json.loads(raw)
+
+
+def complete(scope: str, user_id: int, idempotency_key: str, request_fingerprint: str, response: dict):
+    """Store the final response so retries with the same key replay it."""
+    client = get_redis()
+    if client is None:
+        return
+    record = {"state": COMPLETED, "fingerprint": request_fingerprint, "response": response}
+    try:
+        client.set(_key(scope, user_id, idempotency_key), json.dumps(record), ex=IDEMPOTENCY_TTL)
+    except Exception as e:
+        logger.warning(f"Failed to store idempotent response: {e}")
+
+
+def release(scope: str, user_id: int, idempotency_key: str):
+    """Drop an in-progress claim after a failure so the client can retry."""
+    client = get_redis()
+    if client is None:
+        return
+    try:
+        client.delete(_key(scope, user_id, idempotency_key))
+    except Exception as e:
+        logger.warning(f"Failed to release idempotency key: {e}")
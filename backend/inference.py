@@ -0,0 +1,369 @@
+import os
+import time
+import queue
+import logging
+import threading
+import contextvars
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+
+from prompts import build_prompt
+from diagnosis_schema import DIAGNOSIS_RESPONSE_SCHEMA, supports_response_schema
+from response_parser import parse_diagnosis, strip_fences  # noqa: F401 (re-exported)
+from token_budget import plan_budget, escalate
+from token_ledger import token_ledger, finish_reason, usage_counts
+from metrics import observe_gemini
+from tracing import tracer, set_attributes
+from model_catalog import model_catalog
+from hedging import hedge_policy
+from diagnosis_cache import diagnosis_cache, cache_key
+from singleflight import run_coalesced
+from rate_limiter import rate_limiter, estimate_tokens, RateLimitExceeded, GEMINI_RATE_MAX_WAIT
+
+if TYPE_CHECKING:
+    import google.generativeai as genai
+
+logger = logging.getLogger(__name__)
+
+MAX_OUTPUT_TOKENS = 4096
+
+GENERATION_CONFIG = {
+    'temperature': 0.4,
+    'top_p': 0.8,
+    'top_k': 40,
+    'max_output_tokens': MAX_OUTPUT_TOKENS,
+    'response_mime_type': 'application/json'
+}
+
+
+class InferenceError(Exception):
+    """
+    Every model in the trial order failed. retry_after is set (seconds) when
+    the failure was quota exhaustion rather than a model/API error.
+    """
+
+    def __init__(self, message: str, last_error: Optional[Exception] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.last_error = last_error
+        self.retry_after = retry_after
+
+
+class HedgeCancelled(Exception):
+    """The other request of a hedged pair answered first; this one starts no further calls."""
+
+
+class _HedgeRace:
+    """State shared by the two requests of a hedged pair."""
+
+    def __init__(self):
+        self.lock = threading.Lock()  # orders the decision against usage recording
+        self.decided = False
+
+
+class InferenceEngine:
+    """
+    Shared Gemini inference path for the API and the Celery worker.
+
+    genai is configured once per process (and again only if the API key
+    changes), and GenerativeModel instances are kept per model name so the
+    SDK's client/transport is reused instead of rebuilt on every request.
+    The SDK itself (most of a second to import) is loaded on first use, so
+    processes that never call Gemini, or not yet, start without it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured_key: Optional[str] = None
+        self._models: Dict[str, "genai.GenerativeModel"] = {}
+
+    def configure(self):
+        api_key = (os.getenv("GEMINI_API_KEY") or "").strip()
+        if not api_key:
+            raise InferenceError("GEMINI_API_KEY not set")
+        if api_key == self._configured_key:
+            return
+        with self._lock:
+            if api_key != self._configured_key:
+                import google.generativeai as genai
+
+                genai.configure(api_key=api_key)
+                self._models.clear()
+                self._configured_key = api_key
+                logger.info("Gemini API configured for inference engine")
+
+    def get_model(self, model_name: str) -> "genai.GenerativeModel":
+        model = self._models.get(model_name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(model_name)
+                if model is None:
+                    import google.generativeai as genai
+
+                    model = genai.GenerativeModel(model_name)
+                    self._models[model_name] = model
+        return model
+
+    def generate(self, model_name: str, prompt: str, max_output_tokens: int = MAX_OUTPUT_TOKENS,
+                 max_wait: float = GEMINI_RATE_MAX_WAIT, stream: bool = False,
+                 response_schema: Optional[dict] = DIAGNOSIS_RESPONSE_SCHEMA, timing: Optional[dict] = None):
+        """
+        One rate-limited generate_content call on a cached model instance.
+        response_schema constrains decoding to the diagnosis shape on models
+        that support it; the others rely on the schema in the prompt.
+        `timing["queued"]` accumulates the seconds spent waiting for a quota permit.
+        """
+        self.configure()
+        # Queue for a fleet-wide quota permit instead of burning a 429
+        with tracer.start_as_current_span("gemini.rate_limit", attributes={"gemini.model": model_name}):
+            waited = rate_limiter.acquire(model_name, tokens=estimate_tokens(prompt, max_output_tokens),
+                                          max_wait=max_wait)
+        if timing is not None:
+            timing["queued"] = timing.get("queued", 0.0) + waited
+        generation_config = dict(GENERATION_CONFIG, max_output_tokens=max_output_tokens)
+        if response_schema is not None and supports_response_schema(model_name):
+            generation_config['response_schema'] = response_schema
+        # For streams the span covers the time to the first response only
+        with tracer.start_as_current_span("gemini.generate_content", attributes={
+            "gemini.model": model_name,
+            "gemini.max_output_tokens": max_output_tokens,
+            "gemini.stream": stream,
+        }) as span:
+            started = time.time()
+            try:
+                response = self.get_model(model_name).generate_content(prompt, generation_config=generation_config,
+                                                                       stream=stream)
+            except Exception:
+                observe_gemini(model_name, "error", time.time() - started)
+                raise
+            if not stream:
+                span.set_attribute("gemini.finish_reason", finish_reason(response) or "")
+                prompt_tokens, output_tokens, _ = usage_counts(response)
+                span.set_attribute("gemini.prompt_tokens", prompt_tokens)
+                span.set_attribute("gemini.output_tokens", output_tokens)
+            return response
+
+    def run_models(self, symptoms: str, models_to_try: List[str], max_wait: float = GEMINI_RATE_MAX_WAIT) -> dict:
+        """
+        Try each model in order until one returns a valid JSON diagnosis.
+        The prompt detail and output limit are sized to the symptoms
+        (token_budget); an answer cut off by that limit is retried on the same
+        model with the next larger limit before its repaired prefix is used.
+        A model slower than its usual tail latency is hedged with the next one
+        in the order (hedging.HedgePolicy) and the first valid answer wins.
+        """
+        budget = plan_budget(symptoms)
+        prompt = build_prompt(symptoms, budget.detail)
+        last_error = None
+        retry_after = None
+
+        remaining = list(models_to_try)
+        while remaining:
+            model_name = remaining.pop(0)
+            outcomes = self._race(model_name, remaining[0] if remaining else None, prompt, budget, max_wait)
+            for name, outcome in outcomes:
+                if name in remaining:
+                    remaining.remove(name)  # a hedge already tried the backup
+                if isinstance(outcome, InferenceError):
+                    raise outcome
+                if isinstance(outcome, RateLimitExceeded):
+                    last_error = outcome
+                    retry_after = outcome.retry_after if retry_after is None else min(retry_after, outcome.retry_after)
+                    logger.warning(f"{outcome}. Trying next model...")
+                elif isinstance(outcome, Exception):
+                    last_error = outcome
+                    logger.warning(f"Model {name} failed: {str(outcome)}. Trying next...")
+                else:
+                    return outcome
+
+        raise InferenceError(
+            f"All models failed. Last error: {last_error}",
+            last_error=last_error,
+            retry_after=retry_after if isinstance(last_error, RateLimitExceeded) else None
+        )
+
+    def _race(self, primary: str, backup: Optional[str], prompt: str, budget, max_wait: float) -> List[tuple]:
+        """
+        (model, diagnosis or exception) for the primary and, if it was hedged,
+        the backup, in completion order up to the first valid diagnosis.
+
+        The backup is sent once the primary has been slower than
+        hedge_policy.delay(), if the hedge budget allows and a quota permit is
+        free right away. The request that loses is cancelled as far as the
+        SDK allows: its in-flight call runs to completion but starts no further
+        calls and its answer is dropped. Its usage row joins the caller's rows
+        if it finished before the race was decided, and is inserted on its own
+        otherwise (race.lock orders the two). Hedging is off unless
+        GEMINI_HEDGE_ENABLED is set.
+        """
+        if backup is None or not hedge_policy.enabled:
+            return [(primary, self._outcome(primary, prompt, budget, max_wait))]
+
+        results: queue.Queue = queue.Queue()
+        race = _HedgeRace()
+        hedge_policy.start(primary)
+        self._spawn(results, race, primary, prompt, budget, max_wait)
+        delay = hedge_policy.delay(primary)
+        try:
+            return [results.get(timeout=delay)]
+        except queue.Empty:
+            pass
+        if not hedge_policy.try_hedge(primary):
+            return [results.get()]
+
+        logger.info(f"{primary} has not answered in {delay:.1f}s, hedging with {backup}")
+        set_attributes(gemini_hedge_backup=backup, gemini_hedge_delay=delay)
+        # max_wait=0: a hedge never queues for quota
+        self._spawn(results, race, backup, prompt, budget, 0)
+        outcomes = []
+        for _ in range(2):
+            name, outcome = results.get()
+            if name == backup and isinstance(outcome, RateLimitExceeded):
+                hedge_policy.record(primary, "skipped_quota")
+                continue
+            outcomes.append((name, outcome))
+            if not isinstance(outcome, Exception):
+                with race.lock:
+                    race.decided = True
+                winner = "backup_won" if name == backup else "primary_won"
+                hedge_policy.record(primary, winner)
+                set_attributes(gemini_hedge_winner=name)
+                return outcomes
+        if len(outcomes) == 2:
+            hedge_policy.record(primary, "both_failed")
+        return outcomes
+
+    def _spawn(self, results: queue.Queue, race: "_HedgeRace", model_name: str, prompt: str, budget,
+               max_wait: float):
+        # The thread keeps the caller's usage context and trace
+        context = contextvars.copy_context()
+
+        def run():
+            results.put((model_name, context.run(self._outcome, model_name, prompt, budget, max_wait, race)))
+
+        threading.Thread(target=run, name=f"gemini-{model_name}", daemon=True).start()
+
+    def _outcome(self, model_name: str, prompt: str, budget, max_wait: float,
+                 race: Optional["_HedgeRace"] = None):
+        try:
+            return self._attempt(model_name, prompt, budget, max_wait, race)
+        except Exception as e:
+            return e
+
+    def _attempt(self, model_name: str, prompt: str, budget, max_wait: float,
+                 race: Optional["_HedgeRace"] = None) -> dict:
+        """One model: generate (escalating the output limit on truncation), then parse."""
+        model_seconds = 0.0
+        model_budget = budget
+        while True:
+            if race is not None and race.decided:
+                raise HedgeCancelled(model_name)
+            timing = {}
+            start_time = time.time()
+            response = self.generate(model_name, prompt, max_output_tokens=model_budget.max_output_tokens,
+                                     max_wait=max_wait, timing=timing)
+            # Model latency only: time queued for a quota permit is not the model's
+            elapsed = time.time() - start_time - timing.get("queued", 0.0)
+            model_seconds += elapsed
+            logger.info(f"Gemini API call ({model_name}) completed in {elapsed:.2f}s")
+
+            truncated = finish_reason(response) == "MAX_TOKENS"
+            observe_gemini(model_name, "truncated" if truncated else "success", elapsed)
+            outcome = "truncated" if truncated else "success"
+            if race is None:
+                token_ledger.record(model_name, response, outcome, model_budget.max_output_tokens, budget.detail,
+                                    elapsed)
+            else:
+                with race.lock:
+                    # Once the race is decided the caller may already have
+                    # written its collected usage rows: the loser's row is
+                    # inserted on its own instead
+                    token_ledger.record(model_name, response, outcome, model_budget.max_output_tokens,
+                                        budget.detail, elapsed, **({"pending": None} if race.decided else {}))
+            larger = escalate(model_budget) if truncated else None
+            if larger is None:
+                break
+            logger.warning(f"{model_name} hit max_output_tokens={model_budget.max_output_tokens}, "
+                           f"retrying with {larger.max_output_tokens}")
+            model_budget = larger
+
+        diagnosis_data = parse_diagnosis(response.text)
+        diagnosis_data['status'] = 'success'
+        hedge_policy.observe(model_name, model_seconds)
+        return diagnosis_data
+
+    def diagnose(self, symptoms: str, max_wait: float = GEMINI_RATE_MAX_WAIT, allow_batch: bool = False) -> dict:
+        """
+        Full blocking diagnosis: cache lookup, cross-process coalescing, then
+        (optionally micro-batched) generation with model fallback. Successful
+        results are cached. Raises InferenceError if every model failed.
+        """
+        models_to_try = model_catalog.get_models_to_try()
+        primary_model = models_to_try[0]
+
+        # Near-identical symptom strings share one cached answer per primary model
+        cached = diagnosis_cache.get(symptoms, primary_model)
+        if cached is not None:
+            return cached
+
+        def compute():
+            diagnosis_data = None
+            if allow_batch:
+                from batching import micro_batcher
+                diagnosis_data = micro_batcher.submit(symptoms, models_to_try)
+            if diagnosis_data is None:
+                diagnosis_data = self.run_models(symptoms, models_to_try, max_wait=max_wait)
+            diagnosis_cache.set(symptoms, primary_model, diagnosis_data)
+            return diagnosis_data
+
+        # If another process is already asking Gemini, wait for its cached answer
+        return run_coalesced(
+            cache_key(symptoms, primary_model),
+            compute=compute,
+            lookup=lambda: diagnosis_cache.get(symptoms, primary_model, record_stats=False)
+        )
+
+    def stream(self, symptoms: str, models_to_try: List[str], emit: Callable[[str], None]) -> str:
+        """
+        Blocking streamed generation. Calls emit(text) per chunk and returns the
+        model used. Falls back to the next model only if nothing was streamed yet.
+        Output is already on the wire, so a truncated stream cannot be retried
+        with a larger budget (nor hedged); the response parser repairs what arrived.
+        """
+        budget = plan_budget(symptoms)
+        prompt = build_prompt(symptoms, budget.detail)
+        last_error = None
+        for model_name in models_to_try:
+            started = False
+            try:
+                with tracer.start_as_current_span("gemini.stream", attributes={"gemini.model": model_name}) as span:
+                    start_time = time.time()
+                    response = self.generate(model_name, prompt, max_output_tokens=budget.max_output_tokens,
+                                             stream=True)
+                    for chunk in response:
+                        try:
+                            text = chunk.text
+                        except ValueError:
+                            continue  # chunk without text parts (e.g. final finish_reason chunk)
+                        if text:
+                            started = True
+                            emit(text)
+                    # The iterated stream response carries the final usage/finish reason
+                    elapsed = time.time() - start_time
+                    outcome = "truncated" if finish_reason(response) == "MAX_TOKENS" else "success"
+                    span.set_attribute("gemini.outcome", outcome)
+                    observe_gemini(model_name, outcome, elapsed)
+                    token_ledger.record(model_name, response, outcome, budget.max_output_tokens, budget.detail,
+                                        elapsed)
+                return model_name
+            except InferenceError:
+                raise
+            except Exception as e:
+                if started:
+                    # Mid-stream failures surface while iterating, not in generate()
+                    observe_gemini(model_name, "error", time.time() - start_time)
+                    raise
+                last_error = e
+        raise InferenceError(f"All models failed. Last error: {last_error}", last_error=last_error)
+
+
+# Shared instance used by the API router and the Celery worker
+engine = InferenceEngine()
@@ -0,0 +1,220 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from typing import TYPE_CHECKING, List, Optional
+
+from tracing import tracer
+
+if TYPE_CHECKING:
+    import aiosmtplib
+
+logger = logging.getLogger(__name__)
+
+# SMTP settings. For local testing point these at a sink instead of Gmail,
+# e.g. the compose "mailpit" service (MAIL_SERVER=mailpit MAIL_PORT=1025) or
+# `python -m aiosmtpd -n -l localhost:1025`, with MAIL_STARTTLS=false and
+# MAIL_USE_CREDENTIALS=false.
+MAIL_SERVER = os.getenv("MAIL_SERVER", "smtp.gmail.com")
+MAIL_PORT = int(os.getenv("MAIL_PORT", "587"))
+MAIL_STARTTLS = os.getenv("MAIL_STARTTLS", "true").lower() in ("1", "true", "yes")
+MAIL_SSL_TLS = os.getenv("MAIL_SSL_TLS", "false").lower() in ("1", "true", "yes")
+MAIL_USE_CREDENTIALS = os.getenv("MAIL_USE_CREDENTIALS", "true").lower() in ("1", "true", "yes")
+MAIL_VALIDATE_CERTS = os.getenv("MAIL_VALIDATE_CERTS", "true").lower() in ("1", "true", "yes")
+MAIL_USERNAME = os.getenv("MAIL_USERNAME", "your_email@gmail.com")
+MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "your_app_password")
+MAIL_FROM = os.getenv("MAIL_FROM", MAIL_USERNAME)
+
+# Pooling: connections kept open per worker process (also the number of
+# messages in flight at once), messages per connection before it is recycled
+# (providers cap this), and how long an idle connection is trusted before it
+# is reopened instead of risking a server-side idle disconnect.
+MAIL_POOL_SIZE = int(os.getenv("MAIL_POOL_SIZE", "4"))
+MAIL_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("MAIL_MAX_MESSAGES_PER_CONNECTION", "100"))
+MAIL_IDLE_TIMEOUT = float(os.getenv("MAIL_IDLE_TIMEOUT", "60"))
+MAIL_TIMEOUT = float(os.getenv("MAIL_TIMEOUT", "30"))
+
+
+def build_message(recipient: str, subject: str, html: str) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content("This message requires an HTML-capable email client.")
+    message.add_alternative(html, subtype="html")
+    return message
+
+
+@dataclass
+class BatchReport:
+    sent: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+    connections_opened: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def per_second(self) -> float:
+        return self.sent / self.seconds if self.seconds else 0.0
+
+
+class _PooledConnection:
+    def __init__(self):
+        self.smtp: Optional["aiosmtplib.SMTP"] = None
+        self.sent = 0
+        self.last_used = 0.0
+
+    def usable(self) -> bool:
+        return (self.smtp is not None and self.smtp.is_connected
+                and self.sent < MAIL_MAX_MESSAGES_PER_CONNECTION
+                and time.monotonic() - self.last_used < MAIL_IDLE_TIMEOUT)
+
+    async def open(self):
+        import aiosmtplib  # loaded with the first send, not at worker start
+
+        await self.close()
+        smtp = aiosmtplib.SMTP(
+            hostname=MAIL_SERVER,
+            port=MAIL_PORT,
+            use_tls=MAIL_SSL_TLS,
+            start_tls=MAIL_STARTTLS if not MAIL_SSL_TLS else False,
+            validate_certs=MAIL_VALIDATE_CERTS,
+            timeout=MAIL_TIMEOUT,
+        )
+        await smtp.connect()
+        if MAIL_USE_CREDENTIALS:
+            await smtp.login(MAIL_USERNAME, MAIL_PASSWORD)
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    async def close(self):
+        smtp, self.smtp = self.smtp, None
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+
+
+class Mailer:
+    """
+    SMTP delivery with pooled, reused connections.
+
+    Celery tasks are synchronous, and a fresh asyncio.run() per email meant a
+    new event loop and a new TCP/TLS/AUTH handshake per message. Instead each
+    worker process runs one background event loop that owns up to
+    MAIL_POOL_SIZE open SMTP sessions; send_batch() hands messages to it and
+    they go out over the pooled sessions, MAIL_POOL_SIZE at a time.
+    The loop thread is started lazily so it is created after Celery forks.
+    """
+
+    def __init__(self, pool_size: int = MAIL_POOL_SIZE):
+        self.pool_size = max(1, pool_size)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._idle: List[_PooledConnection] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="smtp-pool", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    async def _checkout(self, report: BatchReport) -> _PooledConnection:
+        await self._slots.acquire()
+        connection = self._idle.pop() if self._idle else _PooledConnection()
+        try:
+            if not connection.usable():
+                await connection.open()
+                report.connections_opened += 1
+        except Exception:
+            self._slots.release()
+            raise
+        return connection
+
+    def _checkin(self, connection: _PooledConnection):
+        self._idle.append(connection)
+        self._slots.release()
+
+    async def _deliver(self, message: EmailMessage, report: BatchReport):
+        import aiosmtplib
+
+        try:
+            connection = await self._checkout(report)
+        except Exception as e:
+            report.failed += 1
+            report.errors.append(f"{message['To']}: connect failed: {e}")
+            return
+        try:
+            try:
+                await connection.smtp.send_message(message)
+            except (aiosmtplib.SMTPServerDisconnected, ConnectionError):
+                # Server dropped the pooled session: reconnect once and retry
+                await connection.open()
+                report.connections_opened += 1
+                await connection.smtp.send_message(message)
+            connection.sent += 1
+            connection.last_used = time.monotonic()
+            report.sent += 1
+        except Exception as e:
+            report.failed += 1
+            report.errors.append(f"{message['To']}: {e}")
+            await connection.close()
+        finally:
+            self._checkin(connection)
+
+    async def _send_batch(self, messages: List[EmailMessage]) -> BatchReport:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.pool_size)
+        report = BatchReport()
+        started = time.perf_counter()
+        await asyncio.gather(*(self._deliver(message, report) for message in messages))
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def send_batch(self, messages: List[EmailMessage], label: str = "email") -> BatchReport:
+        """Blocking: deliver messages over the pool and log batch throughput."""
+        if not messages:
+            return BatchReport()
+        loop = self._ensure_loop()
+        with tracer.start_as_current_span("smtp.send_batch", attributes={
+            "mail.label": label, "mail.messages": len(messages), "mail.server": MAIL_SERVER
+        }) as span:
+            report = asyncio.run_coroutine_threadsafe(self._send_batch(messages), loop).result()
+            span.set_attribute("mail.sent", report.sent)
+            span.set_attribute("mail.failed", report.failed)
+            span.set_attribute("mail.connections_opened", report.connections_opened)
+        logger.info(
+            f"Mail batch ({label}): sent {report.sent}/{len(messages)} in {report.seconds:.2f}s "
+            f"({report.per_second:.1f} msg/s, {report.connections_opened} new SMTP connections, "
+            f"pool {self.pool_size} via {MAIL_SERVER}:{MAIL_PORT})"
+        )
+        for error in report.errors[:10]:
+            logger.error(f"Mail delivery failed: {error}")
+        return report
+
+    def send(self, message: EmailMessage, label: str = "email") -> bool:
+        return self.send_batch([message], label=label).sent == 1
+
+    def close(self):
+        """Close pooled connections (e.g. on worker shutdown)."""
+        if self._loop is None:
+            return
+
+        async def close_all():
+            while self._idle:
+                await self._idle.pop().close()
+
+        asyncio.run_coroutine_threadsafe(close_all(), self._loop).result(timeout=MAIL_TIMEOUT)
+
+
+# Shared instance used by the Celery worker
+mailer = Mailer()
@@ -1,14 +1,28 @@
-from fastapi import FastAPI
+import os
+import time
+from typing import Optional
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 import models
-from database import engine
+from database import engine, async_engine
+from schema import sync_schema
+from model_catalog import model_catalog
 from routers import auth, disease, medicines  # Ensure these exist
+import metrics
+import tracing
+import passwords
+from opentelemetry.trace import SpanKind
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Schema sync inspects every table; it runs once per deploy (`python schema.py`,
+# the compose "migrate" service) instead of on every replica start. Enable for
+# a standalone dev server without that step.
+SCHEMA_SYNC_ON_STARTUP = os.getenv("SCHEMA_SYNC_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
 # app definition
 app = FastAPI(title="Medifusion API", version="1.0.0")
 
@@ -21,21 +35,88 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Request latency histogram labelled by route template (not raw path) for /metrics."""
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        metrics.HTTP_REQUEST_SECONDS.labels(
+            request.method, route_template(request) or "unmatched", str(status_code)
+        ).observe(time.perf_counter() - started)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Root span per request (continuing an incoming traceparent, if any). The
+    trace id is returned in X-Trace-Id so a slow consultation can be looked up.
+    """
+    parent = tracing.extract_context(dict(request.headers))
+    with tracing.tracer.start_as_current_span(
+        f"{request.method} {request.url.path}", context=parent, kind=SpanKind.SERVER,
+        attributes={"http.method": request.method, "http.target": request.url.path}
+    ) as span:
+        response = await call_next(request)
+        template = route_template(request)
+        if template is not None:
+            span.update_name(f"{request.method} {template}")
+            span.set_attribute("http.route", template)
+        span.set_attribute("http.status_code", response.status_code)
+        trace_id = tracing.current_trace_id()
+        if trace_id:
+            response.headers["X-Trace-Id"] = trace_id
+        return response
+
+# Full path template of every route, keyed by route object, for metric labels
+# and span names. Recent FastAPI versions put the router's own route (path
+# without the include prefix) in scope["route"], so "/api/disease/history"
+# would otherwise be labelled "/history" (and collide with same-named routes
+# on other routers).
+_route_templates = {}
+
+def include_router(router, prefix: str, **kwargs):
+    app.include_router(router, prefix=prefix, **kwargs)
+    for route in router.routes:
+        if hasattr(route, "path"):
+            _route_templates[id(route)] = prefix + route.path
+
+def route_template(request: Request) -> Optional[str]:
+    route = request.scope.get("route")
+    if route is None:
+        return None
+    return _route_templates.get(id(route)) or getattr(route, "path", None)
+
 # Include Routers - NO PREFIX for Auth
-app.include_router(auth.router, prefix="/api", tags=["Authentication"])
-app.include_router(disease.router, prefix="/api/disease", tags=["Disease"])
-app.include_router(medicines.router, prefix="/api", tags=["Medicines"])
+include_router(auth.router, prefix="/api", tags=["Authentication"])
+include_router(disease.router, prefix="/api/disease", tags=["Disease"])
+include_router(medicines.router, prefix="/api", tags=["Medicines"])
 
 @app.on_event("startup")
 async def startup_event():
-    """Create database tables on application startup."""
-    try:
-        logger.info("Creating database tables...")
-        models.Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created successfully.")
-    except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
-        raise
+    """Start background services; optionally sync the schema (SCHEMA_SYNC_ON_STARTUP)."""
+    tracing.setup_tracing("medifusion-api")
+    if SCHEMA_SYNC_ON_STARTUP:
+        try:
+            logger.info("Creating database tables...")
+            sync_schema(engine)
+            logger.info("Database tables created successfully.")
+        except Exception as e:
+            logger.error(f"Error creating database tables: {e}")
+            raise
+
+    # Warm the Gemini model catalog so /predict never waits on list_models()
+    model_catalog.start_background_refresh()
+    passwords.prewarm()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled async DB connections and flush pending spans."""
+    await async_engine.dispose()
+    tracing.shutdown_tracing()
 
 @app.get("/")
 def read_root():
@@ -43,4 +124,9 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
@@ -0,0 +1,120 @@
+import os
+import time
+import logging
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, start_http_server,
+)
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Set for processes that fork (Celery prefork pool, uvicorn --workers N): each
+# process writes its samples there and the exporter aggregates the directory.
+# Must be set before this module is imported, and emptied on deploy.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+# Port of the Celery worker's exporter (the API serves /metrics itself)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))
+
+# Bucket layouts (seconds): fast paths (HTTP, DB) and slow ones (Gemini, tasks)
+_FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_SLOW_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 6, 8, 12, 16, 24, 32, 60, 120, 300)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "medifusion_http_request_seconds", "API request latency by route template",
+    ["method", "route", "status"], buckets=_FAST_BUCKETS + (30, 60),
+)
+DB_QUERY_SECONDS = Histogram(
+    "medifusion_db_query_seconds", "SQL statement execution time",
+    ["engine", "statement"], buckets=_FAST_BUCKETS,
+)
+GEMINI_CALL_SECONDS = Histogram(
+    "medifusion_gemini_call_seconds", "Gemini generate_content latency by model and outcome",
+    ["model", "outcome"], buckets=_SLOW_BUCKETS,
+)
+CELERY_TASK_SECONDS = Histogram(
+    "medifusion_celery_task_seconds", "Celery task runtime",
+    ["task", "state"], buckets=_SLOW_BUCKETS,
+)
+CELERY_QUEUE_WAIT_SECONDS = Histogram(
+    "medifusion_celery_queue_wait_seconds", "Time from publish (or ETA) until a worker starts the task",
+    ["task"], buckets=_FAST_BUCKETS + (30, 60, 120, 300),
+)
+REMINDER_BATCH_SIZE = Histogram(
+    "medifusion_reminder_batch_size", "Due medicines claimed per reminder tick chunk",
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+CONSULTATION_WRITE_BATCH_SIZE = Histogram(
+    "medifusion_consultation_write_batch_size", "Finished diagnoses written per write-behind flush",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+)
+# Hedge rate = fired / eligible; outcomes: eligible, fired, skipped_budget,
+# skipped_quota, primary_won, backup_won, both_failed
+GEMINI_HEDGES = Counter(
+    "medifusion_gemini_hedges", "Hedged Gemini diagnoses by primary model and outcome", ["model", "outcome"],
+)
+CACHE_LOOKUPS = Counter(
+    "medifusion_cache_lookups", "Cache lookups by cache and result (hit_local, hit_redis, miss)",
+    ["cache", "result"],
+)
+
+# SQL verbs reported as-is; anything else is "other" to bound label cardinality
+_STATEMENT_VERBS = {"select", "insert", "update", "delete", "begin", "commit", "rollback"}
+
+
+def stamp_publish_time(headers=None, **kwargs):
+    """before_task_publish handler: lets the worker measure queue wait."""
+    if headers is not None:
+        headers["enqueued_at"] = time.time()
+
+
+def record_cache_lookup(cache: str, result: str):
+    CACHE_LOOKUPS.labels(cache, result).inc()
+
+
+def observe_gemini(model_name: str, outcome: str, seconds: float):
+    GEMINI_CALL_SECONDS.labels(model_name, outcome).observe(seconds)
+
+
+def instrument_engine(engine, name: str):
+    """Time every statement run on a (sync) SQLAlchemy engine; pass async_engine.sync_engine for async."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["metrics_query_start"].pop()
+        verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+        DB_QUERY_SECONDS.labels(name, verb if verb in _STATEMENT_VERBS else "other").observe(
+            time.perf_counter() - started
+        )
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(context):
+        # after_cursor_execute never runs for a failed statement
+        stack = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+        if stack:
+            stack.pop()
+
+
+def _registry():
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render() -> tuple:
+    """(body, content type) for a /metrics response."""
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_exporter(port: int = WORKER_METRICS_PORT):
+    """Serve /metrics on its own port (Celery worker main process)."""
+    start_http_server(port, registry=_registry())
+    logger.info(f"Prometheus exporter listening on :{port}"
+                + (f" (multiprocess dir {PROMETHEUS_MULTIPROC_DIR})" if PROMETHEUS_MULTIPROC_DIR else ""))
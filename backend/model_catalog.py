@@ -0,0 +1,136 @@
+import os
+import time
+import logging
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# How long a discovered model list is considered fresh, and how long to wait
+# before retrying discovery after a failed list_models() call.
+MODEL_CATALOG_TTL = float(os.getenv("GEMINI_MODEL_CATALOG_TTL", "3600"))
+MODEL_CATALOG_RETRY = float(os.getenv("GEMINI_MODEL_CATALOG_RETRY", "60"))
+
+# Preference order used to rank discovered models (substring matches)
+PREFERRED_FAMILIES = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.0", "gemini-pro"]
+
+
+class ModelCatalog:
+    """
+    Process-wide cache of Gemini models that support generateContent.
+
+    list_models() is a network round trip that also counts against the RPM
+    quota, so it must never run on the request path. Lookups always return
+    immediately:
+      - fresh cache: return it
+      - stale cache: return it and refresh in the background
+      - refresh fails: keep serving the last good list (stale-while-error)
+      - nothing discovered yet: return the static fallback order
+    """
+
+    def __init__(self, ttl: float = MODEL_CATALOG_TTL, retry_after: float = MODEL_CATALOG_RETRY):
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self._models: Optional[List[str]] = None
+        self._fetched_at = 0.0
+        self._next_attempt = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refresher: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _env_model() -> str:
+        return os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
+
+    def fallback_models(self) -> List[str]:
+        """Static trial order used before the first successful discovery."""
+        return _dedupe([self._env_model(), "gemini-1.5-flash", "gemini-pro"])
+
+    def _rank(self, available: List[str]) -> List[str]:
+        env_model_name = self._env_model()
+        models_to_try = []
+        if any(env_model_name in m for m in available):
+            models_to_try.append(env_model_name)
+        for family in PREFERRED_FAMILIES:
+            models_to_try.extend(m for m in available if family in m)
+        models_to_try.extend(available)
+        return _dedupe(models_to_try)
+
+    def _fetch(self) -> List[str]:
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY not set")
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key.strip())
+        return [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
+
+    def refresh(self) -> bool:
+        """Run discovery now (blocking). Returns True if the cache was updated."""
+        try:
+            available = self._fetch()
+            if not available:
+                raise RuntimeError("list_models() returned no generateContent models")
+            ranked = self._rank(available)
+            with self._lock:
+                self._models = ranked
+                self._fetched_at = time.monotonic()
+                self._next_attempt = self._fetched_at + self.ttl
+            logger.info(f"Gemini model catalog refreshed ({len(ranked)} models, primary={ranked[0]})")
+            return True
+        except Exception as e:
+            with self._lock:
+                self._next_attempt = time.monotonic() + self.retry_after
+            if self._models:
+                logger.warning(f"Model catalog refresh failed, serving stale list: {e}")
+            else:
+                logger.warning(f"Model catalog refresh failed, using fallback order: {e}")
+            return False
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _refresh_async(self):
+        with self._lock:
+            if self._refreshing or time.monotonic() < self._next_attempt:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="gemini-model-catalog", daemon=True).start()
+
+    def get_models_to_try(self) -> List[str]:
+        """Return the model trial order without blocking on the network."""
+        with self._lock:
+            models = self._models
+            stale = time.monotonic() - self._fetched_at > self.ttl
+        if models is None or stale:
+            self._refresh_async()
+        if models is None:
+            return self.fallback_models()
+        return list(models)
+
+    def start_background_refresh(self):
+        """Keep the catalog warm with a periodic daemon thread (idempotent)."""
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name="gemini-model-catalog-loop", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            with self._lock:
+                self._refreshing = True
+            ok = self.refresh()
+            time.sleep(self.ttl if ok else self.retry_after)
+
+
+def _dedupe(items: List[str]) -> List[str]:
+    seen = []
+    for item in items:
+        if item and item not in seen:
+            seen.append(item)
+    return seen
+
+
+# Shared instance used by the API router and the Celery worker
+model_catalog = ModelCatalog()
@@ -1,6 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from typing import Optional
 import datetime
 from database import Base
 
@@ -15,6 +17,7 @@ class User(Base):
     height = Column(String, nullable=True) # e.g. "180 cm"
     weight = Column(String, nullable=True) # e.g. "75 kg"
     blood_type = Column(String, nullable=True)
+    timezone = Column(String, nullable=True, default="UTC") # IANA name, e.g. "Europe/Berlin"; reminders fire in local time
     role = Column(String, default="patient") # "patient" or "doctor"
     hospital_name = Column(String, nullable=True) # For doctors
     certifications = Column(String, nullable=True) # For doctors
@@ -27,6 +30,10 @@ class User(Base):
 
 class Medicine(Base):
     __tablename__ = "medicines"
+    __table_args__ = (
+        # Reminder tick: WHERE is_active = 1 AND next_reminder_at <= now ORDER BY next_reminder_at
+        Index("ix_medicines_active_next_reminder", "is_active", "next_reminder_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -35,18 +42,98 @@ class Medicine(Base):
     frequency = Column(String)   # e.g., "Daily"
     reminder_time = Column(String)  # HH:MM format (24hr), e.g. "09:00"
     is_active = Column(Integer, default=1) # 1=Active, 0=Inactive (Using Integer for simplicity or Boolean if supported)
+    # Next UTC fire time expanded from reminder_time/frequency/user time zone by
+    # reminder_schedule; NULL = nothing scheduled (inactive, "As Needed")
+    next_reminder_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     owner = relationship("User", back_populates="medicines")
 
+# Consultation.status lifecycle (replaces the old 'Pending' / 'Processing...' sentinels)
+STATUS_PENDING = "pending"        # queued for a worker
+STATUS_PROCESSING = "processing"  # inference running in the API process
+STATUS_SUCCESS = "success"
+STATUS_ERROR = "error"
+IN_PROGRESS_STATUSES = (STATUS_PENDING, STATUS_PROCESSING)
+
+SEVERITY_RANK = {"low": 1, "medium": 2, "high": 3}
+
+# Native JSONB on Postgres (indexable, queryable), JSON text elsewhere (SQLite)
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
+def max_severity(conditions) -> Optional[str]:
+    """Highest severity label across a diagnosis' conditions."""
+    best = None
+    for condition in conditions if isinstance(conditions, list) else []:
+        severity = str(condition.get("severity", "")).lower() if isinstance(condition, dict) else ""
+        if severity in SEVERITY_RANK and (best is None or SEVERITY_RANK[severity] > SEVERITY_RANK[best]):
+            best = severity
+    return best
+
+def diagnosis_columns(diagnosis_data: dict) -> dict:
+    """Column values for a finished diagnosis: the document and its indexed summary."""
+    if diagnosis_data.get("status") == STATUS_ERROR:
+        return {"status": STATUS_ERROR, "diagnosis": diagnosis_data,
+                "top_diagnosis": None, "max_severity": None, "specialist": None}
+    return {
+        "status": STATUS_SUCCESS,
+        "diagnosis": diagnosis_data,
+        "top_diagnosis": diagnosis_data.get("diagnosis"),
+        "max_severity": max_severity(diagnosis_data.get("conditions")),
+        "specialist": diagnosis_data.get("consult_doctor"),
+    }
+
 class Consultation(Base):
     __tablename__ = "consultations"
+    __table_args__ = (
+        # Keyset pagination of a user's history: WHERE user_id = ? ORDER BY created_at DESC, id DESC
+        Index("ix_consultations_user_created_id", "user_id", "created_at", "id"),
+        # Containment queries on the document (diagnosis @> '{...}') on Postgres
+        Index("ix_consultations_diagnosis_gin", "diagnosis", postgresql_using="gin"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     symptoms = Column(String)
-    diagnosis = Column(String, default="Pending")
+    status = Column(String, default=STATUS_PENDING, index=True)
+    diagnosis = Column(JSONDocument, nullable=True) # Full diagnosis document (NULL until finished)
+    # Denormalized from the document by set_diagnosis() so filters/aggregates run in SQL
+    top_diagnosis = Column(String, nullable=True, index=True)
+    max_severity = Column(String, nullable=True, index=True) # "high" | "medium" | "low"
+    specialist = Column(String, nullable=True, index=True)
+    # Celery task id of a /predict/jobs diagnosis: /result/{task_id} resolves it
+    # to this row, and so to its owner
+    task_id = Column(String, nullable=True, unique=True, index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     
     # Relationship to user
     owner = relationship("User", back_populates="consultations")
+
+    def set_diagnosis(self, diagnosis_data: dict):
+        """Store a diagnosis document together with its indexed summary columns."""
+        for column, value in diagnosis_columns(diagnosis_data).items():
+            setattr(self, column, value)
+
+class TokenUsage(Base):
+    """One Gemini call: who it was for, which model, and what it cost (see token_ledger)."""
+    __tablename__ = "token_usage"
+    __table_args__ = (
+        # Per-user / per-model usage over a time window
+        Index("ix_token_usage_user_created", "user_id", "created_at"),
+        Index("ix_token_usage_model_created", "model", "created_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True) # NULL when not attributable
+    consultation_id = Column(Integer, nullable=True)
+    model = Column(String)
+    source = Column(String) # "api", "stream", "worker", "batch"
+    prompt_detail = Column(String, nullable=True) # token_budget detail level the prompt was built with
+    prompt_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    max_output_tokens = Column(Integer, nullable=True)
+    finish_reason = Column(String, nullable=True) # e.g. "STOP", "MAX_TOKENS"
+    outcome = Column(String) # "success" or "truncated" (hit max_output_tokens)
+    latency_ms = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
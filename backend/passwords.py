@@ -0,0 +1,77 @@
+import os
+import logging
+import threading
+from typing import Optional, Tuple
+
+import anyio
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+# bcrypt work factor. Stored hashes with any other cost are rehashed on the
+# user's next successful login, so this can be raised (or lowered) freely.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so hashes run truly in parallel on worker threads.
+# Cap them at roughly the core count: more only adds queueing inside bcrypt,
+# and a login burst must not exhaust the threadpool sync dependencies run on.
+PASSWORD_HASH_MAX_CONCURRENCY = int(os.getenv("PASSWORD_HASH_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+_hash_limiter = anyio.CapacityLimiter(PASSWORD_HASH_MAX_CONCURRENCY)
+
+# Verified against when the account does not exist, so unknown emails cost
+# the same bcrypt time as wrong passwords. Computed on first use: a full-cost
+# bcrypt hash at import time would add a few hundred ms to every cold start.
+_dummy_hash: Optional[str] = None
+
+
+def _get_dummy_hash() -> str:
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = pwd_context.hash("medifusion-dummy-password")
+    return _dummy_hash
+
+
+def prewarm():
+    """Compute the dummy hash on a background thread once the app is up."""
+    threading.Thread(target=_get_dummy_hash, name="bcrypt-prewarm", daemon=True).start()
+
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+
+async def hash_password_async(password: str) -> str:
+    """bcrypt hash on the bounded hashing pool (never on the event loop)."""
+    return await anyio.to_thread.run_sync(pwd_context.hash, password, limiter=_hash_limiter)
+
+
+async def verify_password_async(plain_password: str, hashed_password: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """
+    Verify on the bounded hashing pool. Returns (ok, new_hash); new_hash is set
+    when the stored hash used a different cost and should be replaced.
+    """
+    if not hashed_password:
+        await anyio.to_thread.run_sync(
+            lambda: pwd_context.verify(plain_password, _get_dummy_hash()), limiter=_hash_limiter
+        )
+        return False, None
+    try:
+        return await anyio.to_thread.run_sync(
+            pwd_context.verify_and_update, plain_password, hashed_password, limiter=_hash_limiter
+        )
+    except ValueError as e:
+        # Malformed / unknown hash format stored for this user
+        logger.warning(f"Password hash could not be verified: {e}")
+        return False, None
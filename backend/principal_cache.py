@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from redis_client import get_redis
+from metrics import record_cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# The in-process tier has no cross-process invalidation, so keep it short:
+# after PUT /api/me other API processes may serve the old profile for at most
+# this long. The Redis tier is invalidated explicitly on every account change.
+PRINCIPAL_CACHE_LOCAL_TTL = float(os.getenv("PRINCIPAL_CACHE_LOCAL_TTL", "5"))  # seconds
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "300"))               # Redis tier (seconds)
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))            # In-process tier (entries)
+PRINCIPAL_CACHE_ENABLED = os.getenv("PRINCIPAL_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+REDIS_KEY_PREFIX = "auth:principal:"
+
+# Columns snapshotted for the authenticated principal. hashed_password is
+# deliberately left out so credentials never land in Redis.
+PRINCIPAL_FIELDS = ("id", "email", "full_name", "age", "height", "weight", "blood_type",
+                    "timezone", "role", "hospital_name", "certifications")
+
+
+class PrincipalCache:
+    """
+    Token subject -> user columns, so get_current_user can skip the users
+    SELECT. Short-TTL in-process LRU in front of Redis; Redis errors degrade
+    to misses (i.e. a normal DB lookup).
+    """
+
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, local_ttl: float = PRINCIPAL_CACHE_LOCAL_TTL,
+                 ttl: int = PRINCIPAL_CACHE_TTL, enabled: bool = PRINCIPAL_CACHE_ENABLED):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.ttl = ttl
+        self.enabled = enabled
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_local = 0
+        self.hits_redis = 0
+        self.misses = 0
+
+    def _local_get(self, subject: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._local.get(subject)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._local[subject]
+                return None
+            self._local.move_to_end(subject)
+            return value
+
+    def _local_set(self, subject: str, value: dict):
+        with self._lock:
+            self._local[subject] = (time.monotonic() + self.local_ttl, value)
+            self._local.move_to_end(subject)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def get(self, subject: str) -> Optional[dict]:
+        if not self.enabled or not subject:
+            return None
+        value = self._local_get(subject)
+        if value is not None:
+            with self._lock:
+                self.hits_local += 1
+            record_cache_lookup("principal", "hit_local")
+            return dict(value)
+
+        client = get_redis()
+        if client is not None:
+            try:
+                raw = client.get(REDIS_KEY_PREFIX + subject)
+                if raw is not None:
+                    value = json.loads(raw)
+                    self._local_set(subject, value)
+                    with self._lock:
+                        self.hits_redis += 1
+                    record_cache_lookup("principal", "hit_redis")
+                    return dict(value)
+            except Exception as e:
+                logger.warning(f"Principal cache Redis read failed: {e}")
+
+        with self._lock:
+            self.misses += 1
+        record_cache_lookup("principal", "miss")
+        return None
+
+    def set(self, subject: str, user) -> dict:
+        """Snapshot a User row under its token subject and return the snapshot."""
+        value = {field: getattr(user, field) for field in PRINCIPAL_FIELDS}
+        if not self.enabled or not subject:
+            return value
+        self._local_set(subject, value)
+        client = get_redis()
+        if client is not None:
+            try:
+                client.set(REDIS_KEY_PREFIX + subject, json.dumps(value), ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"Principal cache Redis write failed: {e}")
+        return value
+
+    def invalidate(self, subject: str):
+        """Drop a subject after its account row changed."""
+        if not subject:
+            return
+        with self._lock:
+            self._local.pop(subject, None)
+        client = get_redis()
+        if client is not None:
+            try:
+                client.delete(REDIS_KEY_PREFIX + subject)
+            except Exception as e:
+                logger.warning(f"Principal cache Redis invalidation failed: {e}")
+
+    def clear(self):
+        """Drop every cached principal (e.g. after the users table was reset)."""
+        with self._lock:
+            self._local.clear()
+        client = get_redis()
+        if client is not None:
+            try:
+                for key in client.scan_iter(match=REDIS_KEY_PREFIX + "*", count=500):
+                    client.delete(key)
+            except Exception as e:
+                logger.warning(f"Principal cache Redis clear failed: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.hits_local + self.hits_redis
+            lookups = hits + self.misses
+            return {
+                "hits_local": self.hits_local,
+                "hits_redis": self.hits_redis,
+                "misses": self.misses,
+                "size": len(self._local),
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+            }
+
+
+# Shared instance used by the auth dependency
+principal_cache = PrincipalCache()
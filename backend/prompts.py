@@ -0,0 +1,63 @@
+from typing import List
+
+# Bump whenever the diagnosis prompt or output schema changes so cached
+# answers produced by the old prompt are never served for the new one.
+PROMPT_VERSION = "v3"
+
+DIAGNOSIS_SCHEMA_TEXT = """{
+  "diagnosis": "Name of the most likely condition",
+  "diagnosis_summary": "A brief 1-2 sentence summary of the diagnosis",
+  "detailed_diagnosis": "A comprehensive explanation of the condition",
+  "conditions": [
+    {
+      "name": "Condition Name",
+      "confidence": 85,
+      "severity": "high" | "medium" | "low",
+      "reasoning": "Why this matches"
+    }
+  ],
+  "recommended_tests": ["List of recommended medical tests"],
+  "consult_doctor": "Type of specialist to consult (e.g. Cardiologist)",
+  "precautions": ["List of immediate precautions"],
+  "prevention": ["List of prevention tips"],
+  "lifestyle_tips": ["List of lifestyle changes"],
+  "tips": ["General health tips"]
+}"""
+
+
+# Length guidance per token_budget detail level, so the answer fits the
+# output limit it is given instead of being cut off
+DETAIL_GUIDANCE = {
+    "brief": "Be concise: list at most 3 conditions, at most 3 items per list, "
+             "and keep detailed_diagnosis under 80 words.",
+    "standard": "List at most 4 conditions, at most 5 items per list, "
+                "and keep detailed_diagnosis under 200 words.",
+    "detailed": "",
+}
+
+
+def build_prompt(symptoms: str, detail: str = "detailed") -> str:
+    """Single-patient diagnosis prompt requesting one JSON object."""
+    guidance = DETAIL_GUIDANCE.get(detail, "")
+    return f"""You are a medical AI assistant. Analyze the following symptoms and provide a diagnosis in structured JSON format.
+
+Symptoms: {symptoms}
+
+Output MUST be a valid JSON object with the following structure:
+{DIAGNOSIS_SCHEMA_TEXT}
+{guidance}
+Ensure the response is purely valid JSON without markdown formatting."""
+
+
+def build_batch_prompt(items: List[dict]) -> str:
+    """Multi-patient prompt requesting a JSON array tagged with each item's id."""
+    patients = "\n".join(f'- id "{item["id"]}": {item["symptoms"]}' for item in items)
+    return f"""You are a medical AI assistant. Analyze each of the following patients independently and provide a diagnosis for each in structured JSON format.
+
+Patients:
+{patients}
+
+Output MUST be a valid JSON array with exactly one object per patient. Each object must contain the patient's "id" plus the following structure:
+{DIAGNOSIS_SCHEMA_TEXT}
+
+Ensure the response is purely valid JSON without markdown formatting."""
@@ -0,0 +1,187 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Tuple
+
+from redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Per-model budgets, e.g. GEMINI_RPM_LIMITS="gemini-1.5-flash=15,gemini-1.5-pro=2".
+# Model names are matched by substring so "models/gemini-1.5-flash-002" uses
+# the "gemini-1.5-flash" budget; unknown models get the defaults.
+GEMINI_DEFAULT_RPM = int(os.getenv("GEMINI_DEFAULT_RPM", "15"))
+GEMINI_DEFAULT_TPM = int(os.getenv("GEMINI_DEFAULT_TPM", "1000000"))
+# How long a caller may queue for a permit before giving up
+GEMINI_RATE_MAX_WAIT = float(os.getenv("GEMINI_RATE_MAX_WAIT", "30"))
+
+KEY_PREFIX = "gemini:ratelimit:"
+
+# Reservation-based token bucket over two buckets (requests, tokens).
+# Each call refills both buckets from elapsed time, then reserves its cost even
+# if that drives a bucket negative; the caller sleeps for the returned wait.
+# Because reservations are granted in arrival order, waiters are served FIFO
+# rather than racing each other on retry. If the wait would exceed max_wait
+# nothing is reserved and -wait is returned.
+#
+# KEYS[1] = request bucket, KEYS[2] = token bucket
+# ARGV = rpm, tpm, tokens, max_wait_ms
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local max_wait = tonumber(ARGV[4])
+
+local function refill(key, capacity)
+    local rate = capacity / 60000.0
+    local state = redis.call('HMGET', key, 'level', 'ts')
+    local level = tonumber(state[1])
+    local ts = tonumber(state[2])
+    if level == nil then
+        level = capacity
+        ts = now
+    end
+    level = math.min(capacity, level + (now - ts) * rate)
+    return level, rate
+end
+
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+
+local req_level, req_rate = refill(KEYS[1], rpm)
+local tok_level, tok_rate = refill(KEYS[2], tpm)
+req_level = req_level - 1
+tok_level = tok_level - cost
+
+local wait = 0
+if req_level < 0 then wait = math.max(wait, -req_level / req_rate) end
+if tok_level < 0 then wait = math.max(wait, -tok_level / tok_rate) end
+wait = math.ceil(wait)
+
+if wait > max_wait then
+    return -wait
+end
+
+redis.call('HSET', KEYS[1], 'level', req_level, 'ts', now)
+redis.call('HSET', KEYS[2], 'level', tok_level, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000 + wait)
+redis.call('PEXPIRE', KEYS[2], 120000 + wait)
+return wait
+"""
+
+
+class RateLimitExceeded(Exception):
+    """No permit could be reserved within max_wait; retry_after is in seconds."""
+
+    def __init__(self, model_name: str, retry_after: float):
+        super().__init__(f"Gemini rate budget for {model_name} exhausted (retry after {retry_after:.1f}s)")
+        self.model_name = model_name
+        self.retry_after = retry_after
+
+
+def _parse_limits(raw: str) -> Dict[str, int]:
+    limits = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class GeminiRateLimiter:
+    """
+    Cluster-wide Gemini quota scheduler shared by API processes and Celery
+    workers through Redis. Falls back to a per-process bucket (with a warning)
+    when Redis is unreachable so calls are still paced.
+    """
+
+    def __init__(self):
+        self.rpm_limits = _parse_limits(os.getenv("GEMINI_RPM_LIMITS", "gemini-1.5-flash=15,gemini-1.5-pro=2"))
+        self.tpm_limits = _parse_limits(os.getenv("GEMINI_TPM_LIMITS", "gemini-1.5-flash=1000000,gemini-1.5-pro=32000"))
+        self._local: Dict[str, Tuple[float, float]] = {}
+        self._local_lock = threading.Lock()
+        self._script = None
+
+    @staticmethod
+    def _family(model_name: str) -> str:
+        return model_name.split("/")[-1]
+
+    def _budget(self, limits: Dict[str, int], model_name: str, default: int) -> int:
+        name = self._family(model_name)
+        # Longest matching family wins ("gemini-1.5-flash-8b" over "gemini-1.5-flash")
+        for family in sorted(limits, key=len, reverse=True):
+            if family in name:
+                return limits[family]
+        return default
+
+    def budgets(self, model_name: str) -> Tuple[int, int]:
+        return (self._budget(self.rpm_limits, model_name, GEMINI_DEFAULT_RPM),
+                self._budget(self.tpm_limits, model_name, GEMINI_DEFAULT_TPM))
+
+    def _reserve_redis(self, client, model_name: str, tokens: int, max_wait: float) -> float:
+        if self._script is None:
+            self._script = client.register_script(_ACQUIRE_SCRIPT)
+        rpm, tpm = self.budgets(model_name)
+        family = self._family(model_name)
+        wait_ms = self._script(
+            keys=[f"{KEY_PREFIX}{family}:requests", f"{KEY_PREFIX}{family}:tokens"],
+            args=[rpm, tpm, tokens, int(max_wait * 1000)]
+        )
+        return int(wait_ms) / 1000.0
+
+    def _reserve_local(self, model_name: str, tokens: int, max_wait: float) -> float:
+        rpm, tpm = self.budgets(model_name)
+        family = self._family(model_name)
+        now = time.monotonic()
+        with self._local_lock:
+            levels = []
+            wait = 0.0
+            for kind, capacity, cost in (("requests", rpm, 1), ("tokens", tpm, tokens)):
+                rate = capacity / 60.0
+                level, ts = self._local.get(f"{family}:{kind}", (float(capacity), now))
+                level = min(capacity, level + (now - ts) * rate) - cost
+                if level < 0:
+                    wait = max(wait, -level / rate)
+                levels.append((f"{family}:{kind}", level))
+            if wait > max_wait:
+                return -wait
+            for key, level in levels:
+                self._local[key] = (level, now)
+        return wait
+
+    def reserve(self, model_name: str, tokens: int = 0, max_wait: float = GEMINI_RATE_MAX_WAIT) -> float:
+        """
+        Reserve one request and `tokens` tokens for model_name. Returns the
+        seconds to wait before calling Gemini; raises RateLimitExceeded if the
+        wait would exceed max_wait (nothing is reserved in that case).
+        """
+        client = get_redis()
+        wait = None
+        if client is not None:
+            try:
+                wait = self._reserve_redis(client, model_name, tokens, max_wait)
+            except Exception as e:
+                logger.warning(f"Shared rate limiter unavailable, using local bucket: {e}")
+        if wait is None:
+            wait = self._reserve_local(model_name, tokens, max_wait)
+        if wait < 0:
+            raise RateLimitExceeded(model_name, -wait)
+        return wait
+
+    def acquire(self, model_name: str, tokens: int = 0, max_wait: float = GEMINI_RATE_MAX_WAIT) -> float:
+        """Blocking: reserve a permit and sleep until it is usable. Returns the time waited."""
+        wait = self.reserve(model_name, tokens, max_wait)
+        if wait > 0:
+            logger.info(f"Gemini rate limiter: queued {wait:.2f}s for {model_name}")
+            time.sleep(wait)
+        return wait
+
+
+def estimate_tokens(text: str, max_output_tokens: int = 0) -> int:
+    """Rough prompt+output token estimate (~4 chars/token) for TPM budgeting."""
+    return len(text) // 4 + max_output_tokens
+
+
+# Shared instance used by the API router and the Celery worker
+rate_limiter = GeminiRateLimiter()
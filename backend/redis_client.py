@@ -0,0 +1,39 @@
+import os
+import logging
+import threading
+import redis
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# Keep hot-path Redis calls short: a slow/unreachable Redis should degrade to
+# a cache miss, not a stalled request.
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5"))
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_redis():
+    """
+    Shared Redis client (connection-pooled, thread-safe), or None if it cannot
+    be created. Callers must treat Redis errors as non-fatal.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    _client = redis.Redis.from_url(
+                        REDIS_URL,
+                        socket_timeout=REDIS_SOCKET_TIMEOUT,
+                        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+                        health_check_interval=30,
+                    )
+                except Exception as e:
+                    logger.warning(f"Redis client unavailable ({REDIS_URL}): {e}")
+                    return None
+    return _client
@@ -0,0 +1,110 @@
+import os
+import logging
+import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+# Occurrences older than this when a tick finally sees them (worker/beat was
+# down) are skipped instead of delivered hours late; the medicine is simply
+# rescheduled to its next fire time.
+REMINDER_CATCHUP_MINUTES = int(os.getenv("REMINDER_CATCHUP_MINUTES", "30"))
+# Due medicines claimed per transaction in a tick
+REMINDER_TICK_CHUNK = int(os.getenv("REMINDER_TICK_CHUNK", "500"))
+
+DEFAULT_TIMEZONE = "UTC"
+
+# Medicine.frequency -> local wall-clock offsets (hours after reminder_time)
+# within one period, and the period length in days
+FREQUENCY_RULES = {
+    "daily": ((0,), 1),
+    "twice daily": ((0, 12), 1),
+    "weekly": ((0,), 7),
+}
+# Frequencies that never fire on their own
+UNSCHEDULED_FREQUENCIES = {"as needed"}
+
+UTC = datetime.timezone.utc
+
+
+def get_zone(name: Optional[str]) -> datetime.tzinfo:
+    """ZoneInfo for an IANA name, UTC if missing or unknown."""
+    if not name:
+        return UTC
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown time zone {name!r}, scheduling in UTC")
+        return UTC
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+        return True
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+
+
+def as_utc(value: datetime.datetime) -> datetime.datetime:
+    """Stored datetimes come back naive on SQLite; they are always UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
+
+
+def _parse_time(reminder_time: Optional[str]) -> Optional[datetime.time]:
+    try:
+        hour, minute = (int(part) for part in (reminder_time or "").strip().split(":")[:2])
+        return datetime.time(hour, minute)
+    except (ValueError, TypeError):
+        return None
+
+
+def next_fire_time(reminder_time: Optional[str], frequency: Optional[str], timezone: Optional[str],
+                   after: datetime.datetime, anchor: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+    """
+    First UTC fire time strictly after `after` for a medicine taken at local
+    `reminder_time` ("HH:MM") in the user's `timezone`. Weekly medicines fire
+    on the weekday of `anchor` (their creation time). Returns None for
+    "As Needed" medicines and unparseable times. Unknown frequencies are
+    treated as daily.
+    """
+    key = (frequency or "daily").strip().lower()
+    if key in UNSCHEDULED_FREQUENCIES:
+        return None
+    at = _parse_time(reminder_time)
+    if at is None:
+        return None
+    offsets, period_days = FREQUENCY_RULES.get(key, FREQUENCY_RULES["daily"])
+
+    zone = get_zone(timezone)
+    after = as_utc(after)
+    local_day = after.astimezone(zone).date() - datetime.timedelta(days=1)
+    if period_days > 1:
+        anchor_day = as_utc(anchor or after).astimezone(zone).date()
+        # Step back to the most recent period start on or before local_day
+        local_day -= datetime.timedelta(days=(local_day - anchor_day).days % period_days)
+
+    # Walk period by period; local wall times are converted one by one so DST
+    # shifts move the UTC instant, not the time the user sees
+    for _ in range(3):
+        for offset in offsets:
+            local = datetime.datetime.combine(local_day, at, tzinfo=zone) + datetime.timedelta(hours=offset)
+            fire_at = local.astimezone(UTC)
+            if fire_at > after:
+                return fire_at
+        local_day += datetime.timedelta(days=period_days)
+    return None
+
+
+def schedule_medicine(medicine, timezone: Optional[str], after: Optional[datetime.datetime] = None):
+    """(Re)compute medicine.next_reminder_at from now (or `after`)."""
+    now = after or datetime.datetime.now(UTC)
+    if not medicine.is_active:
+        medicine.next_reminder_at = None
+        return
+    medicine.next_reminder_at = next_fire_time(
+        medicine.reminder_time, medicine.frequency, timezone, now, anchor=medicine.created_at or now
+    )
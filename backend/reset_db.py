@@ -1,5 +1,6 @@
 from database import engine
 from models import Base
+from principal_cache import principal_cache
 
 # Drop all existing tables
 print("Dropping all existing tables...")
@@ -9,4 +10,7 @@ Base.metadata.drop_all(bind=engine)
 print("Creating tables with updated schema...")
 Base.metadata.create_all(bind=engine)
 
+# Cached logins would otherwise point at user ids that no longer exist
+principal_cache.clear()
+
 print("Database reset complete!")
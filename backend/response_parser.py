@@ -0,0 +1,148 @@
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from diagnosis_schema import Diagnosis
+
+try:  # orjson is optional; it parses model output several times faster
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    orjson = None
+    loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# Cut points tried (newest first) when repairing a truncated document
+MAX_REPAIR_ATTEMPTS = 32
+
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class ResponseParseError(ValueError):
+    """The model output could not be turned into a valid diagnosis."""
+
+
+def strip_fences(raw_text: str) -> str:
+    raw_text = raw_text.strip()
+    if raw_text.startswith("```json"):
+        raw_text = raw_text[7:]
+    elif raw_text.startswith("```"):
+        raw_text = raw_text[3:]
+    if raw_text.endswith("```"):
+        raw_text = raw_text[:-3]
+    return raw_text.strip()
+
+
+def repair_truncated_json(text: str) -> Optional[str]:
+    """
+    Close a JSON document that was cut off mid-generation (usually by
+    max_output_tokens). Scans once, remembering every point where the text so
+    far ends on a complete value, then drops the unfinished tail after the
+    last such point and appends the missing closing brackets. Returns None if
+    no prefix can be completed.
+    """
+    stack: List[str] = []
+    cut_points: List[Tuple[int, str]] = []
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                cut_points.append((i + 1, "".join(reversed(stack))))
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+        elif ch in "}]":
+            if not stack or stack[-1] != ch:
+                return None
+            stack.pop()
+            cut_points.append((i + 1, "".join(reversed(stack))))
+        elif ch == "," and stack:
+            # Everything before the comma is a complete member / element
+            cut_points.append((i, "".join(reversed(stack))))
+
+    if not stack and not in_string:
+        return None  # not truncated; the parse error is something else
+
+    # Most cut points after a string are keys ("a": ...) and won't parse;
+    # walk back until one does
+    for end, closers in reversed(cut_points[-MAX_REPAIR_ATTEMPTS:]):
+        candidate = text[:end].rstrip().rstrip(",") + closers
+        try:
+            loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        return candidate
+    return None
+
+
+def _load(text: str):
+    """Decode model output, repairing truncation if needed. Returns (value, repaired)."""
+    text = strip_fences(text or "")
+    try:
+        return loads(text), False
+    except json.JSONDecodeError as e:
+        repaired = repair_truncated_json(text)
+        if repaired is None:
+            raise ResponseParseError(f"Invalid JSON in model response: {e}") from e
+        return loads(repaired), True
+
+
+def _validate(data) -> dict:
+    if not isinstance(data, dict):
+        raise ResponseParseError("Diagnosis is not a JSON object")
+    try:
+        return Diagnosis.model_validate(data).model_dump()
+    except ValidationError as e:
+        raise ResponseParseError(f"Diagnosis failed validation: {e.error_count()} errors") from e
+
+
+def parse_diagnosis(text: str) -> dict:
+    """
+    Model output -> validated diagnosis dict. Raises ResponseParseError.
+    A document recovered from truncated output is marked "truncated": True
+    (fields after the cut are missing) and is not cached.
+    """
+    data, repaired = _load(text)
+    diagnosis = _validate(data)
+    if repaired:
+        diagnosis["truncated"] = True
+        logger.warning(f"Recovered truncated diagnosis response ({len(text)} chars)")
+    return diagnosis
+
+
+def parse_batch(text: str) -> Dict[str, dict]:
+    """
+    Micro-batch output (JSON array of diagnoses tagged with "id") -> validated
+    diagnoses by id. Items are validated one by one so a single bad or
+    truncated entry only loses that patient. When the array was truncated,
+    its last item is the one that was cut and is marked "truncated": True.
+    """
+    data, repaired = _load(text)
+    if not isinstance(data, list):
+        raise ResponseParseError("Batch response is not a JSON array")
+    results = {}
+    for index, entry in enumerate(data):
+        if not isinstance(entry, dict) or not entry.get("id"):
+            continue
+        entry_id = str(entry.pop("id"))
+        try:
+            results[entry_id] = _validate(entry)
+        except ResponseParseError as e:
+            logger.warning(f"Dropping batch item {entry_id}: {e}")
+            continue
+        if repaired and index == len(data) - 1:
+            results[entry_id]["truncated"] = True
+    if repaired:
+        logger.warning(f"Recovered truncated batch response: {len(results)} items usable")
+    return results
@@ -1,10 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, status
+from fastapi.responses import StreamingResponse
+from typing import Optional
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-import sys
+from sqlalchemy import and_, or_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 import time
 import json
+import base64
+import uuid
+import datetime
+import asyncio
+import anyio
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -12,166 +19,504 @@ logger = logging.getLogger(__name__)
 # Define and export the router
 router = APIRouter()
 
-from database import get_db
-from models import User, Consultation
+from database import get_async_db, AsyncSessionLocal
+from models import User, Consultation, STATUS_PENDING, STATUS_PROCESSING, STATUS_ERROR, IN_PROGRESS_STATUSES
 from routers.auth import get_current_user
+from model_catalog import model_catalog
+from diagnosis_cache import diagnosis_cache, cache_key
+from singleflight import AsyncSingleFlight
+from inference import engine, InferenceError
+import idempotency
+from celery_client import celery_client
+from stream_parser import StreamingDiagnosisParser
+from token_ledger import usage_context
+import tracing
 import os
 
 class SymptomInput(BaseModel):
     text: str
 
+# Gemini's SDK is blocking, so inference runs on worker threads. A dedicated
+# limiter caps concurrent diagnoses without starving the shared threadpool that
+# the blocking Redis helpers (idempotency, cache, result backend) run on.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+_inference_limiter = anyio.CapacityLimiter(GEMINI_MAX_CONCURRENCY)
+# Identical concurrent diagnoses in this process share one inference call
+_inflight = AsyncSingleFlight()
+
+
+def _run_diagnosis(symptoms: str, user_id: int, usage_rows: list) -> dict:
+    """
+    Blocking diagnosis via the shared inference engine (cache, cross-process
+    coalescing, rate-limited generation). Must be run off the event loop.
+    Token usage rows are collected into `usage_rows` for the caller to write.
+    """
+    try:
+        with usage_context(user_id, source="api", pending=usage_rows):
+            return engine.diagnose(symptoms)
+    except InferenceError as e:
+        if e.retry_after is not None:
+            raise HTTPException(
+                status_code=503,
+                detail="AI service is at capacity, please retry shortly",
+                headers={"Retry-After": str(int(e.retry_after) + 1)}
+            )
+        raise HTTPException(status_code=500, detail=f"AI Error: {str(e.last_error or e)}")
+
+
+async def _save_usage(db: AsyncSession, usage_rows: list):
+    """Token usage of a diagnosis that failed before its consultation was written."""
+    if not usage_rows:
+        return
+    try:
+        db.add_all(usage_rows)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        logger.warning(f"Failed to record token usage: {e}")
+
+
+def _idempotent_replay(record: dict, request_fingerprint: str) -> dict:
+    """Resolve a previously claimed Idempotency-Key to its stored response."""
+    if record.get("fingerprint") != request_fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+    if record.get("state") != idempotency.COMPLETED:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this Idempotency-Key is still in progress",
+            headers={"Retry-After": "2"}
+        )
+    logger.info("Replaying stored response for Idempotency-Key")
+    return record["response"]
+
 @router.post("/predict")
 async def predict_disease_endpoint(
     data: SymptomInput,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Submit symptoms for AI diagnosis analysis (Synchronous for simplified deployment).
+    Submit symptoms for AI diagnosis and answer with the finished result.
+    The request awaits inference on a worker thread, capped at
+    GEMINI_MAX_CONCURRENCY, so the event loop keeps serving other requests;
+    identical symptoms in flight share one call. Retries carrying the same
+    Idempotency-Key replay the stored response.
     """
+    request_fingerprint = idempotency.fingerprint(data.text)
+    if idempotency_key:
+        record = await anyio.to_thread.run_sync(
+            idempotency.claim, "predict", current_user.id, idempotency_key, request_fingerprint
+        )
+        if record is not None:
+            return _idempotent_replay(record, request_fingerprint)
+
+    usage_rows = []
     try:
         logger.info(f"Received diagnosis request from user_id={current_user.id}")
-        
-        # 1. Create Consultation (Pending)
-        new_consultation = Consultation(
-            user_id=current_user.id,
-            symptoms=data.text,
-            diagnosis='Processing...'
-        )
+
+        # 1. Run inference off the event loop (capped by GEMINI_MAX_CONCURRENCY),
+        # coalescing identical in-flight requests into a single call. No DB
+        # connection or transaction is held meanwhile.
+        primary_model = model_catalog.get_models_to_try()[0]
+        diagnosis_data = dict(await _inflight.do(
+            cache_key(data.text, primary_model),
+            lambda: anyio.to_thread.run_sync(
+                _run_diagnosis, data.text, current_user.id, usage_rows, limiter=_inference_limiter
+            )
+        ))
+
+        # 2. One INSERT of the finished consultation, written with the call's
+        # token usage in a single commit
+        new_consultation = Consultation(user_id=current_user.id, symptoms=data.text)
+        new_consultation.set_diagnosis(diagnosis_data)
         db.add(new_consultation)
-        db.commit()
-        db.refresh(new_consultation)
-        
-        # 2. Logic from worker.py (Adapted for synchronous execution)
-        import google.generativeai as genai
-        import os
-        
-        # Configure API
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise HTTPException(status_code=500, detail="GEMINI_API_KEY not set")
-        
-        genai.configure(api_key=api_key)
-        
-        # Smart Model Discovery
-        env_model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
-        models_to_try = []
-        try:
-            available_models = [m.name for m in genai.list_models() if 'generateContent' in m.supported_generation_methods]
-            
-            def get_matches(substring):
-                return [m for m in available_models if substring in m]
-
-            if any(env_model_name in m for m in available_models):
-                models_to_try.append(env_model_name)
-            
-            models_to_try.extend(get_matches("gemini-1.5-flash"))
-            models_to_try.extend(get_matches("gemini-1.5-pro"))
-            models_to_try.extend(get_matches("gemini-1.0"))
-            models_to_try.extend(get_matches("gemini-pro"))
-            
-            for m in available_models:
-                if m not in models_to_try:
-                    models_to_try.append(m)
-                    
-            if not models_to_try:
-                models_to_try = [env_model_name, "gemini-1.5-flash", "gemini-pro"]
-                
-        except Exception:
-            models_to_try = [env_model_name, "gemini-1.5-flash", "gemini-pro"]
-            
-        final_models = []
-        for m in models_to_try:
-            if m not in final_models:
-                final_models.append(m)
-        models_to_try = final_models
-        
-        # Prompt
-        prompt = f"""You are a medical AI assistant. Analyze the following symptoms and provide a diagnosis in structured JSON format.
-
-Symptoms: {data.text}
-
-Output MUST be a valid JSON object with the following structure:
-{{
-  "diagnosis": "Name of the most likely condition",
-  "diagnosis_summary": "A brief 1-2 sentence summary of the diagnosis",
-  "detailed_diagnosis": "A comprehensive explanation of the condition",
-  "conditions": [
-    {{
-      "name": "Condition Name",
-      "confidence": 85,
-      "severity": "high" | "medium" | "low",
-      "reasoning": "Why this matches"
-    }}
-  ],
-  "recommended_tests": ["List of recommended medical tests"],
-  "consult_doctor": "Type of specialist to consult (e.g. Cardiologist)",
-  "precautions": ["List of immediate precautions"],
-  "prevention": ["List of prevention tips"],
-  "lifestyle_tips": ["List of lifestyle changes"],
-  "tips": ["General health tips"]
-}}
-
-Ensure the response is purely valid JSON without markdown formatting."""
-
-        # Execute
-        diagnosis_data = None
-        success = False
-        last_error = None
-        
-        for model_name in models_to_try:
-            try:
-                model = genai.GenerativeModel(model_name)
-                response = model.generate_content(
-                    prompt,
-                    generation_config={
-                        'temperature': 0.4,
-                        'top_p': 0.8,
-                        'top_k': 40,
-                        'max_output_tokens': 4096,
-                        'response_mime_type': 'application/json'
-                    }
-                )
-                
-                raw_text = response.text.strip()
-                if raw_text.startswith("```json"): raw_text = raw_text[7:]
-                if raw_text.endswith("```"): raw_text = raw_text[:-3]
-                
-                diagnosis_data = json.loads(raw_text)
-                diagnosis_data['status'] = 'success'
-                success = True
-                break
-            except Exception as e:
-                last_error = e
-                continue
-                
-        if not success:
-            raise HTTPException(status_code=500, detail=f"AI Error: {str(last_error)}")
-            
-        # Update DB
-        new_consultation.diagnosis = json.dumps(diagnosis_data)
-        db.commit()
-        
+        await db.flush()
+        for row in usage_rows:
+            row.consultation_id = new_consultation.id
+        db.add_all(usage_rows)
+        await db.commit()
+        tracing.set_attributes(consultation_id=new_consultation.id)
+
         # Return directly (No task_id needed anymore)
-        return {
+        response = {
             "status": "SUCCESS",
             "result": diagnosis_data,
             "consultation_id": new_consultation.id
         }
+        if idempotency_key:
+            await anyio.to_thread.run_sync(
+                idempotency.complete, "predict", current_user.id, idempotency_key, request_fingerprint, response
+            )
+        return response
 
     except HTTPException:
+        await _save_usage(db, usage_rows)
+        if idempotency_key:
+            await anyio.to_thread.run_sync(idempotency.release, "predict", current_user.id, idempotency_key)
         raise
     except Exception as e:
         logger.error(f"Error in predict endpoint: {e}")
+        if idempotency_key:
+            await anyio.to_thread.run_sync(idempotency.release, "predict", current_user.id, idempotency_key)
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _stream_diagnosis(symptoms: str, models_to_try, emit, user_id: int, consultation_id: int) -> str:
+    with usage_context(user_id, consultation_id, source="stream"):
+        return engine.stream(symptoms, models_to_try, emit)
+
+async def _save_diagnosis(consultation_id: int, diagnosis_data: dict):
+    """Persist a finished streamed diagnosis (own session: runs after the request scope)."""
+    with tracing.tracer.start_as_current_span("db.save_diagnosis", attributes={"consultation.id": consultation_id}):
+        async with AsyncSessionLocal() as db:
+            consultation = await db.get(Consultation, consultation_id)
+            if consultation:
+                consultation.set_diagnosis(diagnosis_data)
+                await db.commit()
+
+# Streamed diagnoses in progress (the event loop keeps only weak references to tasks)
+_stream_tasks = set()
+
+async def _run_stream(symptoms: str, models_to_try, user_id: int, consultation_id: int, events: asyncio.Queue):
+    """
+    The streamed diagnosis itself, run as a task independent of the SSE
+    response so it completes and persists its outcome even if the client
+    disconnects. Puts ("event", name, data) per parsed field/condition, then
+    ("done", None, document) or ("error", None, error document).
+    """
+    primary_model = models_to_try[0]
+    try:
+        cached = await anyio.to_thread.run_sync(diagnosis_cache.get, symptoms, primary_model)
+        if cached is not None:
+            for name, value in cached.items():
+                if name == "conditions":
+                    for condition in value:
+                        events.put_nowait(("event", "condition", condition))
+                elif name != "status":
+                    events.put_nowait(("event", "field", {"name": name, "value": value}))
+            diagnosis_data = cached
+        else:
+            loop = asyncio.get_running_loop()
+            parser = StreamingDiagnosisParser()
+
+            def on_chunk(text: str):
+                for event, event_data in parser.feed(text):
+                    events.put_nowait(("event", event, event_data))
+
+            await anyio.to_thread.run_sync(
+                _stream_diagnosis, symptoms, models_to_try, lambda text: loop.call_soon_threadsafe(on_chunk, text),
+                user_id, consultation_id, limiter=_inference_limiter
+            )
+            diagnosis_data = parser.document()
+            diagnosis_data['status'] = 'success'
+            await anyio.to_thread.run_sync(diagnosis_cache.set, symptoms, primary_model, diagnosis_data)
+    except Exception as e:
+        logger.error(f"Streaming diagnosis failed (consultation_id={consultation_id}): {e}")
+        diagnosis_data = {"status": "error", "error": str(e)}
+
+    try:
+        await _save_diagnosis(consultation_id, diagnosis_data)
+    except Exception as e:
+        logger.error(f"Failed to save streamed diagnosis (consultation_id={consultation_id}): {e}")
+    events.put_nowait(("error" if diagnosis_data.get("status") == "error" else "done", None, diagnosis_data))
+
+@router.post("/predict/stream")
+async def predict_disease_stream(
+    data: SymptomInput,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Streaming diagnosis over Server-Sent Events. Emits `field` events for
+    top-level fields (diagnosis, diagnosis_summary, ...) and one `condition`
+    event per condition as soon as each is complete in the model output, then
+    `done` with the full document once it is persisted to the consultation.
+    """
+    new_consultation = Consultation(
+        user_id=current_user.id,
+        symptoms=data.text,
+        status=STATUS_PROCESSING
+    )
+    db.add(new_consultation)
+    await db.commit()
+    consultation_id = new_consultation.id
+    tracing.set_attributes(consultation_id=consultation_id)
+
+    events: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_run_stream(
+        data.text, model_catalog.get_models_to_try(), current_user.id, consultation_id, events
+    ))
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_tasks.discard)
+
+    async def event_stream():
+        yield _sse("consultation", {"consultation_id": consultation_id})
+        while True:
+            kind, name, payload = await events.get()
+            if kind == "event":
+                yield _sse(name, payload)
+            elif kind == "done":
+                yield _sse("done", {"consultation_id": consultation_id, "result": payload})
+                return
+            else:
+                yield _sse("error", payload)
+                return
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Upper bound for long-polling in GET /result/{task_id}
+RESULT_MAX_WAIT = 30
+RESULT_POLL_INTERVAL = 0.5
+
+@router.post("/predict/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_prediction_job(
+    data: SymptomInput,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Submit symptoms for asynchronous diagnosis on the Celery worker fleet.
+    Returns immediately with a task_id and consultation_id to poll via /result.
+    Retries carrying the same Idempotency-Key return the original job.
+    """
+    request_fingerprint = idempotency.fingerprint(data.text)
+    if idempotency_key:
+        record = await anyio.to_thread.run_sync(
+            idempotency.claim, "predict_jobs", current_user.id, idempotency_key, request_fingerprint
+        )
+        if record is not None:
+            return _idempotent_replay(record, request_fingerprint)
+
+    # The task id is chosen here so the row records it in its one INSERT
+    task_id = str(uuid.uuid4())
+    new_consultation = Consultation(
+        user_id=current_user.id,
+        symptoms=data.text,
+        status=STATUS_PENDING,
+        task_id=task_id
+    )
+    db.add(new_consultation)
+    await db.commit()
+    consultation_id = new_consultation.id
+    tracing.set_attributes(consultation_id=consultation_id)
+
+    try:
+        # Broker publish (and result-backend subscription) are blocking
+        task = await anyio.to_thread.run_sync(lambda: celery_client.send_task(
+            "predict_disease",
+            args=[data.text, consultation_id],
+            kwargs={"user_id": current_user.id},
+            task_id=task_id
+        ))
+    except Exception as e:
+        logger.error(f"Failed to queue predict_disease (consultation_id={consultation_id}): {e}")
+        new_consultation.set_diagnosis({"status": "error", "error": "Failed to queue diagnosis job"})
+        await db.commit()
+        if idempotency_key:
+            await anyio.to_thread.run_sync(idempotency.release, "predict_jobs", current_user.id, idempotency_key)
+        raise HTTPException(status_code=503, detail="Diagnosis queue unavailable")
+
+    logger.info(f"Queued predict_disease task {task.id} (consultation_id={consultation_id})")
+    response = {
+        "status": "PENDING",
+        "task_id": task.id,
+        "consultation_id": consultation_id
+    }
+    if idempotency_key:
+        await anyio.to_thread.run_sync(
+            idempotency.complete, "predict_jobs", current_user.id, idempotency_key, request_fingerprint, response
+        )
+    return response
+
+def _read_task_state(task_id: str):
+    """Blocking read of task state/result from the Redis result backend."""
+    result = celery_client.AsyncResult(task_id)
+    state = result.state
+    return state, (result.result if state in ("SUCCESS", "FAILURE") else None)
+
+def _consultation_result(consultation):
+    """Map a persisted consultation (row with status, diagnosis) to (status, result), or None if still pending."""
+    if consultation.status in IN_PROGRESS_STATUSES:
+        return None
+    return ("FAILURE" if consultation.status == STATUS_ERROR else "SUCCESS"), consultation.diagnosis
+
+@router.get("/result/{task_id}")
+async def get_prediction_result(
+    task_id: str,
+    consultation_id: Optional[int] = None,
+    timeout: float = 0,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Status of a diagnosis job. Reads the Celery result backend (Redis) and falls
+    back to the consultation row once results have expired from Redis.
+    `timeout` long-polls for up to RESULT_MAX_WAIT seconds.
+    """
+    # The task must belong to one of the caller's consultations: task ids are
+    # not secrets, and the result backend holds other patients' diagnoses
+    owned = (await db.execute(select(Consultation.id).where(
+        Consultation.task_id == task_id,
+        Consultation.user_id == current_user.id
+    ))).first()
+    await db.rollback()
+    if owned is None or (consultation_id is not None and owned.id != consultation_id):
+        raise HTTPException(status_code=404, detail="Task not found")
+    consultation_id = owned.id
+
+    deadline = time.monotonic() + min(max(timeout, 0), RESULT_MAX_WAIT)
+    while True:
+        try:
+            state, result = await anyio.to_thread.run_sync(_read_task_state, task_id)
+        except Exception as e:
+            logger.warning(f"Result backend unavailable for task {task_id}: {e}")
+            state, result = "UNKNOWN", None
+
+        if state == "SUCCESS":
+            task_status = "FAILURE" if isinstance(result, dict) and result.get("status") == "error" else "SUCCESS"
+            return {"task_id": task_id, "status": task_status, "result": result, "consultation_id": consultation_id}
+        if state == "FAILURE":
+            return {"task_id": task_id, "status": "FAILURE", "result": {"status": "error", "error": str(result)}, "consultation_id": consultation_id}
+
+        # Redis results expire (result_expires); the DB row is the durable copy
+        if consultation_id is not None:
+            row = (await db.execute(
+                select(Consultation.status, Consultation.diagnosis).where(Consultation.id == consultation_id)
+            )).first()
+            # End the read so no pooled connection is held across the poll sleep
+            await db.rollback()
+            persisted = _consultation_result(row) if row is not None else None
+            if persisted:
+                task_status, data = persisted
+                return {"task_id": task_id, "status": task_status, "result": data, "consultation_id": consultation_id}
+
+        if time.monotonic() >= deadline:
+            return {"task_id": task_id, "status": state, "result": None, "consultation_id": consultation_id}
+        await anyio.sleep(RESULT_POLL_INTERVAL)
+
+HISTORY_DEFAULT_LIMIT = 20
+HISTORY_MAX_LIMIT = 100
+SYMPTOM_SNIPPET_LENGTH = 120
+
+def _encode_cursor(created_at: datetime.datetime, consultation_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), consultation_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
+    try:
+        created_at, consultation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), int(consultation_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/history")
 async def get_history(
+    limit: int = Query(HISTORY_DEFAULT_LIMIT, ge=1, le=HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    severity: Optional[str] = None,
+    specialist: Optional[str] = None,
+    diagnosis: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the medical history (consultations) for the current user, newest first.
+    Optional filters: severity (high/medium/low), specialist, diagnosis.
+    Keyset-paginated on (created_at, id) and projected to summary columns;
+    fetch the full record with GET /history/{consultation_id}.
+    """
+    query = select(
+        Consultation.id,
+        Consultation.created_at,
+        func.substr(Consultation.symptoms, 1, SYMPTOM_SNIPPET_LENGTH).label("symptoms"),
+        Consultation.status,
+        Consultation.top_diagnosis,
+        Consultation.max_severity,
+        Consultation.specialist
+    ).where(Consultation.user_id == current_user.id)
+
+    # Filters run on the indexed summary columns
+    if severity:
+        query = query.where(Consultation.max_severity == severity.lower())
+    if specialist:
+        query = query.where(Consultation.specialist == specialist)
+    if diagnosis:
+        query = query.where(Consultation.top_diagnosis == diagnosis)
+
+    if cursor:
+        cursor_created_at, cursor_id = _decode_cursor(cursor)
+        query = query.where(or_(
+            Consultation.created_at < cursor_created_at,
+            and_(Consultation.created_at == cursor_created_at, Consultation.id < cursor_id)
+        ))
+
+    query = query.order_by(Consultation.created_at.desc(), Consultation.id.desc()).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "items": [
+            {
+                "id": row.id,
+                "created_at": row.created_at,
+                "symptoms": row.symptoms,
+                "status": row.status,
+                "diagnosis": row.top_diagnosis,
+                "max_severity": row.max_severity,
+                "specialist": row.specialist,
+                "pending": row.status in IN_PROGRESS_STATUSES
+            }
+            for row in rows
+        ],
+        "next_cursor": _encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+    }
+
+@router.get("/history/stats")
+async def get_history_stats(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Aggregate the current user's finished diagnoses by severity, specialist
+    and most frequent diagnosis (GROUP BY on the indexed summary columns).
+    """
+    async def counts(column, limit=None):
+        query = select(column, func.count(Consultation.id).label("n")) \
+            .where(Consultation.user_id == current_user.id, column.isnot(None)) \
+            .group_by(column).order_by(func.count(Consultation.id).desc())
+        if limit:
+            query = query.limit(limit)
+        return [{"value": value, "count": n} for value, n in (await db.execute(query)).all()]
+
+    return {
+        "by_status": await counts(Consultation.status),
+        "by_severity": await counts(Consultation.max_severity),
+        "by_specialist": await counts(Consultation.specialist, limit=10),
+        "top_diagnoses": await counts(Consultation.top_diagnosis, limit=10)
+    }
+
+@router.get("/history/{consultation_id}")
+async def get_history_item(
+    consultation_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get the medical history (consultations) for the current user.
+    Get a single consultation, including the full diagnosis document.
     """
-    consultations = db.query(Consultation).filter(Consultation.user_id == current_user.id).all()
-    return consultations
\ No newline at end of file
+    consultation = (await db.execute(select(Consultation).where(
+        Consultation.id == consultation_id,
+        Consultation.user_id == current_user.id
+    ))).scalars().first()
+    if consultation is None:
+        raise HTTPException(status_code=404, detail="Consultation not found")
+    return consultation
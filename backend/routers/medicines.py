@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import Medicine, User
 from routers.auth import get_current_user
+from reminder_schedule import schedule_medicine
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -25,7 +27,7 @@ class MedicineOut(MedicineCreate):
 @router.post("/medicines", response_model=MedicineOut, status_code=status.HTTP_201_CREATED)
 async def create_medicine(
     med: MedicineCreate, 
-    db: Session = Depends(get_db), 
+    db: AsyncSession = Depends(get_async_db), 
     current_user: User = Depends(get_current_user)
 ):
     new_med = Medicine(
@@ -36,28 +38,31 @@ async def create_medicine(
         user_id=current_user.id,
         is_active=1
     )
+    schedule_medicine(new_med, current_user.timezone)
     db.add(new_med)
-    db.commit()
-    db.refresh(new_med)
+    await db.commit()
+    await db.refresh(new_med)
     return new_med
 
 @router.get("/medicines", response_model=List[MedicineOut])
 async def get_medicines(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    return db.query(Medicine).filter(Medicine.user_id == current_user.id).all()
+    result = await db.execute(select(Medicine).where(Medicine.user_id == current_user.id))
+    return result.scalars().all()
 
 @router.delete("/medicines/{medicine_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_medicine(
     medicine_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
-    med = db.query(Medicine).filter(Medicine.id == medicine_id, Medicine.user_id == current_user.id).first()
+    result = await db.execute(select(Medicine).where(Medicine.id == medicine_id, Medicine.user_id == current_user.id))
+    med = result.scalars().first()
     if not med:
         raise HTTPException(status_code=404, detail="Medicine not found")
     
-    db.delete(med)
-    db.commit()
+    await db.delete(med)
+    await db.commit()
     return None
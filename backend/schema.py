@@ -0,0 +1,125 @@
+import logging
+from sqlalchemy import func, inspect, or_, text
+from sqlalchemy.orm import Session
+
+from database import Base
+from models import Consultation, Medicine, User, STATUS_PENDING
+from reminder_schedule import schedule_medicine, UNSCHEDULED_FREQUENCIES
+
+# Sentinel strings the old String diagnosis column used instead of a status
+LEGACY_PENDING_DIAGNOSES = ("Pending", "Processing...")
+BACKFILL_CHUNK_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+def sync_schema(engine):
+    """
+    Bring an existing database up to the current models without a migration
+    tool: create missing tables, then add missing (nullable) columns and
+    indexes to tables that already exist. Safe to run repeatedly.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                logger.info(f"Adding column {table.name}.{column.name} ({column_type})")
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+    _migrate_consultation_diagnosis(engine)
+    _backfill_reminder_schedule(engine)
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                logger.info(f"Creating index {index.name}")
+                index.create(bind=engine)
+
+
+def _migrate_consultation_diagnosis(engine):
+    """
+    One-time conversion of consultations.diagnosis from json.dumps() strings
+    with 'Pending'/'Processing...' sentinels to a JSON(B) document plus the
+    status / top_diagnosis / max_severity / specialist columns.
+    """
+    sentinels = ", ".join(f"'{s}'" for s in LEGACY_PENDING_DIAGNOSES)
+    column_types = {c["name"]: str(c["type"]).upper() for c in inspect(engine).get_columns("consultations")}
+
+    with engine.begin() as conn:
+        # Rows still carrying a sentinel are in flight
+        conn.execute(text(
+            f"UPDATE consultations SET status = '{STATUS_PENDING}' "
+            f"WHERE status IS NULL AND (diagnosis IS NULL OR diagnosis IN ({sentinels}))"
+        ))
+
+        if engine.dialect.name == "postgresql":
+            if column_types.get("diagnosis") != "JSONB":
+                logger.info("Converting consultations.diagnosis to JSONB")
+                conn.execute(text("ALTER TABLE consultations ALTER COLUMN diagnosis DROP DEFAULT"))
+                conn.execute(text(
+                    "ALTER TABLE consultations ALTER COLUMN diagnosis TYPE JSONB USING ("
+                    f"CASE WHEN diagnosis IS NULL OR diagnosis IN ({sentinels}) THEN NULL "
+                    "WHEN diagnosis ~ '^\\s*[{\\[]' THEN diagnosis::jsonb "
+                    "ELSE jsonb_build_object('diagnosis', diagnosis) END)"
+                ))
+        elif engine.dialect.name == "sqlite":
+            conn.execute(text(f"UPDATE consultations SET diagnosis = NULL WHERE diagnosis IN ({sentinels})"))
+            conn.execute(text(
+                "UPDATE consultations SET diagnosis = json_object('diagnosis', diagnosis) "
+                "WHERE diagnosis IS NOT NULL AND json_valid(diagnosis) = 0"
+            ))
+
+    # Derive status and summary columns for finished legacy rows
+    with Session(engine) as db:
+        while True:
+            rows = db.query(Consultation).filter(Consultation.status.is_(None)).limit(BACKFILL_CHUNK_SIZE).all()
+            if not rows:
+                break
+            for row in rows:
+                document = row.diagnosis if isinstance(row.diagnosis, dict) else {"diagnosis": row.diagnosis}
+                row.set_diagnosis(document)
+            db.commit()
+            logger.info(f"Backfilled diagnosis summary columns for {len(rows)} consultations")
+
+
+def _backfill_reminder_schedule(engine):
+    """
+    Give active medicines created before next_reminder_at existed their first
+    fire time. Keyset over id so rows that stay NULL (bad reminder_time) are
+    visited once.
+    """
+    last_id = 0
+    with Session(engine) as db:
+        while True:
+            rows = db.query(Medicine, User.timezone).join(User, Medicine.user_id == User.id).filter(
+                Medicine.id > last_id,
+                Medicine.is_active == 1,
+                Medicine.next_reminder_at.is_(None),
+                or_(Medicine.frequency.is_(None), func.lower(Medicine.frequency).notin_(UNSCHEDULED_FREQUENCIES))
+            ).order_by(Medicine.id).limit(BACKFILL_CHUNK_SIZE).all()
+            if not rows:
+                break
+            for medicine, timezone in rows:
+                schedule_medicine(medicine, timezone)
+            last_id = rows[-1][0].id
+            db.commit()
+            logger.info(f"Scheduled reminders for {len(rows)} existing medicines")
+
+
+if __name__ == "__main__":
+    # Deploy step: `python schema.py` once per release, before API/worker
+    # replicas start (they no longer sync the schema themselves by default)
+    from database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Synchronising database schema...")
+    sync_schema(engine)
+    logger.info("Database schema is up to date.")
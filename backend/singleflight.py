@@ -0,0 +1,129 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Lock TTL must outlive a full Gemini fallback chain; waiters give up after
+# SINGLEFLIGHT_WAIT and compute on their own rather than fail.
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", "120"))
+SINGLEFLIGHT_WAIT = float(os.getenv("SINGLEFLIGHT_WAIT", "90"))
+SINGLEFLIGHT_POLL_INTERVAL = 0.25
+
+LOCK_KEY_PREFIX = "diagnosis:inflight:"
+
+# Delete the lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class AsyncSingleFlight:
+    """
+    In-process request coalescing for coroutines: concurrent calls with the
+    same key await a single execution and share its result (or exception).
+
+    The execution runs in its own task that callers only wait on, so a caller
+    cancelled meanwhile (e.g. its client disconnected) stops waiting without
+    cancelling the call for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller stopped waiting
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class RedisFlight:
+    """
+    Cross-process single-flight lock. The holder does the work and publishes
+    the result somewhere shared (the diagnosis cache); other processes wait
+    for that result instead of repeating the call. If Redis is unavailable
+    every caller is treated as the holder.
+    """
+
+    def __init__(self, key: str, ttl: float = SINGLEFLIGHT_LOCK_TTL):
+        self.key = LOCK_KEY_PREFIX + key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.owned = False
+
+    def acquire(self) -> bool:
+        client = get_redis()
+        if client is None:
+            self.owned = True
+            return True
+        try:
+            self.owned = bool(client.set(self.key, self.token, nx=True, px=int(self.ttl * 1000)))
+        except Exception as e:
+            logger.warning(f"Single-flight lock unavailable, proceeding without it: {e}")
+            self.owned = True
+        return self.owned
+
+    def wait_for(self, lookup: Callable[[], Optional[Any]], timeout: float = SINGLEFLIGHT_WAIT) -> Optional[Any]:
+        """Poll `lookup` until it yields a result, the holder gives up, or timeout."""
+        client = get_redis()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            result = lookup()
+            if result is not None:
+                return result
+            try:
+                if client is None or not client.exists(self.key):
+                    # Holder finished without publishing (error) - one last look
+                    return lookup()
+            except Exception:
+                return None
+            time.sleep(SINGLEFLIGHT_POLL_INTERVAL)
+        return None
+
+    def release(self):
+        if not self.owned:
+            return
+        self.owned = False
+        client = get_redis()
+        if client is None:
+            return
+        try:
+            client.eval(_RELEASE_SCRIPT, 1, self.key, self.token)
+        except Exception as e:
+            logger.warning(f"Failed to release single-flight lock {self.key}: {e}")
+
+
+def run_coalesced(key: str, compute: Callable[[], Any], lookup: Callable[[], Optional[Any]]) -> Any:
+    """
+    Blocking helper: return `lookup()` if another process is already computing
+    `key`, otherwise run `compute()` while holding the cross-process lock.
+    """
+    flight = RedisFlight(key)
+    if not flight.acquire():
+        result = flight.wait_for(lookup)
+        if result is not None:
+            return result
+    try:
+        return compute()
+    finally:
+        flight.release()
@@ -0,0 +1,66 @@
+"""
+Start a Celery worker for one workload profile (see celery_queues.WORKER_PROFILES).
+
+    python start_worker.py --profile ai          # predict_disease only
+    python start_worker.py --profile mail        # transactional email
+    python start_worker.py --profile reminders   # medicine reminder ticks
+    python start_worker.py --profile all         # everything (development)
+
+Concurrency and prefetch come from the profile (CELERY_<PROFILE>_CONCURRENCY /
+CELERY_<PROFILE>_PREFETCH) and can be overridden here; extra arguments after
+`--` are passed to `celery worker` unchanged.
+"""
+import os
+import sys
+import shutil
+import argparse
+
+from celery_queues import WORKER_PROFILES
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=sorted(WORKER_PROFILES), default=os.getenv("CELERY_WORKER_PROFILE", "all"))
+    parser.add_argument("--queues", help="comma-separated queues, overriding the profile's")
+    parser.add_argument("--concurrency", type=int)
+    parser.add_argument("--prefetch-multiplier", type=int)
+    parser.add_argument("--loglevel", default="info")
+    parser.add_argument("celery_args", nargs=argparse.REMAINDER)
+    return parser.parse_args()
+
+
+def reset_metrics_dir():
+    """Samples left by a previous run would be aggregated as if still live."""
+    path = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def main():
+    args = parse_args()
+    profile = WORKER_PROFILES[args.profile]
+    queues = args.queues.split(",") if args.queues else profile["queues"]
+    concurrency = args.concurrency or profile["concurrency"]
+    prefetch = args.prefetch_multiplier or profile["prefetch_multiplier"]
+    extra = [arg for arg in args.celery_args if arg != "--"]
+
+    # Before worker.py (and with it prometheus_client) is imported
+    reset_metrics_dir()
+    from worker import celery_app
+
+    argv = [
+        "worker",
+        f"--loglevel={args.loglevel}",
+        f"--queues={','.join(queues)}",
+        f"--concurrency={concurrency}",
+        f"--prefetch-multiplier={prefetch}",
+        f"--hostname={args.profile}@%h",
+    ] + extra
+    print(f"Starting {args.profile} worker: queues={','.join(queues)} concurrency={concurrency} prefetch={prefetch}",
+          file=sys.stderr)
+    celery_app.worker_main(argv)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import json
+from typing import List, Optional, Tuple
+
+from response_parser import parse_diagnosis
+
+# Top-level array whose items are emitted one by one as they complete
+ITEM_FIELDS = {"conditions": "condition"}
+
+
+class StreamingDiagnosisParser:
+    """
+    Incremental scanner for a streamed diagnosis JSON object.
+
+    feed() consumes raw text chunks and returns the events that became
+    complete with that chunk:
+      ("field", {"name": key, "value": value})  - a finished top-level field
+      ("condition", {...})                       - a finished item of "conditions"
+    Only structural characters are tracked (depth, strings, escapes), so each
+    byte is scanned once and values are parsed exactly once when they close.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+        self._item_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, dict]]:
+        self.buffer += chunk
+        events: List[Tuple[str, dict]] = []
+        buf = self.buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if not self._started:
+                # Skip anything before the opening brace (e.g. a ```json fence)
+                if ch == "{":
+                    self._started = True
+                    self._depth = 1
+                    self._expect_key = True
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key_start is not None:
+                        self._key = json.loads(buf[self._key_start:i + 1])
+                        self._key_start = None
+                    elif self._depth == 1 and self._value_start is not None:
+                        self._close_value(i + 1, events)
+                i += 1
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = i
+                    self._expect_key = False
+                elif self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+            elif ch == ":" and self._depth == 1:
+                pass
+            elif ch in "{[":
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = i
+                elif self._depth == 2 and ch == "{" and self._key in ITEM_FIELDS:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 2 and ch == "}" and self._item_start is not None:
+                    events.append((ITEM_FIELDS[self._key], json.loads(buf[self._item_start:i + 1])))
+                    self._item_start = None
+                elif self._depth == 1 and self._value_start is not None:
+                    self._close_value(i + 1, events)
+                elif self._depth == 0:
+                    # End of document: flush a trailing primitive value
+                    if self._value_start is not None:
+                        self._close_value(i, events)
+                    self._pos = i + 1
+                    return events
+            elif ch == "," and self._depth == 1:
+                if self._value_start is not None:
+                    self._close_value(i, events)
+                self._expect_key = True
+            elif self._depth == 1 and self._key is not None and self._value_start is None and not ch.isspace():
+                # Start of a number / true / false / null
+                self._value_start = i
+            i += 1
+        self._pos = i
+        return events
+
+    def _close_value(self, end: int, events: List[Tuple[str, dict]]):
+        raw = self.buffer[self._value_start:end].strip()
+        key = self._key
+        self._value_start = None
+        self._key = None
+        if key in ITEM_FIELDS:
+            return  # items were already emitted individually
+        events.append(("field", {"name": key, "value": json.loads(raw)}))
+
+    def document(self) -> dict:
+        """Parse and validate the complete buffered response (see response_parser)."""
+        return parse_diagnosis(self.buffer)
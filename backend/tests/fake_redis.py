@@ -0,0 +1,130 @@
+import threading
+import time
+
+
+class FakeRedis:
+    """
+    In-memory stand-in for the few redis-py calls the backend makes (strings,
+    lists, the compare-and-delete and list-take scripts). Thread-safe so
+    concurrent submitters can share one instance.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    # Strings
+    def set(self, key, value, nx=False, ex=None, px=None):
+        with self._cond:
+            if nx and key in self.data:
+                return None
+            self.data[key] = self._bytes(value)
+            self.ttls[key] = ex if ex is not None else (px / 1000 if px is not None else None)
+            return True
+
+    def get(self, key):
+        with self._cond:
+            value = self.data.get(key)
+            return value if isinstance(value, bytes) else None
+
+    def delete(self, *keys):
+        with self._cond:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def exists(self, key):
+        with self._cond:
+            return int(key in self.data)
+
+    def expire(self, key, seconds):
+        with self._cond:
+            self.ttls[key] = seconds
+            return key in self.data
+
+    def scan_iter(self, match=None, count=None):
+        prefix = (match or "*").rstrip("*")
+        with self._cond:
+            return [key for key in list(self.data) if key.startswith(prefix)]
+
+    # Lists
+    def rpush(self, key, *values):
+        with self._cond:
+            items = self.data.setdefault(key, [])
+            items.extend(self._bytes(value) for value in values)
+            self._cond.notify_all()
+            return len(items)
+
+    def llen(self, key):
+        with self._cond:
+            return len(self.data.get(key, []))
+
+    def lrem(self, key, count, value):
+        value = self._bytes(value)
+        with self._cond:
+            items = self.data.get(key, [])
+            if value in items:
+                items.remove(value)
+                return 1
+            return 0
+
+    def blpop(self, keys, timeout=0):
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for key in keys:
+                    if self.data.get(key):
+                        return key.encode(), self.data[key].pop(0)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    # Scripts
+    def eval(self, script, numkeys, key, token):
+        # Compare-and-delete: release a lock only while still holding it
+        with self._cond:
+            if self.data.get(key) == self._bytes(token):
+                del self.data[key]
+                return 1
+            return 0
+
+    def register_script(self, script):
+        assert "LTRIM" in script, "only the list-take script is supported"
+
+        def take(keys, args):
+            with self._cond:
+                items = self.data.get(keys[0], [])
+                taken, self.data[keys[0]] = items[:int(args[0])], items[int(args[0]):]
+                return taken
+        return take
+
+    def pipeline(self):
+        return _Pipeline(self)
+
+
+class _Pipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.client, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        return [method(*args, **kwargs) for method, args, kwargs in self.calls]
+
+
+class BrokenRedis:
+    """Every command fails, like a Redis that went away after the client was created."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("Redis is down")
+        return fail
@@ -0,0 +1,130 @@
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import batching
+import inference
+from batching import MicroBatcher, PENDING_KEY, LEADER_KEY
+from fake_redis import FakeRedis
+from token_ledger import usage_context
+
+WAIT = 5
+
+
+class FakeGemini:
+    """engine.generate stand-in answering every patient in a batch prompt."""
+
+    def __init__(self):
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def generate(self, model_name, prompt, max_output_tokens=0, response_schema=None, **kwargs):
+        with self.lock:
+            self.prompts.append(prompt)
+        patients = re.findall(r'- id "(\w+)": (.*)', prompt)
+        text = json.dumps([{"id": item_id, "diagnosis": f"Diagnosis for {symptoms}"} for item_id, symptoms in patients])
+        return SimpleNamespace(text=text, candidates=[SimpleNamespace(finish_reason="STOP")], usage_metadata=None)
+
+
+class FakeLedger:
+    def __init__(self):
+        self.rows = []
+
+    def record(self, model_name, response, outcome, max_output_tokens, **kwargs):
+        self.rows.append(kwargs)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(batching, "get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    fake = FakeGemini()
+    monkeypatch.setattr(inference.engine, "generate", fake.generate)
+    return fake
+
+
+@pytest.fixture
+def ledger(monkeypatch):
+    fake = FakeLedger()
+    monkeypatch.setattr(batching, "token_ledger", fake)
+    return fake
+
+
+def submit_concurrently(batcher, patients):
+    """Submit (user_id, symptoms) pairs from one thread each; returns results in input order."""
+    results = [None] * len(patients)
+
+    def run(index, user_id, symptoms):
+        with usage_context(user_id, consultation_id=100 + user_id, source="worker"):
+            results[index] = batcher.submit(symptoms, ["gemini-test"])
+
+    threads = [threading.Thread(target=run, args=(i, user_id, symptoms))
+               for i, (user_id, symptoms) in enumerate(patients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(WAIT)
+    return results
+
+
+def test_concurrent_submits_share_one_call(redis, gemini, ledger):
+    batcher = MicroBatcher(enabled=True, window=WAIT, max_items=3)
+    results = submit_concurrently(batcher, [(1, "fever"), (2, "rash"), (3, "cough")])
+
+    assert [r["diagnosis"] for r in results] == ["Diagnosis for fever", "Diagnosis for rash",
+                                                  "Diagnosis for cough"]
+    assert all(r["status"] == "success" for r in results)
+    assert len(gemini.prompts) == 1
+    # Each patient is charged a third of the call, under their own user and consultation
+    assert sorted((row["user_id"], row["consultation_id"]) for row in ledger.rows) == [(1, 101), (2, 102), (3, 103)]
+    assert all(row["share"] == pytest.approx(1 / 3) and row["source"] == "batch" for row in ledger.rows)
+    assert redis.llen(PENDING_KEY) == 0
+    assert not redis.exists(LEADER_KEY)
+
+
+def test_single_item_is_sent_after_the_window(redis, gemini, ledger):
+    batcher = MicroBatcher(enabled=True, window=0.05, max_items=4)
+    with usage_context(7, consultation_id=70):
+        result = batcher.submit("headache", ["gemini-test"])
+    assert result["diagnosis"] == "Diagnosis for headache"
+    assert len(gemini.prompts) == 1
+    assert [(row["user_id"], row["share"]) for row in ledger.rows] == [(7, 1)]
+
+
+def test_leader_failure_releases_every_waiter_at_once(monkeypatch, redis, ledger):
+    batcher = MicroBatcher(enabled=True, window=WAIT, max_items=2)
+
+    def fail(items, models_to_try):
+        raise RuntimeError("prompt could not be built")
+
+    monkeypatch.setattr(batcher, "_call", fail)
+    started = time.monotonic()
+    results = submit_concurrently(batcher, [(1, "fever"), (2, "rash")])
+
+    # Both fall back to the single-prompt path instead of waiting out the result timeout
+    assert results == [None, None]
+    assert time.monotonic() - started < WAIT
+    assert redis.llen(PENDING_KEY) == 0
+    assert not redis.exists(LEADER_KEY)
+
+
+def test_item_missing_from_the_answer_falls_back(monkeypatch, redis, ledger):
+    batcher = MicroBatcher(enabled=True, window=0.05, max_items=4)
+    monkeypatch.setattr(inference.engine, "generate", lambda *args, **kwargs: SimpleNamespace(
+        text="[]", candidates=[], usage_metadata=None))
+    assert batcher.submit("fever", ["gemini-test"]) is None
+
+
+def test_without_redis_nothing_is_batched(monkeypatch, gemini):
+    monkeypatch.setattr(batching, "get_redis", lambda: None)
+    assert MicroBatcher(enabled=True).submit("fever", ["gemini-test"]) is None
+    assert gemini.prompts == []
@@ -0,0 +1,184 @@
+import datetime
+import time
+
+import pytest
+
+from consultation_writer import ConsultationWriter
+from models import STATUS_ERROR, STATUS_PENDING, STATUS_SUCCESS, Consultation, User
+
+WAIT = 5
+
+
+def diagnosis(name):
+    return {"status": "success", "diagnosis": name, "consult_doctor": "GP",
+            "conditions": [{"name": name, "severity": "medium"}]}
+
+
+@pytest.fixture
+def consultations(session_factory):
+    """Three pending job consultations; returns their ids."""
+    db = session_factory()
+    user = User(email="patient@example.com")
+    db.add(user)
+    db.flush()
+    rows = [Consultation(user_id=user.id, symptoms=f"symptom {i}", status=STATUS_PENDING, task_id=f"task-{i}")
+            for i in range(3)]
+    db.add_all(rows)
+    db.commit()
+    ids = [row.id for row in rows]
+    db.close()
+    return ids
+
+
+def statuses(session_factory):
+    db = session_factory()
+    try:
+        return {row.id: (row.status, row.top_diagnosis) for row in db.query(Consultation)}
+    finally:
+        db.close()
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + WAIT
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class FlakySessions:
+    """Session factory whose next `failures` sessions fail on execute."""
+
+    def __init__(self, factory, failures=0):
+        self.factory = factory
+        self.failures = failures
+
+    def __call__(self):
+        db = self.factory()
+        if self.failures:
+            self.failures -= 1
+
+            def execute(*args, **kwargs):
+                raise ConnectionError("database went away")
+            db.execute = execute
+        return db
+
+
+def test_results_are_buffered_until_flush(session_factory, consultations):
+    writer = ConsultationWriter(session_factory, enabled=True, max_batch=10, max_delay=60)
+    writer.submit(consultations[0], diagnosis("Flu"))
+    writer.submit(consultations[1], {"status": "error", "error": "All models failed"})
+    assert statuses(session_factory)[consultations[0]] == (STATUS_PENDING, None)
+
+    assert writer.flush() == 2
+    assert statuses(session_factory) == {
+        consultations[0]: (STATUS_SUCCESS, "Flu"),
+        consultations[1]: (STATUS_ERROR, None),
+        consultations[2]: (STATUS_PENDING, None),
+    }
+    assert writer.flush() == 0
+
+
+def test_full_batch_is_written_without_waiting_for_the_delay(session_factory, consultations):
+    writer = ConsultationWriter(session_factory, enabled=True, max_batch=2, max_delay=60)
+    writer.submit(consultations[0], diagnosis("Flu"))
+    writer.submit(consultations[1], diagnosis("Cold"))
+    assert wait_until(lambda: statuses(session_factory)[consultations[1]][0] == STATUS_SUCCESS)
+    writer.close()
+
+
+def test_partial_batch_is_written_after_the_delay(session_factory, consultations):
+    writer = ConsultationWriter(session_factory, enabled=True, max_batch=10, max_delay=0.05)
+    writer.submit(consultations[0], diagnosis("Flu"))
+    assert wait_until(lambda: statuses(session_factory)[consultations[0]] == (STATUS_SUCCESS, "Flu"))
+    writer.close()
+
+
+def test_failed_flush_keeps_its_rows_for_the_next_one(session_factory, consultations):
+    sessions = FlakySessions(session_factory, failures=1)
+    writer = ConsultationWriter(sessions, enabled=True, max_batch=10, max_delay=60)
+    writer.submit(consultations[0], diagnosis("Flu"))
+    writer.submit(consultations[1], diagnosis("Cold"))
+    assert writer.flush() == 0
+    assert statuses(session_factory)[consultations[0]] == (STATUS_PENDING, None)
+
+    # A newer result for a retained row wins over the failed batch's copy
+    writer.submit(consultations[1], diagnosis("Migraine"))
+    writer.submit(consultations[2], diagnosis("Rash"))
+    assert writer.flush() == 3
+    assert statuses(session_factory) == {
+        consultations[0]: (STATUS_SUCCESS, "Flu"),
+        consultations[1]: (STATUS_SUCCESS, "Migraine"),
+        consultations[2]: (STATUS_SUCCESS, "Rash"),
+    }
+
+
+def test_close_writes_what_is_left(session_factory, consultations):
+    writer = ConsultationWriter(session_factory, enabled=True, max_batch=10, max_delay=60)
+    writer.submit(consultations[0], diagnosis("Flu"))
+    writer.close()
+    assert statuses(session_factory)[consultations[0]] == (STATUS_SUCCESS, "Flu")
+
+    # After close, results are written straight away
+    writer.submit(consultations[1], diagnosis("Cold"))
+    assert statuses(session_factory)[consultations[1]] == (STATUS_SUCCESS, "Cold")
+
+
+def test_disabled_writer_writes_immediately(session_factory, consultations):
+    writer = ConsultationWriter(session_factory, enabled=False)
+    writer.submit(consultations[0], diagnosis("Flu"))
+    assert statuses(session_factory)[consultations[0]] == (STATUS_SUCCESS, "Flu")
+
+
+def test_deleted_row_does_not_fail_the_batch(session_factory, consultations):
+    db = session_factory()
+    db.query(Consultation).filter(Consultation.id == consultations[0]).delete()
+    db.commit()
+    db.close()
+    writer = ConsultationWriter(session_factory, enabled=True, max_batch=10, max_delay=60)
+    writer.submit(consultations[0], diagnosis("Flu"))
+    writer.submit(consultations[1], diagnosis("Cold"))
+    assert writer.flush() == 2
+    assert statuses(session_factory)[consultations[1]] == (STATUS_SUCCESS, "Cold")
+
+
+class FakeResult:
+    def __init__(self, state, result=None):
+        self.state = state
+        self.result = result
+
+
+def test_reconcile_writes_finished_tasks_left_pending(monkeypatch, session_factory, consultations):
+    import worker
+
+    db = session_factory()
+    old = datetime.datetime.utcnow() - datetime.timedelta(seconds=worker.CONSULTATION_RECONCILE_AFTER + 60)
+    for consultation_id in consultations:
+        db.get(Consultation, consultation_id).created_at = old
+    fresh = Consultation(user_id=1, symptoms="just queued", status=STATUS_PENDING, task_id="task-fresh")
+    db.add(fresh)
+    db.commit()
+    fresh_id = fresh.id
+    db.close()
+
+    results = {
+        "task-0": FakeResult("SUCCESS", diagnosis("Flu")),
+        "task-1": FakeResult("FAILURE", RuntimeError("worker crashed")),
+        "task-2": FakeResult("STARTED"),
+        "task-fresh": FakeResult("SUCCESS", diagnosis("Cold")),
+    }
+    monkeypatch.setattr(worker, "SessionLocal", session_factory)
+    monkeypatch.setattr(worker, "consultation_writer", ConsultationWriter(session_factory, enabled=True))
+    monkeypatch.setattr(worker.celery_app, "AsyncResult", lambda task_id: results[task_id])
+
+    worker.reconcile_consultations()
+    assert statuses(session_factory) == {
+        consultations[0]: (STATUS_SUCCESS, "Flu"),
+        consultations[1]: (STATUS_ERROR, None),
+        consultations[2]: (STATUS_PENDING, None),  # still running
+        fresh_id: (STATUS_PENDING, None),          # too recent to be suspect
+    }
+    db = session_factory()
+    assert db.get(Consultation, consultations[1]).diagnosis["error"] == "worker crashed"
+    db.close()
@@ -0,0 +1,26 @@
+import database
+from database import _async_url, sync_engine_kwargs
+
+
+def test_postgres_engines_get_pool_settings_and_statement_timeout(monkeypatch):
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 15000)
+    kwargs = sync_engine_kwargs("postgresql://user:secret@db:5432/medifusion")
+    assert kwargs["pool_size"] == database.DB_POOL_SIZE
+    assert kwargs["pool_timeout"] == database.DB_POOL_TIMEOUT
+    assert kwargs["pool_recycle"] == database.DB_POOL_RECYCLE
+    assert kwargs["connect_args"] == {"options": "-c statement_timeout=15000"}
+
+
+def test_statement_timeout_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(database, "DB_STATEMENT_TIMEOUT_MS", 0)
+    assert "connect_args" not in sync_engine_kwargs("postgresql://db/medifusion")
+
+
+def test_sqlite_only_waits_on_the_file_lock():
+    assert sync_engine_kwargs("sqlite:///local.db") == {"connect_args": {"timeout": database.DB_POOL_TIMEOUT}}
+
+
+def test_async_url_maps_the_driver():
+    assert _async_url("postgresql://db/medifusion") == "postgresql+asyncpg://db/medifusion"
+    assert _async_url("postgresql+psycopg2://db/medifusion") == "postgresql+asyncpg://db/medifusion"
+    assert _async_url("sqlite:///local.db") == "sqlite+aiosqlite:///local.db"
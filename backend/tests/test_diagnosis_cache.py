@@ -0,0 +1,51 @@
+import pytest
+
+import diagnosis_cache
+from diagnosis_cache import DiagnosisCache, cache_key, canonicalize_symptoms
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(diagnosis_cache, "get_redis", lambda: None)
+    return DiagnosisCache(max_size=2, enabled=True)
+
+
+def test_canonical_form_ignores_order_case_and_punctuation():
+    assert canonicalize_symptoms("Fever, headache!") == "fever headache"
+    assert canonicalize_symptoms("headache   FEVER") == "fever headache"
+
+
+def test_canonical_form_drops_stopwords_and_duplicates():
+    assert canonicalize_symptoms("I have a fever and a fever") == "fever"
+
+
+def test_negation_binds_to_the_next_symptom():
+    assert canonicalize_symptoms("no fever, cough") == "cough no_fever"
+    assert cache_key("no fever", "m") != cache_key("fever", "m")
+
+
+def test_key_depends_on_model_and_prompt_version():
+    assert cache_key("fever", "a") == cache_key("Fever.", "a")
+    assert cache_key("fever", "a") != cache_key("fever", "b")
+    assert cache_key("fever", "a", prompt_version="1") != cache_key("fever", "a", prompt_version="2")
+
+
+def test_equivalent_symptoms_share_an_entry(cache):
+    cache.set("fever, cough", "m", {"status": "success", "diagnosis": "Flu"})
+    assert cache.get("Cough and fever", "m")["diagnosis"] == "Flu"
+    assert cache.get("cough", "m") is None
+
+
+def test_errors_and_truncated_documents_are_not_cached(cache):
+    cache.set("fever", "m", {"status": "error", "error": "boom"})
+    cache.set("cough", "m", {"status": "success", "diagnosis": "Flu", "truncated": True})
+    assert cache.get("fever", "m") is None
+    assert cache.get("cough", "m") is None
+
+
+def test_local_tier_evicts_least_recently_used(cache):
+    for symptoms in ("fever", "cough", "rash"):
+        cache.set(symptoms, "m", {"status": "success", "diagnosis": symptoms})
+    assert cache.get("fever", "m") is None
+    assert cache.get("rash", "m")["diagnosis"] == "rash"
+    assert cache.stats()["evictions"] == 1
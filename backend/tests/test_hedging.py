@@ -0,0 +1,152 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import hedging
+import inference
+from hedging import HedgePolicy
+from inference import InferenceEngine, InferenceError
+from rate_limiter import GeminiRateLimiter
+
+PRIMARY = "gemini-primary"
+BACKUP = "gemini-backup"
+WAIT = 5  # upper bound on any wait in these tests; none should get near it
+
+
+def answer(diagnosis, finish="STOP"):
+    return SimpleNamespace(
+        text=json.dumps({"diagnosis": diagnosis, "conditions": []}),
+        candidates=[SimpleNamespace(finish_reason=finish)],
+        usage_metadata=None,
+    )
+
+
+class FakeModel:
+    """Stands in for a GenerativeModel; `behaviour` returns a response or raises."""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        self.calls += 1
+        return self.behaviour()
+
+
+class FakeLedger:
+    def __init__(self):
+        self.rows = []
+        self.recorded = {PRIMARY: threading.Event(), BACKUP: threading.Event()}
+
+    def record(self, model_name, *args, **kwargs):
+        self.rows.append((model_name, kwargs))
+        self.recorded[model_name].set()
+
+
+class Hedge:
+    """A race between FakeModels with a hedge policy and ledger the test can inspect."""
+
+    def __init__(self, monkeypatch, primary, backup, burst=5):
+        monkeypatch.setenv("GEMINI_API_KEY", "test-key")
+        monkeypatch.setattr(hedging, "GEMINI_HEDGE_DEFAULT_DELAY", 0.05)
+        self.engine = InferenceEngine()
+        self.engine._configured_key = "test-key"
+        self.models = {PRIMARY: FakeModel(primary), BACKUP: FakeModel(backup)}
+        monkeypatch.setattr(self.engine, "get_model", lambda name: self.models[name])
+
+        self.limiter = GeminiRateLimiter()
+        monkeypatch.setattr(inference, "rate_limiter", self.limiter)
+        monkeypatch.setattr("rate_limiter.get_redis", lambda: None)
+        self.ledger = FakeLedger()
+        monkeypatch.setattr(inference, "token_ledger", self.ledger)
+
+        self.policy = HedgePolicy(enabled=True, ratio=0, burst=burst)
+        self.outcomes = []
+        self.hedge_asked = threading.Event()
+        self.quota_skipped = threading.Event()
+        try_hedge, record = self.policy.try_hedge, self.policy.record
+
+        def tracked_try_hedge(model_name):
+            allowed = try_hedge(model_name)
+            self.outcomes.append("fired" if allowed else "skipped_budget")
+            self.hedge_asked.set()
+            return allowed
+
+        def tracked_record(model_name, outcome):
+            record(model_name, outcome)
+            self.outcomes.append(outcome)
+            if outcome == "skipped_quota":
+                self.quota_skipped.set()
+
+        self.policy.try_hedge, self.policy.record = tracked_try_hedge, tracked_record
+        monkeypatch.setattr(inference, "hedge_policy", self.policy)
+
+    def run(self):
+        return self.engine.run_models("mild cough", [PRIMARY, BACKUP])
+
+
+def test_primary_answering_before_the_delay_is_not_hedged(monkeypatch):
+    hedge = Hedge(monkeypatch, primary=lambda: answer("Cold"), backup=lambda: answer("Flu"))
+    monkeypatch.setattr(hedging, "GEMINI_HEDGE_DEFAULT_DELAY", WAIT)
+    assert hedge.run()["diagnosis"] == "Cold"
+    assert hedge.models[BACKUP].calls == 0
+    assert hedge.outcomes == []
+    assert hedge.ledger.rows == [(PRIMARY, {})]
+
+
+def test_backup_wins_and_the_loser_starts_no_further_calls(monkeypatch):
+    release = threading.Event()
+
+    def slow_truncated():
+        release.wait(WAIT)
+        return answer("Cold", finish="MAX_TOKENS")
+
+    hedge = Hedge(monkeypatch, primary=slow_truncated, backup=lambda: answer("Flu"))
+    assert hedge.run()["diagnosis"] == "Flu"
+    assert hedge.outcomes == ["fired", "backup_won"]
+
+    # The primary answers after the race was decided: truncated, but it must
+    # not escalate, and its usage is inserted on its own
+    release.set()
+    assert hedge.ledger.recorded[PRIMARY].wait(WAIT)
+    assert hedge.ledger.rows == [(BACKUP, {}), (PRIMARY, {"pending": None})]
+    assert hedge.models[PRIMARY].calls == 1
+
+
+def test_exhausted_budget_waits_for_the_primary(monkeypatch):
+    hedge = Hedge(monkeypatch, primary=lambda: hedge.hedge_asked.wait(WAIT) and answer("Cold"),
+                  backup=lambda: answer("Flu"), burst=0)
+    assert hedge.run()["diagnosis"] == "Cold"
+    assert hedge.outcomes == ["skipped_budget"]
+    assert hedge.models[BACKUP].calls == 0
+
+
+def test_backup_without_a_free_permit_is_skipped(monkeypatch):
+    hedge = Hedge(monkeypatch, primary=lambda: hedge.quota_skipped.wait(WAIT) and answer("Cold"),
+                  backup=lambda: answer("Flu"))
+    hedge.limiter.rpm_limits = {BACKUP: 1}
+    hedge.limiter.reserve(BACKUP, max_wait=0)  # the backup's only permit this minute
+    assert hedge.run()["diagnosis"] == "Cold"
+    assert hedge.outcomes == ["fired", "skipped_quota", "primary_won"]
+    assert hedge.models[BACKUP].calls == 0
+
+
+def test_both_failing_raises(monkeypatch):
+    backup_failed = threading.Event()
+
+    def primary():
+        backup_failed.wait(WAIT)
+        raise RuntimeError("primary down")
+
+    def backup():
+        backup_failed.set()
+        raise RuntimeError("backup down")
+
+    hedge = Hedge(monkeypatch, primary=primary, backup=backup)
+    with pytest.raises(InferenceError) as excinfo:
+        hedge.run()
+    assert " down" in str(excinfo.value)
+    assert hedge.outcomes == ["fired", "both_failed"]
+    assert hedge.ledger.rows == []
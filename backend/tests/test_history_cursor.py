@@ -0,0 +1,35 @@
+import base64
+import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from routers.disease import _decode_cursor, _encode_cursor
+
+
+@pytest.mark.parametrize("created_at", [
+    datetime.datetime(2024, 3, 1, 12, 30, 15, 123456),
+    datetime.datetime(2024, 3, 1, 12, 30, tzinfo=datetime.timezone.utc),
+])
+def test_cursor_round_trips(created_at):
+    cursor = _encode_cursor(created_at, 42)
+    assert _decode_cursor(cursor) == (created_at, 42)
+
+
+def test_cursor_is_url_safe():
+    cursor = _encode_cursor(datetime.datetime(2024, 3, 1), 10 ** 12)
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    base64.urlsafe_b64encode(b'["yesterday", 1]').decode(),
+    base64.urlsafe_b64encode(b'["2024-03-01T00:00:00", "x"]').decode(),
+    base64.urlsafe_b64encode(b'["2024-03-01T00:00:00", 1, 2]').decode(),
+])
+def test_malformed_cursor_is_a_400(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        _decode_cursor(cursor)
+    assert excinfo.value.status_code == 400
@@ -0,0 +1,72 @@
+import json
+
+import pytest
+from fastapi import HTTPException
+
+import idempotency
+from fake_redis import BrokenRedis, FakeRedis
+from routers.disease import _idempotent_replay
+
+FINGERPRINT = idempotency.fingerprint("fever and cough")
+RESPONSE = {"status": "SUCCESS", "result": {"diagnosis": "Flu"}, "consultation_id": 7}
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(idempotency, "get_redis", lambda: client)
+    return client
+
+
+def test_first_request_claims_the_key(redis):
+    assert idempotency.claim("predict", 1, "key-1", FINGERPRINT) is None
+    stored = json.loads(redis.get("idempotency:predict:1:key-1"))
+    assert stored == {"state": idempotency.IN_PROGRESS, "fingerprint": FINGERPRINT}
+    assert redis.ttls["idempotency:predict:1:key-1"] == idempotency.IDEMPOTENCY_LOCK_TTL
+
+
+def test_retry_while_in_progress_is_a_409(redis):
+    idempotency.claim("predict", 1, "key-1", FINGERPRINT)
+    record = idempotency.claim("predict", 1, "key-1", FINGERPRINT)
+    with pytest.raises(HTTPException) as excinfo:
+        _idempotent_replay(record, FINGERPRINT)
+    assert excinfo.value.status_code == 409
+    assert excinfo.value.headers["Retry-After"] == "2"
+
+
+def test_retry_after_completion_replays_the_response(redis):
+    idempotency.claim("predict", 1, "key-1", FINGERPRINT)
+    idempotency.complete("predict", 1, "key-1", FINGERPRINT, RESPONSE)
+    record = idempotency.claim("predict", 1, "key-1", FINGERPRINT)
+    assert _idempotent_replay(record, FINGERPRINT) == RESPONSE
+    assert redis.ttls["idempotency:predict:1:key-1"] == idempotency.IDEMPOTENCY_TTL
+
+
+def test_key_reused_for_another_request_is_a_422(redis):
+    idempotency.claim("predict", 1, "key-1", FINGERPRINT)
+    idempotency.complete("predict", 1, "key-1", FINGERPRINT, RESPONSE)
+    other = idempotency.fingerprint("rash")
+    record = idempotency.claim("predict", 1, "key-1", other)
+    with pytest.raises(HTTPException) as excinfo:
+        _idempotent_replay(record, other)
+    assert excinfo.value.status_code == 422
+
+
+def test_keys_are_scoped_per_user(redis):
+    idempotency.claim("predict", 1, "key-1", FINGERPRINT)
+    assert idempotency.claim("predict", 2, "key-1", FINGERPRINT) is None
+
+
+def test_release_lets_the_client_retry(redis):
+    idempotency.claim("predict", 1, "key-1", FINGERPRINT)
+    idempotency.release("predict", 1, "key-1")
+    assert idempotency.claim("predict", 1, "key-1", FINGERPRINT) is None
+
+
+@pytest.mark.parametrize("client", [None, BrokenRedis()])
+def test_without_redis_every_request_proceeds(monkeypatch, client):
+    monkeypatch.setattr(idempotency, "get_redis", lambda: client)
+    assert idempotency.claim("predict", 1, "key-1", FINGERPRINT) is None
+    assert idempotency.claim("predict", 1, "key-1", FINGERPRINT) is None
+    idempotency.complete("predict", 1, "key-1", FINGERPRINT, RESPONSE)
+    idempotency.release("predict", 1, "key-1")
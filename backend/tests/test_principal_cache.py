@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import principal_cache
+from fake_redis import BrokenRedis, FakeRedis
+from models import User
+from principal_cache import PrincipalCache, REDIS_KEY_PREFIX
+
+EMAIL = "patient@example.com"
+
+
+def user(**overrides):
+    columns = dict(id=1, email=EMAIL, hashed_password="$2b$12$secret", full_name="Pat", age=40, height="170 cm",
+                   weight="70 kg", blood_type="A+", timezone="UTC", role="patient", hospital_name=None,
+                   certifications=None)
+    columns.update(overrides)
+    return User(**columns)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(principal_cache, "get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(principal_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_hashed_password_is_never_cached(redis):
+    cache = PrincipalCache(enabled=True)
+    snapshot = cache.set(EMAIL, user())
+    assert "hashed_password" not in snapshot
+    assert "hashed_password" not in json.loads(redis.get(REDIS_KEY_PREFIX + EMAIL))
+    assert "hashed_password" not in cache.get(EMAIL)
+    assert b"secret" not in redis.get(REDIS_KEY_PREFIX + EMAIL)
+
+
+def test_local_tier_expires_after_its_ttl(monkeypatch, clock):
+    monkeypatch.setattr(principal_cache, "get_redis", lambda: None)
+    cache = PrincipalCache(local_ttl=5, enabled=True)
+    cache.set(EMAIL, user())
+    clock.now += 4.9
+    assert cache.get(EMAIL)["full_name"] == "Pat"
+    clock.now += 0.2
+    assert cache.get(EMAIL) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_local_miss_falls_back_to_redis_and_refills_the_local_tier(redis, clock):
+    cache = PrincipalCache(local_ttl=5, enabled=True)
+    cache.set(EMAIL, user())
+    clock.now += 10  # local copy expired, Redis (300s) still has it
+    assert cache.get(EMAIL)["full_name"] == "Pat"
+    redis.delete(REDIS_KEY_PREFIX + EMAIL)
+    assert cache.get(EMAIL)["full_name"] == "Pat"  # served locally again
+    assert cache.stats()["hits_redis"] == 1
+    assert cache.stats()["hits_local"] == 1
+    assert redis.ttls[REDIS_KEY_PREFIX + EMAIL] == principal_cache.PRINCIPAL_CACHE_TTL
+
+
+def test_broken_redis_degrades_to_a_miss(monkeypatch):
+    monkeypatch.setattr(principal_cache, "get_redis", lambda: BrokenRedis())
+    cache = PrincipalCache(enabled=True)
+    assert cache.get(EMAIL) is None
+    cache.set(EMAIL, user())
+    assert cache.get(EMAIL)["email"] == EMAIL  # the local tier still works
+    cache.invalidate(EMAIL)
+    assert cache.get(EMAIL) is None
+
+
+def test_returned_snapshots_are_copies(redis):
+    cache = PrincipalCache(enabled=True)
+    cache.set(EMAIL, user())
+    cache.get(EMAIL)["full_name"] = "Changed by a caller"
+    assert cache.get(EMAIL)["full_name"] == "Pat"
+
+
+def test_disabled_cache_never_hits(redis):
+    cache = PrincipalCache(enabled=False)
+    cache.set(EMAIL, user())
+    assert cache.get(EMAIL) is None
+    assert redis.get(REDIS_KEY_PREFIX + EMAIL) is None
+
+
+@pytest.fixture
+def client(monkeypatch, session_factory, redis):
+    """The auth router on a SQLite database holding one user, with a fresh principal cache."""
+    from database import get_async_db
+    from routers import auth
+
+    db = session_factory()
+    db.add(user())
+    db.commit()
+    db.close()
+    url = str(session_factory.kw["bind"].url).replace("sqlite://", "sqlite+aiosqlite://")
+    async_engine = create_async_engine(url)
+    sessions = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+    async def override_db():
+        async with sessions() as session:
+            yield session
+
+    monkeypatch.setattr(auth, "principal_cache", PrincipalCache(enabled=True))
+    app = FastAPI()
+    app.include_router(auth.router, prefix="/api")
+    app.dependency_overrides[get_async_db] = override_db
+    token = auth.create_access_token(data={"sub": EMAIL})
+    with TestClient(app, headers={"Authorization": f"Bearer {token}"}) as test_client:
+        yield test_client
+    asyncio.run(async_engine.dispose())
+
+
+def test_profile_update_invalidates_the_cached_principal(client, redis):
+    assert client.get("/api/me").json()["full_name"] == "Pat"
+    assert json.loads(redis.get(REDIS_KEY_PREFIX + EMAIL))["full_name"] == "Pat"
+
+    assert client.put("/api/me", json={"full_name": "Patricia"}).status_code == 200
+    assert redis.get(REDIS_KEY_PREFIX + EMAIL) is None
+    assert client.get("/api/me").json()["full_name"] == "Patricia"
+    assert json.loads(redis.get(REDIS_KEY_PREFIX + EMAIL))["full_name"] == "Patricia"
@@ -0,0 +1,60 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import GeminiRateLimiter, RateLimitExceeded, _parse_limits
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    # No Redis: every reservation goes through the per-process bucket
+    monkeypatch.setattr(rate_limiter, "get_redis", lambda: None)
+    monkeypatch.setenv("GEMINI_RPM_LIMITS", "gemini-1.5-flash=60,gemini-1.5-flash-8b=6")
+    monkeypatch.setenv("GEMINI_TPM_LIMITS", "gemini-1.5-flash=6000")
+    return GeminiRateLimiter()
+
+
+def test_parse_limits_skips_malformed_parts():
+    assert _parse_limits("a=1, b = 2,junk,") == {"a": 1, "b": 2}
+    assert _parse_limits("") == {}
+
+
+def test_budget_uses_the_longest_matching_family(limiter):
+    assert limiter.budgets("models/gemini-1.5-flash-002") == (60, 6000)
+    assert limiter.budgets("gemini-1.5-flash-8b")[0] == 6
+    assert limiter.budgets("gemini-unknown") == (rate_limiter.GEMINI_DEFAULT_RPM, rate_limiter.GEMINI_DEFAULT_TPM)
+
+
+def test_full_bucket_grants_without_waiting(limiter):
+    assert limiter.reserve("gemini-1.5-flash-8b", max_wait=0) == 0
+
+
+def test_empty_bucket_queues_callers_in_order(limiter):
+    for _ in range(6):
+        limiter.reserve("gemini-1.5-flash-8b", max_wait=0)
+    # 6 rpm refills one request every 10s; each reservation queues behind the last
+    first = limiter.reserve("gemini-1.5-flash-8b", max_wait=60)
+    second = limiter.reserve("gemini-1.5-flash-8b", max_wait=60)
+    assert first == pytest.approx(10, abs=0.5)
+    assert second == pytest.approx(20, abs=0.5)
+
+
+def test_wait_beyond_max_wait_raises_and_reserves_nothing(limiter):
+    for _ in range(6):
+        limiter.reserve("gemini-1.5-flash-8b", max_wait=0)
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.reserve("gemini-1.5-flash-8b", max_wait=1)
+    assert excinfo.value.retry_after == pytest.approx(10, abs=0.5)
+    # The refused call left the queue as it was
+    assert limiter.reserve("gemini-1.5-flash-8b", max_wait=60) == pytest.approx(10, abs=0.5)
+
+
+def test_token_bucket_limits_large_prompts(limiter):
+    assert limiter.reserve("gemini-1.5-flash", tokens=6000, max_wait=0) == 0
+    # 6000 tpm refills 100 tokens a second
+    assert limiter.reserve("gemini-1.5-flash", tokens=300, max_wait=60) == pytest.approx(3, abs=0.5)
+
+
+def test_families_have_separate_buckets(limiter):
+    for _ in range(6):
+        limiter.reserve("gemini-1.5-flash-8b", max_wait=0)
+    assert limiter.reserve("gemini-1.5-flash", max_wait=0) == 0
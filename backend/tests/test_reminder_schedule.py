@@ -0,0 +1,57 @@
+import datetime
+
+import pytest
+
+from reminder_schedule import UTC, next_fire_time
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=UTC)
+
+
+def test_daily_fires_later_today_or_tomorrow():
+    assert next_fire_time("09:00", "Daily", "UTC", utc(2024, 5, 1, 8, 0)) == utc(2024, 5, 1, 9, 0)
+    assert next_fire_time("09:00", "Daily", "UTC", utc(2024, 5, 1, 9, 0)) == utc(2024, 5, 2, 9, 0)
+
+
+def test_naive_after_is_read_as_utc():
+    assert next_fire_time("09:00", "daily", None, datetime.datetime(2024, 5, 1, 8, 0)) == utc(2024, 5, 1, 9, 0)
+
+
+def test_local_time_is_converted_in_the_users_zone():
+    # 08:00 in Kolkata (UTC+5:30) is 02:30 UTC
+    assert next_fire_time("08:00", "daily", "Asia/Kolkata", utc(2024, 5, 1, 0, 0)) == utc(2024, 5, 1, 2, 30)
+    # Already past locally: next local day
+    assert next_fire_time("08:00", "daily", "Asia/Kolkata", utc(2024, 5, 1, 3, 0)) == utc(2024, 5, 2, 2, 30)
+
+
+def test_twice_daily_fires_every_twelve_hours():
+    assert next_fire_time("08:00", "Twice Daily", "UTC", utc(2024, 5, 1, 9, 0)) == utc(2024, 5, 1, 20, 0)
+    assert next_fire_time("08:00", "Twice Daily", "UTC", utc(2024, 5, 1, 21, 0)) == utc(2024, 5, 2, 8, 0)
+
+
+def test_weekly_fires_on_the_anchor_weekday():
+    anchor = utc(2024, 5, 1, 7, 0)  # a Wednesday
+    assert next_fire_time("09:00", "Weekly", "UTC", utc(2024, 5, 1, 10, 0), anchor=anchor) == utc(2024, 5, 8, 9, 0)
+    assert next_fire_time("09:00", "Weekly", "UTC", utc(2024, 5, 6, 0, 0), anchor=anchor) == utc(2024, 5, 8, 9, 0)
+
+
+def test_wall_clock_time_is_kept_across_dst():
+    # New York switches to daylight time on 2024-03-10: 09:00 EST is 14:00 UTC, 09:00 EDT is 13:00 UTC
+    assert next_fire_time("09:00", "daily", "America/New_York", utc(2024, 3, 9, 15, 0)) == utc(2024, 3, 10, 13, 0)
+    assert next_fire_time("09:00", "daily", "America/New_York", utc(2024, 3, 9, 12, 0)) == utc(2024, 3, 9, 14, 0)
+
+
+def test_unknown_zone_and_frequency_fall_back_to_utc_daily():
+    assert next_fire_time("09:00", "every so often", "Mars/Base", utc(2024, 5, 1, 10, 0)) == utc(2024, 5, 2, 9, 0)
+
+
+@pytest.mark.parametrize("reminder_time, frequency", [
+    ("09:00", "As Needed"),
+    ("", "daily"),
+    (None, "daily"),
+    ("nine", "daily"),
+    ("25:00", "daily"),
+])
+def test_unschedulable_medicines_have_no_fire_time(reminder_time, frequency):
+    assert next_fire_time(reminder_time, frequency, "UTC", utc(2024, 5, 1)) is None
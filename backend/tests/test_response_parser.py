@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from diagnosis_schema import Condition
+from response_parser import ResponseParseError, parse_batch, parse_diagnosis, repair_truncated_json, strip_fences
+
+DOCUMENT = {
+    "diagnosis": "Migraine",
+    "conditions": [{"name": "Migraine", "confidence": 70, "severity": "medium", "reasoning": "aura"}],
+    "tips": ["Hydrate", "Sleep"],
+}
+
+
+def test_strip_fences():
+    assert strip_fences('```json\n{"a": 1}\n```') == '{"a": 1}'
+    assert strip_fences('```\n[1]\n```') == '[1]'
+    assert strip_fences('  {"a": 1} ') == '{"a": 1}'
+
+
+def test_complete_document_is_not_marked():
+    diagnosis = parse_diagnosis(json.dumps(DOCUMENT))
+    assert diagnosis["diagnosis"] == "Migraine"
+    assert "truncated" not in diagnosis
+
+
+def test_truncated_document_keeps_finished_values_and_is_marked():
+    text = json.dumps(DOCUMENT)
+    diagnosis = parse_diagnosis(text[:text.index("Sleep") + 2])
+    assert diagnosis["truncated"] is True
+    assert diagnosis["tips"] == ["Hydrate"]
+    assert diagnosis["conditions"][0]["name"] == "Migraine"
+
+
+def test_repair_handles_escapes_and_brackets_inside_strings():
+    text = '{"diagnosis": "A \\"quoted\\" [x] {y}", "tips": ["one", "tw'
+    assert json.loads(repair_truncated_json(text)) == {"diagnosis": 'A "quoted" [x] {y}', "tips": ["one"]}
+
+
+def test_repair_leaves_complete_or_mismatched_json_alone():
+    assert repair_truncated_json('{"a": 1}') is None
+    assert repair_truncated_json('{"a": [1}') is None
+
+
+@pytest.mark.parametrize("text", ["", "not json", "[1, 2]", '{"conditions": []}', '{"diagn'])
+def test_unusable_output_raises(text):
+    with pytest.raises(ResponseParseError):
+        parse_diagnosis(text)
+
+
+def test_validation_coerces_model_quirks():
+    diagnosis = parse_diagnosis(json.dumps({
+        "diagnosis": "Flu",
+        "tips": "Rest",
+        "precautions": None,
+        "conditions": [{"name": "Flu", "severity": "HIGH"}, {"name": "  "}, {"name": "Cold", "severity": "mild"}],
+    }))
+    assert diagnosis["tips"] == ["Rest"]
+    assert diagnosis["precautions"] == []
+    assert [(c["name"], c["severity"]) for c in diagnosis["conditions"]] == [("Flu", "high"), ("Cold", None)]
+
+
+@pytest.mark.parametrize("raw, expected", [
+    (85, 85),
+    ("85%", 85),
+    (0.85, 85),
+    ("0.5", 50),
+    (1, 1),
+    (1.0, 1),
+    (0, 0),
+    (150, 100),
+    (-3, 0),
+    ("high", None),
+    ("", None),
+])
+def test_confidence_normalization(raw, expected):
+    assert Condition(name="x", confidence=raw).confidence == expected
+
+
+def test_batch_items_are_validated_one_by_one():
+    text = json.dumps([
+        dict(DOCUMENT, id="a"),
+        {"id": "b", "conditions": []},
+        {"diagnosis": "no id"},
+        dict(DOCUMENT, id="c"),
+    ])
+    results = parse_batch(text)
+    assert sorted(results) == ["a", "c"]
+    assert not any("truncated" in entry for entry in results.values())
+
+
+def test_truncated_batch_marks_only_the_cut_item():
+    text = json.dumps([{"id": "a", **DOCUMENT}, {"id": "b", **DOCUMENT}])
+    results = parse_batch(text[:text.rindex("Sleep")])
+    assert "truncated" not in results["a"]
+    assert results["b"]["truncated"] is True
+    assert results["b"]["tips"] == ["Hydrate"]
+
+
+def test_batch_must_be_an_array():
+    with pytest.raises(ResponseParseError):
+        parse_batch(json.dumps(DOCUMENT))
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from singleflight import AsyncSingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def main():
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"diagnosis": "Flu"}
+
+        results = await asyncio.gather(*(flight.do("fever", work) for _ in range(3)))
+        assert results == [{"diagnosis": "Flu"}] * 3
+        assert len(calls) == 1
+        assert flight.in_flight() == 0
+
+    asyncio.run(main())
+
+
+def test_exception_is_shared_and_the_key_is_freed():
+    async def main():
+        flight = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("k", fail), flight.do("k", fail), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+        assert await flight.do("k", lambda: asyncio.sleep(0, result="again")) == "again"
+
+    asyncio.run(main())
+
+
+def test_cancelled_leader_does_not_cancel_followers():
+    async def main():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+
+        leader.cancel()  # e.g. the leader's client disconnected
+        await asyncio.sleep(0)
+        release.set()
+
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert await follower == "done"
+        assert len(calls) == 1
+
+    asyncio.run(main())
+
+
+def test_call_finishes_when_every_caller_is_cancelled():
+    async def main():
+        flight = AsyncSingleFlight()
+        finished = asyncio.Event()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            finished.set()
+            raise ValueError("nobody is listening")
+
+        caller = asyncio.ensure_future(flight.do("k", work))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(finished.wait(), 1)
+        await asyncio.sleep(0)
+        assert flight.in_flight() == 0
+
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+import json
+
+from stream_parser import StreamingDiagnosisParser
+
+DOCUMENT = {
+    "diagnosis": "Influenza",
+    "conditions": [
+        {"name": "Influenza", "confidence": 80, "severity": "medium", "reasoning": "fever, \"aches\" {}"},
+        {"name": "Common cold", "confidence": 15, "severity": "low", "reasoning": "cough"},
+    ],
+    "recommended_tests": ["CBC"],
+    "consult_doctor": "General practitioner",
+    "precautions": [],
+    "tips": ["Rest"],
+}
+
+
+def feed_in_chunks(text, size):
+    parser = StreamingDiagnosisParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    return parser, events
+
+
+def test_events_do_not_depend_on_chunk_boundaries():
+    text = json.dumps(DOCUMENT)
+    _, whole = feed_in_chunks(text, len(text))
+    for size in (1, 3, 7, 64):
+        assert feed_in_chunks(text, size)[1] == whole
+
+
+def test_fields_and_conditions_are_emitted_as_they_close():
+    _, events = feed_in_chunks(json.dumps(DOCUMENT), 5)
+    assert events[0] == ("field", {"name": "diagnosis", "value": "Influenza"})
+    assert [data for kind, data in events if kind == "condition"] == DOCUMENT["conditions"]
+    fields = [data["name"] for kind, data in events if kind == "field"]
+    assert fields == ["diagnosis", "recommended_tests", "consult_doctor", "precautions", "tips"]
+
+
+def test_leading_fence_and_trailing_primitive():
+    text = '```json\n{"diagnosis": "Flu", "confidence": 42}\n```'
+    parser, events = feed_in_chunks(text, 4)
+    assert events == [("field", {"name": "diagnosis", "value": "Flu"}),
+                      ("field", {"name": "confidence", "value": 42})]
+    assert parser.document()["diagnosis"] == "Flu"
+
+
+def test_truncated_stream_emits_only_finished_values():
+    text = json.dumps(DOCUMENT)
+    cut = text.index("Common cold") + 5
+    parser, events = feed_in_chunks(text[:cut], 8)
+    assert [kind for kind, _ in events] == ["field", "condition"]
+    document = parser.document()
+    assert document["truncated"] is True
+    assert [c["name"] for c in document["conditions"]] == ["Influenza"]
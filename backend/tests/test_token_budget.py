@@ -0,0 +1,34 @@
+import token_budget
+from token_budget import BUDGETS, TokenBudget, escalate, plan_budget
+
+
+def words(n):
+    return " ".join(["cough"] * n)
+
+
+def test_detail_level_follows_symptom_length():
+    assert plan_budget("mild cough") == BUDGETS["brief"]
+    assert plan_budget(words(token_budget.GEMINI_BUDGET_BRIEF_MAX_WORDS)) == BUDGETS["brief"]
+    assert plan_budget(words(token_budget.GEMINI_BUDGET_BRIEF_MAX_WORDS + 1)) == BUDGETS["standard"]
+    assert plan_budget(words(token_budget.GEMINI_BUDGET_STANDARD_MAX_WORDS + 1)) == BUDGETS["detailed"]
+
+
+def test_empty_symptoms_get_the_brief_budget():
+    assert plan_budget("") == BUDGETS["brief"]
+    assert plan_budget(None) == BUDGETS["brief"]
+
+
+def test_adaptive_budget_off_always_uses_detailed(monkeypatch):
+    monkeypatch.setattr(token_budget, "GEMINI_ADAPTIVE_BUDGET", False)
+    assert plan_budget("mild cough") == BUDGETS["detailed"]
+
+
+def test_escalation_raises_the_limit_but_keeps_the_detail_level():
+    larger = escalate(BUDGETS["brief"])
+    assert larger == TokenBudget("brief", BUDGETS["standard"].max_output_tokens)
+    assert escalate(larger) == TokenBudget("brief", BUDGETS["detailed"].max_output_tokens)
+
+
+def test_escalation_stops_at_the_largest_limit():
+    assert escalate(BUDGETS["detailed"]) is None
+    assert escalate(TokenBudget("brief", 10 ** 6)) is None
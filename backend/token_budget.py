@@ -0,0 +1,60 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# Output budget per prompt detail level. "detailed" keeps the old fixed limit;
+# short symptom lists rarely need more than a third of it.
+GEMINI_BUDGET_BRIEF_TOKENS = int(os.getenv("GEMINI_BUDGET_BRIEF_TOKENS", "1536"))
+GEMINI_BUDGET_STANDARD_TOKENS = int(os.getenv("GEMINI_BUDGET_STANDARD_TOKENS", "2560"))
+GEMINI_BUDGET_DETAILED_TOKENS = int(os.getenv("GEMINI_BUDGET_DETAILED_TOKENS", "4096"))
+# Symptom word counts at which the next detail level kicks in
+GEMINI_BUDGET_BRIEF_MAX_WORDS = int(os.getenv("GEMINI_BUDGET_BRIEF_MAX_WORDS", "25"))
+GEMINI_BUDGET_STANDARD_MAX_WORDS = int(os.getenv("GEMINI_BUDGET_STANDARD_MAX_WORDS", "120"))
+# Off: every call gets the detailed prompt and limit (pre-budgeting behaviour)
+GEMINI_ADAPTIVE_BUDGET = os.getenv("GEMINI_ADAPTIVE_BUDGET", "true").lower() in ("1", "true", "yes")
+
+DETAIL_LEVELS = ("brief", "standard", "detailed")
+
+_WORD_RE = re.compile(r"\w+")
+
+
+@dataclass(frozen=True)
+class TokenBudget:
+    detail: str
+    max_output_tokens: int
+
+
+BUDGETS = {
+    "brief": TokenBudget("brief", GEMINI_BUDGET_BRIEF_TOKENS),
+    "standard": TokenBudget("standard", GEMINI_BUDGET_STANDARD_TOKENS),
+    "detailed": TokenBudget("detailed", GEMINI_BUDGET_DETAILED_TOKENS),
+}
+
+
+def plan_budget(symptoms: str) -> TokenBudget:
+    """
+    Prompt detail level and max_output_tokens for a symptom description.
+    "mild cough" gets a brief answer with a small limit; a multi-paragraph
+    history gets the full document.
+    """
+    if not GEMINI_ADAPTIVE_BUDGET:
+        return BUDGETS["detailed"]
+    words = len(_WORD_RE.findall(symptoms or ""))
+    if words <= GEMINI_BUDGET_BRIEF_MAX_WORDS:
+        return BUDGETS["brief"]
+    if words <= GEMINI_BUDGET_STANDARD_MAX_WORDS:
+        return BUDGETS["standard"]
+    return BUDGETS["detailed"]
+
+
+def escalate(budget: TokenBudget) -> Optional[TokenBudget]:
+    """
+    Budget to retry with after an answer hit max_output_tokens: same prompt
+    detail, the next larger limit. None once the largest limit was used.
+    """
+    limits = sorted({b.max_output_tokens for b in BUDGETS.values()})
+    larger = [limit for limit in limits if limit > budget.max_output_tokens]
+    if not larger:
+        return None
+    return TokenBudget(budget.detail, larger[0])
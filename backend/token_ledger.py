@@ -0,0 +1,115 @@
+import os
+import logging
+import contextlib
+import contextvars
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+TOKEN_LEDGER_ENABLED = os.getenv("TOKEN_LEDGER_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Who the Gemini calls made in the current context are for. Set around
+# engine.diagnose()/stream() by the router and the worker task.
+_usage_context: contextvars.ContextVar[dict] = contextvars.ContextVar("token_usage_context", default={})
+
+
+@contextlib.contextmanager
+def usage_context(user_id: Optional[int] = None, consultation_id: Optional[int] = None, source: str = "api",
+                  pending: Optional[list] = None):
+    """
+    `pending`: collect the TokenUsage rows here instead of inserting them, for
+    a caller that writes them in its own transaction (and fills in the
+    consultation id there).
+    """
+    token = _usage_context.set({"user_id": user_id, "consultation_id": consultation_id, "source": source,
+                                "pending": pending})
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+
+def current_usage_context() -> dict:
+    return dict(_usage_context.get())
+
+
+def finish_reason(response) -> Optional[str]:
+    """Finish reason name of the first candidate ("STOP", "MAX_TOKENS", ...)."""
+    try:
+        reason = response.candidates[0].finish_reason
+    except (AttributeError, IndexError, TypeError):
+        return None
+    return getattr(reason, "name", None) or (str(reason) if reason is not None else None)
+
+
+def usage_counts(response) -> tuple:
+    """(prompt, output, total) token counts reported by the API, zeros if absent."""
+    usage = getattr(response, "usage_metadata", None)
+    prompt = int(getattr(usage, "prompt_token_count", 0) or 0)
+    output = int(getattr(usage, "candidates_token_count", 0) or 0)
+    total = int(getattr(usage, "total_token_count", 0) or 0) or prompt + output
+    return prompt, output, total
+
+
+class TokenLedger:
+    """
+    Per-call Gemini token accounting in the token_usage table.
+
+    record() runs on the thread that made the Gemini call (never the event
+    loop) and costs one short INSERT next to a multi-second model call, or
+    none when the usage context collects rows for its caller to write.
+    Failures are logged and swallowed: accounting must never fail a diagnosis.
+    """
+
+    def __init__(self, enabled: bool = TOKEN_LEDGER_ENABLED):
+        self.enabled = enabled
+
+    def record(self, model_name: str, response=None, outcome: str = "success", max_output_tokens: Optional[int] = None,
+               prompt_detail: Optional[str] = None, latency: Optional[float] = None, share: float = 1.0,
+               **context):
+        """
+        Store one call. user/consultation/source come from usage_context()
+        unless passed explicitly; `share` splits one call's tokens across the
+        items of a micro-batch.
+        """
+        if not self.enabled:
+            return
+        from database import SessionLocal
+        from models import TokenUsage
+
+        fields = current_usage_context()
+        fields.update(context)
+        prompt, output, total = (round(count * share) for count in usage_counts(response))
+        row = TokenUsage(
+            user_id=fields.get("user_id"),
+            consultation_id=fields.get("consultation_id"),
+            source=fields.get("source") or "api",
+            model=model_name,
+            prompt_detail=prompt_detail,
+            prompt_tokens=prompt,
+            output_tokens=output,
+            total_tokens=total,
+            max_output_tokens=max_output_tokens,
+            finish_reason=finish_reason(response),
+            outcome=outcome,
+            latency_ms=int(latency * 1000) if latency is not None else None,
+        )
+        pending = fields.get("pending")
+        if pending is not None:
+            pending.append(row)
+        else:
+            db = SessionLocal()
+            try:
+                db.add(row)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Failed to record token usage for {model_name}: {e}")
+            finally:
+                db.close()
+        logger.info(f"Gemini usage ({model_name}, {outcome}): prompt={prompt} output={output} "
+                    f"limit={max_output_tokens} detail={prompt_detail}")
+
+
+# Shared instance used by the inference engine and the micro-batcher
+token_ledger = TokenLedger()
@@ -0,0 +1,104 @@
+"""
+Per-stage latency breakdown from the local span file (TRACE_FILE).
+
+    cd backend
+    python trace_report.py --consultation 42      # every trace touching consultation 42
+    python trace_report.py --trace <X-Trace-Id>
+    python trace_report.py --slowest 5            # slowest request/task traces
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/spans.jsonl")
+
+
+def load_spans(path: str):
+    """Spans from the file and its rotated copies (path.1, path.2, ...)."""
+    traces = defaultdict(list)
+    paths = [path] + sorted(glob.glob(glob.escape(path) + ".[0-9]*"))
+    for name in paths:
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    span = json.loads(line)
+                    traces[span["traceId"]].append(span)
+    return traces
+
+
+def print_trace(trace_id: str, spans: list):
+    spans.sort(key=lambda s: s["startTimeUnixNano"])
+    start = spans[0]["startTimeUnixNano"]
+    end = max(s["endTimeUnixNano"] for s in spans)
+    by_id = {s["spanId"]: s for s in spans}
+    children = defaultdict(list)
+    roots = []
+    for span in spans:
+        if span["parentSpanId"] in by_id:
+            children[span["parentSpanId"]].append(span)
+        else:
+            roots.append(span)
+
+    print(f"trace {trace_id}  {(end - start) / 1e6:.1f} ms, {len(spans)} spans")
+
+    def walk(span, depth):
+        offset = (span["startTimeUnixNano"] - start) / 1e6
+        flag = "  !" if span["status"] == "ERROR" else ""
+        print(f"  +{offset:9.1f} ms {span['durationMs']:9.1f} ms  {'  ' * depth}{span['name']} "
+              f"[{span['service']}]{flag}")
+        for child in children[span["spanId"]]:
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+
+    # Time per stage, summed over spans of the same kind of work
+    totals = defaultdict(float)
+    for span in spans:
+        stage = span["name"].split(" ", 1)[0] if span["name"].startswith(("db ", "celery.")) else span["name"]
+        totals[stage] += span["durationMs"]
+    print("  by stage: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in sorted(totals.items(), key=lambda i: -i[1])))
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default=TRACE_FILE)
+    parser.add_argument("--consultation", type=int)
+    parser.add_argument("--trace")
+    parser.add_argument("--slowest", type=int, default=0)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        sys.exit(f"No span file at {args.file} (set TRACE_FILE or pass --file)")
+    traces = load_spans(args.file)
+
+    if args.trace:
+        selected = [args.trace] if args.trace in traces else []
+    elif args.consultation is not None:
+        # consultation.ids: batched writes (worker write-behind flushes)
+        selected = [trace_id for trace_id, spans in traces.items()
+                    if any(s["attributes"].get("consultation.id") == args.consultation
+                           or args.consultation in s["attributes"].get("consultation.ids", ()) for s in spans)]
+    else:
+        def duration(trace_id):
+            spans = traces[trace_id]
+            return max(s["endTimeUnixNano"] for s in spans) - min(s["startTimeUnixNano"] for s in spans)
+        selected = sorted(traces, key=duration, reverse=True)[:args.slowest or 5]
+
+    if not selected:
+        sys.exit("No matching traces")
+    for trace_id in selected:
+        print_trace(trace_id, traces[trace_id])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import os
+import json
+import logging
+import threading
+from typing import Optional, Sequence
+
+from opentelemetry import context, propagate, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+logger = logging.getLogger(__name__)
+
+# Off by default: with tracing on every SQL statement is a span
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+# Fraction of traces recorded (decided at the root, followed by every child
+# span, including across Celery)
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0.1"))
+# Local exporter: one OTLP/JSON-style span per line, readable with
+# `python trace_report.py`. Empty disables the file. Rotated to .1, .2, ...
+# at TRACE_FILE_MAX_BYTES, keeping TRACE_FILE_BACKUPS old files.
+TRACE_FILE = os.getenv("TRACE_FILE", "traces/spans.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+# Also ship spans to a collector when set (needs opentelemetry-exporter-otlp-proto-http)
+OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+# Statement text stored on DB spans is cut to this many characters
+TRACE_DB_STATEMENT_CHARS = int(os.getenv("TRACE_DB_STATEMENT_CHARS", "300"))
+
+tracer = trace.get_tracer("medifusion")
+
+_setup_lock = threading.Lock()
+_setup_pid: Optional[int] = None
+
+
+def _hex(value: int, width: int) -> str:
+    return format(value, f"0{width}x")
+
+
+class JsonLinesSpanExporter(SpanExporter):
+    """
+    Appends finished spans to a local file; no collector required. The file
+    is rotated once it exceeds max_bytes, so disk use stays bounded at about
+    (backups + 1) * max_bytes. Rotation is per process: processes sharing the
+    file may occasionally rotate it twice in a row.
+    """
+
+    def __init__(self, path: str, max_bytes: int = TRACE_FILE_MAX_BYTES, backups: int = TRACE_FILE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _encode(span: ReadableSpan) -> dict:
+        return {
+            "traceId": _hex(span.context.trace_id, 32),
+            "spanId": _hex(span.context.span_id, 16),
+            "parentSpanId": _hex(span.parent.span_id, 16) if span.parent else None,
+            "name": span.name,
+            "kind": span.kind.name,
+            "service": span.resource.attributes.get("service.name"),
+            "startTimeUnixNano": span.start_time,
+            "endTimeUnixNano": span.end_time,
+            "durationMs": round((span.end_time - span.start_time) / 1e6, 3),
+            "attributes": dict(span.attributes or {}),
+            "status": span.status.status_code.name,
+            "statusMessage": span.status.description,
+        }
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(json.dumps(self._encode(span), default=str) + "\n" for span in spans)
+        try:
+            with self._lock:
+                self._rotate()
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+        except OSError as e:
+            logger.warning(f"Failed to write spans to {self.path}: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def _rotate(self):
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except FileNotFoundError:
+            return
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def shutdown(self):
+        pass
+
+
+def setup_tracing(service_name: str):
+    """
+    Install the tracer provider and exporters for this process. Call after
+    forking (Celery worker_process_init), since the batch export thread does
+    not survive fork; repeated calls in the same process are no-ops.
+    """
+    global _setup_pid
+    if not TRACING_ENABLED:
+        return
+    with _setup_lock:
+        if _setup_pid == os.getpid():
+            return
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}),
+                                  sampler=ParentBased(TraceIdRatioBased(TRACE_SAMPLE_RATIO)))
+        if TRACE_FILE:
+            provider.add_span_processor(BatchSpanProcessor(JsonLinesSpanExporter(TRACE_FILE)))
+        if OTEL_EXPORTER_OTLP_ENDPOINT:
+            try:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+            except ImportError:
+                logger.warning("OTEL_EXPORTER_OTLP_ENDPOINT is set but the OTLP exporter is not installed")
+        trace.set_tracer_provider(provider)
+        _setup_pid = os.getpid()
+        logger.info(f"Tracing enabled for {service_name} (sampling {TRACE_SAMPLE_RATIO:.0%}, file: {TRACE_FILE or 'off'}, "
+                    f"OTLP: {OTEL_EXPORTER_OTLP_ENDPOINT or 'off'})")
+
+
+def shutdown_tracing():
+    """Flush pending spans (process exit)."""
+    provider = trace.get_tracer_provider()
+    if hasattr(provider, "shutdown"):
+        provider.shutdown()
+
+
+def current_trace_id() -> Optional[str]:
+    span_context = trace.get_current_span().get_span_context()
+    return _hex(span_context.trace_id, 32) if span_context.is_valid else None
+
+
+def set_attributes(**attributes):
+    """Annotate the current span (e.g. consultation.id once it is known)."""
+    span = trace.get_current_span()
+    for key, value in attributes.items():
+        if value is not None:
+            span.set_attribute(key.replace("_", "."), value)
+
+
+def _record_error(span, error: BaseException):
+    span.record_exception(error)
+    span.set_status(Status(StatusCode.ERROR, str(error)))
+
+
+def inject_task_headers(headers=None, **kwargs):
+    """before_task_publish handler: carry the current trace into the task message."""
+    if headers is not None:
+        propagate.inject(headers)
+
+
+def extract_context(carrier: dict):
+    return propagate.extract(carrier or {})
+
+
+def instrument_engine(engine, name: str):
+    """One client span per SQL statement on a (sync) SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start(conn, cursor, statement, parameters, context_, executemany):
+        span = tracer.start_span(
+            f"db {statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'SQL'}",
+            kind=SpanKind.CLIENT,
+            attributes={
+                "db.system": conn.dialect.name,
+                "db.engine": name,
+                "db.statement": statement[:TRACE_DB_STATEMENT_CHARS],
+                "db.executemany": executemany,
+            },
+        )
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _stop(conn, cursor, statement, parameters, context_, executemany):
+        spans = conn.info.get("trace_spans")
+        if spans:
+            spans.pop().end()
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(exception_context):
+        conn = exception_context.connection
+        spans = conn.info.get("trace_spans") if conn is not None else None
+        if spans:
+            span = spans.pop()
+            _record_error(span, exception_context.original_exception)
+            span.end()
+
+
+class CeleryTracing:
+    """
+    Celery signal handlers: each task runs in a CONSUMER span parented to the
+    trace that published it (W3C traceparent in the message headers), with a
+    sibling span covering the time the message spent queued.
+    """
+
+    def __init__(self):
+        self._active = {}
+
+    @staticmethod
+    def _headers(request) -> dict:
+        carrier = dict(request.headers or {})
+        for key in ("traceparent", "tracestate", "enqueued_at"):
+            value = getattr(request, key, None)
+            if value is not None:
+                carrier.setdefault(key, value)
+        return carrier
+
+    def task_prerun(self, task_id=None, task=None, args=None, kwargs=None, **extra):
+        carrier = self._headers(task.request)
+        parent = extract_context(carrier)
+        enqueued_at = carrier.get("enqueued_at")
+        if enqueued_at:
+            # Zero-work span covering broker time, so it shows in the breakdown
+            queued = tracer.start_span("celery.queue " + task.name, context=parent, kind=SpanKind.CONSUMER,
+                                       start_time=int(float(enqueued_at) * 1e9))
+            queued.end()
+        span = tracer.start_span("celery.task " + task.name, context=parent, kind=SpanKind.CONSUMER, attributes={
+            "celery.task_id": task_id,
+            "celery.retries": task.request.retries or 0,
+        })
+        token = context.attach(trace.set_span_in_context(span))
+        self._active[task_id] = (span, token)
+
+    def task_postrun(self, task_id=None, task=None, state=None, **extra):
+        active = self._active.pop(task_id, None)
+        if active is None:
+            return
+        span, token = active
+        span.set_attribute("celery.state", state or "UNKNOWN")
+        if state == "FAILURE":
+            span.set_status(Status(StatusCode.ERROR))
+        span.end()
+        context.detach(token)
+
+
+# Shared instance used by the Celery worker's signal handlers
+celery_tracing = CeleryTracing()
@@ -3,14 +3,34 @@ import sys
 import time
 import json
 import logging
-import google.generativeai as genai
+import datetime
 from celery import Celery
-from sqlalchemy import create_engine
+from celery.exceptions import Retry
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, worker_init, worker_process_init, worker_process_shutdown,
+    worker_shutdown,
+)
+from sqlalchemy import create_engine, select, update
 from sqlalchemy.orm import sessionmaker
-from models import Consultation, Base, Medicine, User
+from database import sync_engine_kwargs
+from models import Base, Consultation, Medicine, User, STATUS_PENDING
+from model_catalog import model_catalog
+from inference import engine, InferenceError
+from batching import micro_batcher
+from token_ledger import usage_context
+from consultation_writer import (
+    ConsultationWriter, CONSULTATION_RECONCILE_AFTER, CONSULTATION_RECONCILE_BATCH, CONSULTATION_RECONCILE_WINDOW,
+)
+from celery_queues import TASK_QUEUES, TASK_ROUTES, QUEUE_DEFAULT, QUEUE_REMINDERS
+from reminder_schedule import next_fire_time, as_utc, get_zone, REMINDER_CATCHUP_MINUTES, REMINDER_TICK_CHUNK
 from dotenv import load_dotenv
-import asyncio
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
+from mailer import mailer, build_message, MAIL_SERVER, MAIL_USERNAME
+import metrics
+from metrics import (
+    CELERY_QUEUE_WAIT_SECONDS, CELERY_TASK_SECONDS, REMINDER_BATCH_SIZE, instrument_engine, stamp_publish_time,
+)
+import tracing
+from tracing import celery_tracing, inject_task_headers
 
 # CRITICAL: Load environment variables from .env file BEFORE reading them
 # This ensures GEMINI_API_KEY and other variables are available
@@ -31,13 +51,17 @@ REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")  # Changed to 1.5-flash for better stability
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://medifusion_user:securepassword123@db:5432/medifusion_db")
+# Workers can queue longer than API requests for a Gemini quota permit
+GEMINI_RATE_MAX_WAIT_WORKER = float(os.getenv("GEMINI_RATE_MAX_WAIT_WORKER", "120"))
+# Prometheus exporter in the worker main process (port: WORKER_METRICS_PORT)
+WORKER_METRICS_ENABLED = os.getenv("WORKER_METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
 
 # Log configuration at startup
 logger.info(f"Celery Broker URL: {RABBITMQ_URL}")
 logger.info(f"Celery Backend (Redis) URL: {REDIS_URL}")
 logger.info(f"Database URL: {DATABASE_URL[:30]}...")  # Log partial URL for security
 
-# Configure Gemini API (will be re-validated at task execution time)
+# Check the Gemini API key (re-validated at task execution time)
 # CRITICAL: Verify API key is loaded from environment
 if GEMINI_API_KEY:
     # Validate API key format (should start with AIza)
@@ -47,13 +71,9 @@ if GEMINI_API_KEY:
     elif len(GEMINI_API_KEY.strip()) < 20:
         logger.warning(f"GEMINI_API_KEY appears to be too short ({len(GEMINI_API_KEY)} chars)")
     else:
-        try:
-            genai.configure(api_key=GEMINI_API_KEY)
-            logger.info("✓ Gemini API configured successfully at startup")
-            logger.debug(f"GEMINI_API_KEY loaded (length: {len(GEMINI_API_KEY)}, starts with: {GEMINI_API_KEY[:5]}...)")
-        except Exception as e:
-            logger.error(f"Failed to configure Gemini API at startup: {e}", exc_info=True)
-            logger.info("Will retry configuration at task execution time")
+        # The SDK is imported and configured by the first predict_disease task
+        # (engine.configure()), keeping it off worker startup
+        logger.info("✓ GEMINI_API_KEY found; Gemini is configured on first use")
 else:
     logger.error("GEMINI_API_KEY not found in environment variables at startup")
     logger.error("Please ensure GEMINI_API_KEY is set in .env file or environment")
@@ -61,13 +81,19 @@ else:
 
 # 2. Setup Database Connection for Worker
 try:
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True, pool_recycle=3600)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # Same pool and statement timeout settings as the API (database.py)
+    db_engine = create_engine(DATABASE_URL, **sync_engine_kwargs(DATABASE_URL))
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+    instrument_engine(db_engine, "worker")
+    tracing.instrument_engine(db_engine, "worker")
     logger.info("✓ Database connection configured for worker")
 except Exception as e:
     logger.warning(f"Failed to configure database connection: {e}")
     SessionLocal = None
 
+# Finished diagnoses are written in batches (consultation_writer)
+consultation_writer = ConsultationWriter(SessionLocal) if SessionLocal else None
+
 # 3. Setup Celery App
 # CRITICAL: broker (RabbitMQ) is for task queuing, backend (Redis) is for result storage
 celery_app = Celery(
@@ -77,6 +103,78 @@ celery_app = Celery(
 )
 logger.info("Celery app initialized")
 
+@worker_process_init.connect
+def _warm_model_catalog(**kwargs):
+    """Start catalog refresh in each pool process (threads don't survive fork)."""
+    model_catalog.start_background_refresh()
+
+@worker_process_init.connect
+def _start_tracing(**kwargs):
+    """Per pool process, for the same reason: the span export thread is started after fork."""
+    tracing.setup_tracing("medifusion-worker")
+
+@worker_init.connect
+def _start_metrics_exporter(**kwargs):
+    """Expose /metrics on WORKER_METRICS_PORT from the worker's main process."""
+    if not WORKER_METRICS_ENABLED:
+        return
+    if not metrics.PROMETHEUS_MULTIPROC_DIR:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is not set: the exporter cannot see samples from pool processes")
+    try:
+        metrics.start_exporter()
+    except OSError as e:
+        logger.warning(f"Prometheus exporter not started: {e}")
+
+# Queue wait is measured from the publish timestamp stamped on every message
+# (retries published from here included)
+before_task_publish.connect(stamp_publish_time)
+# Tasks published from a task (retries) stay in the originating trace
+before_task_publish.connect(inject_task_headers)
+task_prerun.connect(celery_tracing.task_prerun)
+task_postrun.connect(celery_tracing.task_postrun)
+
+_task_started = {}
+
+@task_prerun.connect
+def _task_prerun_metrics(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.monotonic()
+    request = task.request
+    enqueued_at = getattr(request, "enqueued_at", None) or (request.headers or {}).get("enqueued_at")
+    if enqueued_at:
+        ready_at = float(enqueued_at)
+        eta = request.eta
+        if eta:
+            # Countdown/ETA tasks are not "waiting" before they are due
+            if isinstance(eta, str):
+                eta = datetime.datetime.fromisoformat(eta)
+            ready_at = max(ready_at, eta.timestamp())
+        CELERY_QUEUE_WAIT_SECONDS.labels(task.name).observe(max(0.0, time.time() - ready_at))
+
+@task_postrun.connect
+def _task_postrun_metrics(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_SECONDS.labels(task.name, state or "UNKNOWN").observe(time.monotonic() - started)
+
+@worker_process_shutdown.connect
+def _close_mail_pool(**kwargs):
+    """Say QUIT on pooled SMTP sessions instead of dropping them."""
+    try:
+        mailer.close()
+    except Exception as e:
+        logger.warning(f"Failed to close SMTP pool: {e}")
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def _flush_consultations(**kwargs):
+    """Write buffered diagnoses before the process exits (prefork children and solo/threads pools)."""
+    if consultation_writer:
+        consultation_writer.close()
+
+@worker_process_shutdown.connect
+def _flush_spans(**kwargs):
+    tracing.shutdown_tracing()
+
 # Configure Celery task settings with resilience options
 celery_app.conf.update(
     task_serializer='json',
@@ -88,6 +186,11 @@ celery_app.conf.update(
     task_time_limit=300,  # 5 minutes hard timeout (generous for AI API calls)
     task_soft_time_limit=280,  # 4 minutes 40 seconds soft timeout
     task_acks_late=True,  # Acknowledge tasks after completion, not before
+    # Per-workload queues (celery_queues); start_worker.py picks which to consume
+    task_queues=TASK_QUEUES,
+    task_routes=TASK_ROUTES,
+    task_default_queue=QUEUE_DEFAULT,
+    worker_prefetch_multiplier=1,  # overridden per profile by start_worker.py
     task_reject_on_worker_lost=True,  # Re-queue tasks if worker dies
     # Broker connection resilience
     broker_connection_retry=True,
@@ -115,23 +218,10 @@ celery_app.conf.update(
     result_backend_max_retries=10,
 )
 
-# Email Configuration
-conf = ConnectionConfig(
-    MAIL_USERNAME=os.getenv("MAIL_USERNAME", "your_email@gmail.com"),
-    MAIL_PASSWORD=os.getenv("MAIL_PASSWORD", "your_app_password"),
-    MAIL_FROM=os.getenv("MAIL_FROM", os.getenv("MAIL_USERNAME", "your_email@gmail.com")),
-    MAIL_PORT=587,
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True
-)
-
 @celery_app.task(name="send_welcome_email")
 def send_welcome_email_task(email_address: str, full_name: str):
     """
-    Sends a welcome email using fastapi-mail.
+    Sends a welcome email over the pooled SMTP sessions (mailer.py).
     This is run asynchronously by the Celery worker.
     """
     logger.info(f"Preparing welcome email for {email_address}")
@@ -160,28 +250,15 @@ def send_welcome_email_task(email_address: str, full_name: str):
     </html>
     """.format(full_name=full_name)
     
-    # Simple Text fallback
-    message = MessageSchema(
-        subject="Welcome to MediFusion",
-        recipients=[email_address],
-        body=html,
-        subtype=MessageType.html
-    )
-    
-    fm = FastMail(conf)
-    
-    # Run async send_message in sync Celery task
-    try:
-        logger.info(f"Connecting to SMTP server {conf.MAIL_SERVER}:{conf.MAIL_PORT}...")
-        asyncio.run(fm.send_message(message))
+    message = build_message(email_address, "Welcome to MediFusion", html)
+    if mailer.send(message, label="welcome"):
         logger.info(f"✓ EMAIL SENT SUCCESSFULLY to {email_address}")
-    except Exception as e:
-        logger.error(f"❌ FASTAPI-MAIL ERROR: {e}")
-        logger.error(f"Check configuration: USER={conf.MAIL_USERNAME}, HOST={conf.MAIL_SERVER}")
+    else:
+        logger.error(f"Check configuration: USER={MAIL_USERNAME}, HOST={MAIL_SERVER}")
 
 # 4. The "Dr. AI" Logic Task using Gemini API
 @celery_app.task(name="predict_disease", bind=True, max_retries=3, default_retry_delay=10)
-def predict_disease(self, symptoms: str, consultation_id: int = None):
+def predict_disease(self, symptoms: str, consultation_id: int = None, user_id: int = None):
     """
     Predict disease using Google Gemini API based on symptoms.
     Updates the database with the diagnosis result.
@@ -189,6 +266,7 @@ def predict_disease(self, symptoms: str, consultation_id: int = None):
     Args:
         symptoms: String containing patient symptoms (serializable)
         consultation_id: Optional integer ID of the consultation record to update
+        user_id: Optional owner of the consultation, for token accounting
     
     Returns:
         Dict containing diagnosis and recommendations (JSON serializable)
@@ -198,6 +276,7 @@ def predict_disease(self, symptoms: str, consultation_id: int = None):
     
     try:
         logger.info(f"Task started: predict_disease(consultation_id={consultation_id})")
+        tracing.set_attributes(consultation_id=consultation_id, user_id=user_id)
         
         # Validate inputs
         if not symptoms or not isinstance(symptoms, str):
@@ -208,7 +287,7 @@ def predict_disease(self, symptoms: str, consultation_id: int = None):
             if consultation_id and SessionLocal:
                 try:
                     # For DB update we need a string - use JSON string for consistency
-                    _update_consultation(consultation_id, json.dumps(diagnosis_data))
+                    _update_consultation(consultation_id, diagnosis_data)
                 except Exception as db_err:
                     logger.error(f"Failed to update database with error status: {db_err}")
             return diagnosis_data
@@ -224,7 +303,7 @@ def predict_disease(self, symptoms: str, consultation_id: int = None):
             task_status = "FAILURE"
             if consultation_id and SessionLocal:
                 try:
-                    _update_consultation(consultation_id, json.dumps(diagnosis_data))
+                    _update_consultation(consultation_id, diagnosis_data)
                 except Exception as db_err:
                     logger.error(f"Failed to update database with error status: {db_err}")
             return diagnosis_data
@@ -238,15 +317,14 @@ def predict_disease(self, symptoms: str, consultation_id: int = None):
             task_status = "FAILURE"
             if consultation_id and SessionLocal:
                 try:
-                    _update_consultation(consultation_id, json.dumps(diagnosis_data))
+                    _update_consultation(consultation_id, diagnosis_data)
                 except Exception as db_err:
                     logger.error(f"Failed to update database with error status: {db_err}")
             return diagnosis_data
         
-        # Re-configure Gemini API with current API key
+        # Configure Gemini once per process (re-configures only if the key changed)
         try:
-            genai.configure(api_key=api_key)
-            logger.info(f"Gemini API configured for task execution (consultation_id={consultation_id})")
+            engine.configure()
         except Exception as config_err:
             error_msg = f"Failed to configure Gemini API: {str(config_err)}"
             logger.error(f"{error_msg} (consultation_id={consultation_id})", exc_info=True)
@@ -254,244 +332,227 @@ def predict_disease(self, symptoms: str, consultation_id: int = None):
             task_status = "FAILURE"
             if consultation_id and SessionLocal:
                 try:
-                    _update_consultation(consultation_id, json.dumps(diagnosis_data))
+                    _update_consultation(consultation_id, diagnosis_data)
                 except Exception as db_err:
                     logger.error(f"Failed to update database with error status: {db_err}")
             return diagnosis_data
         
-        # Get model name from environment variable
-        env_model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
-        
-        # Get model name from environment variable
-        env_model_name = os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip()
-        
-        # DYNAMIC MODEL DISCOVERY DISABLED to prevent Rate Limit (429) errors on Free Tier.
-        # requesting list_models() counts as a request, and iterating fast hits RPM limits.
-        
-        # We strictly prefer 1.5-flash for speed and higher RPM (15 RPM vs 2 RPM for Pro)
-        models_to_try = ["gemini-1.5-flash"]
-        
-        # If the environment variable is set to something else, add it as a backup or primary?
-        # Ideally, just stick to Flash for stability unless user forces otherwise.
-        if env_model_name and env_model_name != "gemini-1.5-flash":
-             # If user specifically asked for another model in .env, try that first?
-             # No, if they are hitting quotas, Flash is the safest bet. 
-             # Let's just log what we are doing.
-             logger.info(f"Overriding configured model '{env_model_name}' with 'gemini-1.5-flash' for stability.")
-        
-        logger.info(f"Final model trial order: {models_to_try}")
-        
-        # Create a detailed prompt for medical diagnosis requesting JSON (PRE-CALCULATED)
-        prompt = f"""You are a medical AI assistant. Analyze the following symptoms and provide a diagnosis in structured JSON format.
-
-Symptoms: {symptoms}
-
-Output MUST be a valid JSON object with the following structure:
-{{
-  "diagnosis": "Name of the most likely condition",
-  "diagnosis_summary": "A brief 1-2 sentence summary of the diagnosis",
-  "detailed_diagnosis": "A comprehensive explanation of the condition",
-  "conditions": [
-    {{
-      "name": "Condition Name",
-      "confidence": 85,
-      "severity": "high" | "medium" | "low",
-      "reasoning": "Why this matches"
-    }}
-  ],
-  "recommended_tests": ["List of recommended medical tests"],
-  "consult_doctor": "Type of specialist to consult (e.g. Cardiologist)",
-  "precautions": ["List of immediate precautions"],
-  "prevention": ["List of prevention tips"],
-  "lifestyle_tips": ["List of lifestyle changes"],
-  "tips": ["General health tips"]
-}}
-
-Ensure the response is purely valid JSON without markdown formatting."""
-
-        last_error = None
-        success = False
-
-        for model_name in models_to_try:
-            try:
-                logger.info(f"Attempting with model: {model_name} (consultation_id={consultation_id})")
-                model = genai.GenerativeModel(model_name)
-                
-                logger.info(f"Calling Gemini API ({model_name})... (consultation_id={consultation_id})")
-                start_time = time.time()
-                
-                response = model.generate_content(
-                    prompt,
-                    generation_config={
-                        'temperature': 0.4,
-                        'top_p': 0.8,
-                        'top_k': 40,
-                        'max_output_tokens': 4096,
-                        'response_mime_type': 'application/json'
-                    }
+        # Shared inference path: diagnosis cache, cross-process coalescing,
+        # optional micro-batching and rate-limited model fallback
+        try:
+            with usage_context(user_id, consultation_id, source="worker"):
+                diagnosis_data = engine.diagnose(
+                    symptoms,
+                    max_wait=GEMINI_RATE_MAX_WAIT_WORKER,
+                    allow_batch=micro_batcher.enabled
                 )
-                
-                elapsed_time = time.time() - start_time
-                logger.info(f"Gemini API call ({model_name}) completed in {elapsed_time:.2f}s")
-                
-                # Extract and parse JSON
-                raw_text = response.text.strip()
-                if raw_text.startswith("```json"):
-                    raw_text = raw_text[7:]
-                if raw_text.endswith("```"):
-                    raw_text = raw_text[:-3]
-                
-                diagnosis_data = json.loads(raw_text)
-                diagnosis_data['status'] = 'success'
-                diagnostic_model_used = model_name # Track which model worked
-                
-                logger.info(f"✓ Valid JSON diagnosis received from {model_name}")
-                task_status = "SUCCESS"
-                success = True
-                break # SUCCESS! Exit loop
-                
-            except Exception as e:
-                last_error = e
-                # Specifically catch 404/NotFound or other API errors and continue
-                logger.warning(f"Model {model_name} failed: {str(e)}. Trying next...")
-                continue
-        
-        if not success:
-             # All models failed
-            logger.error(f"All models failed. Last error: {last_error}", exc_info=True)
-            diagnosis_data = {"status": "error", "error": f"AI Service Error: All models failed. Last error: {str(last_error)}"}
+            logger.info(f"✓ Valid JSON diagnosis received (consultation_id={consultation_id})")
+            task_status = "SUCCESS"
+        except InferenceError as e:
+            # All models failed
+            logger.error(f"All models failed. Last error: {e.last_error}")
+            diagnosis_data = {"status": "error", "error": f"AI Service Error: All models failed. Last error: {str(e.last_error)}"}
             task_status = "FAILURE"
             
             # Retry entire task if appropriate (but maybe not if we exhausted all models?)
             if self.request.retries < self.max_retries:
-                retry_delay = min(10 * (self.request.retries + 1), 60)
-                raise self.retry(exc=last_error, countdown=retry_delay)
+                if e.retry_after is not None:
+                    # Quota exhausted fleet-wide: come back exactly when a permit frees up
+                    retry_delay = e.retry_after
+                else:
+                    retry_delay = min(10 * (self.request.retries + 1), 60)
+                raise self.retry(exc=e, countdown=retry_delay)
                 
         # Update database if consultation_id is provided
         if consultation_id and SessionLocal:
             try:
-                # Store the JSON string in the database
-                json_str = json.dumps(diagnosis_data)
-                _update_consultation(consultation_id, json_str)
-                logger.info(f"✓ Database updated for consultation_id={consultation_id}")
+                _update_consultation(consultation_id, diagnosis_data)
+                logger.info(f"✓ Diagnosis queued for write (consultation_id={consultation_id})")
             except Exception as db_error:
                 logger.warning(f"Failed to update database (consultation_id={consultation_id}): {db_error}")
 
         return diagnosis_data
 
+    except Retry:
+        # self.retry() signals via exception; let Celery reschedule the task
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in predict_disease task: {str(e)}", exc_info=True)
         return {"status": "error", "error": f"Internal Worker Error: {str(e)}"}
 
-def _update_consultation(consultation_id: int, diagnosis: str):
-    """Helper function to update consultation diagnosis in database"""
-    if not SessionLocal:
+def _update_consultation(consultation_id: int, diagnosis_data: dict):
+    """Hand a finished diagnosis to the write-behind buffer (written within CONSULTATION_WRITE_DELAY)"""
+    if not consultation_writer:
         logger.warning(f"SessionLocal not available, skipping database update (consultation_id={consultation_id})")
         return
-    
+    consultation_writer.submit(consultation_id, diagnosis_data)
+
+@celery_app.task(name="reconcile_consultations")
+def reconcile_consultations():
+    """
+    Periodic sweep for job consultations still pending
+    CONSULTATION_RECONCILE_AFTER seconds after creation although their task
+    has finished: the write-behind buffer holding the result died with its
+    process. The result is written from the result backend instead.
+    """
+    if not consultation_writer:
+        logger.error("Database session not initialized")
+        return
+    now = datetime.datetime.utcnow()
     db = SessionLocal()
     try:
-        consultation = db.query(Consultation).filter(Consultation.id == consultation_id).first()
-        if consultation:
-            consultation.diagnosis = diagnosis
-            db.commit()
-            logger.info(f"✓ Updated consultation {consultation_id} with diagnosis")
-        else:
-            logger.warning(f"Consultation {consultation_id} not found in database")
-    except Exception as e:
-        db.rollback()
-        logger.error(f"ERROR updating consultation {consultation_id}: {e}", exc_info=True)
-        raise
+        stale = db.execute(select(Consultation.id, Consultation.task_id).where(
+            Consultation.status == STATUS_PENDING,
+            Consultation.task_id.isnot(None),
+            Consultation.created_at <= now - datetime.timedelta(seconds=CONSULTATION_RECONCILE_AFTER),
+            Consultation.created_at >= now - datetime.timedelta(seconds=CONSULTATION_RECONCILE_WINDOW)
+        ).order_by(Consultation.created_at).limit(CONSULTATION_RECONCILE_BATCH)).all()
     finally:
         db.close()
 
+    recovered = {}
+    for row in stale:
+        result = celery_app.AsyncResult(row.task_id)
+        # PENDING / STARTED / RETRY: still queued or running, nothing to repair
+        if result.state == "SUCCESS" and isinstance(result.result, dict):
+            recovered[row.id] = result.result
+        elif result.state == "FAILURE":
+            recovered[row.id] = {"status": "error", "error": str(result.result)}
+    if recovered:
+        consultation_writer.write(recovered)
+        logger.warning(f"Reconciled {len(recovered)} consultation(s) from the result backend: {sorted(recovered)}")
+
 # Celery Beat Schedule
 celery_app.conf.beat_schedule = {
     'check-medicine-reminders-every-minute': {
         'task': 'check_medicine_reminders',
         'schedule': 60.0, # Run every 60 seconds
+        # A tick nobody picked up within the minute is superseded by the next one
+        'options': {'queue': QUEUE_REMINDERS, 'expires': 55},
+    },
+    'reconcile-consultations-every-minute': {
+        'task': 'reconcile_consultations',
+        'schedule': 60.0,
+        'options': {'queue': QUEUE_REMINDERS, 'expires': 55},
     },
 }
 
+def _reminder_message(user_email: str, user_name: str, med_name: str, dosage: str, time_str: str):
+    """Build one medicine reminder email."""
+    html = f"""
+    <html>
+        <body style="font-family: Arial, sans-serif;">
+            <div style="padding: 20px; background-color: #fef2f2; border: 1px solid #ef4444; border-radius: 8px;">
+                <h2 style="color: #b91c1c; margin-top: 0;">Medicine Reminder 💊</h2>
+                <p>Hi {user_name},</p>
+                <p>It is <strong>{time_str}</strong>. Time to take your medicine:</p>
+                <h3 style="background-color: white; padding: 10px; display: inline-block; border-radius: 4px;">
+                    {med_name} ({dosage})
+                </h3>
+                <p>Stay healthy!</p>
+                <p>MediFusion AI</p>
+            </div>
+        </body>
+    </html>
+    """
+
+    return build_message(user_email, f"Reminder: Time to take {med_name}", html)
+
+def _claim_due_reminders(db, now):
+    """
+    Next chunk of due reminders as flat rows: only the medicine and owner
+    columns the email needs, joined in one round trip (no per-row owner
+    lookups). Served by ix_medicines_active_next_reminder; on Postgres the rows
+    are locked so concurrent ticks skip each other's chunks.
+    """
+    query = select(
+        Medicine.id,
+        Medicine.name,
+        Medicine.dosage,
+        Medicine.frequency,
+        Medicine.reminder_time,
+        Medicine.created_at,
+        Medicine.next_reminder_at,
+        User.email,
+        User.full_name,
+        User.timezone
+    ).join(User, Medicine.user_id == User.id).where(
+        Medicine.is_active == 1,
+        Medicine.next_reminder_at <= now
+    ).order_by(Medicine.next_reminder_at).limit(REMINDER_TICK_CHUNK)
+    if db.bind.dialect.name == "postgresql":
+        query = query.with_for_update(skip_locked=True, of=Medicine)
+    return db.execute(query).all()
+
 @celery_app.task(name="check_medicine_reminders")
 def check_medicine_reminders():
     """
-    Periodic task to check if any medicines need to be taken now (UTC time).
+    Periodic task: deliver every reminder whose next_reminder_at is due and
+    advance it to its next fire time.
+
+    Fire times are precomputed in UTC from reminder_time, frequency and the
+    user's time zone (reminder_schedule), so a tick is an index range scan of
+    due rows only, claimed REMINDER_TICK_CHUNK at a time so memory stays flat
+    however many reminders fall on the same minute. Anything missed while beat
+    was late or down is still due on the next tick (catch-up); occurrences
+    older than REMINDER_CATCHUP_MINUTES are skipped rather than sent hours late.
     """
-    from datetime import datetime
-    import pytz
-    
-    # We'll use UTC for simplicity on the server, but assuming user input is consistent?
-    # Ideally, we should store user timezone or handle offsets.
-    # For MVP: Assuming user inputs time in UTC or we just check server time matching.
-    # Let's just use server system time (which is likely UTC in Docker).
-    
-    now = datetime.now() 
-    current_time_str = now.strftime("%H:%M") # "09:00"
-    
-    logger.info(f"Checking medicine reminders for time: {current_time_str}")
-    
+    from datetime import datetime, timedelta, timezone
+
     if not SessionLocal:
         logger.error("Database session not initialized")
         return
 
+    now = datetime.now(timezone.utc)
+    catchup_cutoff = now - timedelta(minutes=REMINDER_CATCHUP_MINUTES)
+    sent = failed = skipped = 0
+
     db = SessionLocal()
     try:
-        # Find active medicines for this time
-        # Join with User to get email
-        medicines_due = db.query(Medicine).join(User).filter(
-            Medicine.reminder_time == current_time_str,
-            Medicine.is_active == 1
-        ).all()
-        
-        if not medicines_due:
-            logger.info("No medicines due at this time.")
-            return
+        while True:
+            due = _claim_due_reminders(db, now)
+            REMINDER_BATCH_SIZE.observe(len(due))
+            if not due:
+                break
 
-        logger.info(f"Found {len(medicines_due)} medicines due.")
-        
-        for med in medicines_due:
-            user_email = med.owner.email
-            user_name = med.owner.full_name or "User"
-            med_name = med.name
-            dosage = med.dosage
-            
-            # Send Email (Sync or fire async task? We are already in a worker)
-            # We can use the same logic as welcome email logic or call it
-            logger.info(f"Sending reminder for {med_name} to {user_email}")
-            
-            # Construct Email
-            html = f"""
-            <html>
-                <body style="font-family: Arial, sans-serif;">
-                    <div style="padding: 20px; background-color: #fef2f2; border: 1px solid #ef4444; border-radius: 8px;">
-                        <h2 style="color: #b91c1c; margin-top: 0;">Medicine Reminder 💊</h2>
-                        <p>Hi {user_name},</p>
-                        <p>It is <strong>{current_time_str}</strong>. Time to take your medicine:</p>
-                        <h3 style="background-color: white; padding: 10px; display: inline-block; border-radius: 4px;">
-                            {med_name} ({dosage})
-                        </h3>
-                        <p>Stay healthy!</p>
-                        <p>MediFusion AI</p>
-                    </div>
-                </body>
-            </html>
-            """
-            
-            message = MessageSchema(
-                subject=f"Reminder: Time to take {med_name}",
-                recipients=[user_email],
-                body=html,
-                subtype=MessageType.html
-            )
-            
-            fm = FastMail(conf)
-            try:
-                asyncio.run(fm.send_message(message))
-            except Exception as e:
-                logger.error(f"Failed to send reminder to {user_email}: {e}")
-                
+            messages = []
+            schedule_updates = []
+            for row in due:
+                fire_at = as_utc(row.next_reminder_at)
+                schedule_updates.append({
+                    "id": row.id,
+                    "next_reminder_at": next_fire_time(
+                        row.reminder_time, row.frequency, row.timezone, now, anchor=row.created_at
+                    )
+                })
+                if fire_at < catchup_cutoff:
+                    skipped += 1
+                    continue
+                messages.append(_reminder_message(
+                    row.email,
+                    row.full_name or "User",
+                    row.name,
+                    row.dosage,
+                    fire_at.astimezone(get_zone(row.timezone)).strftime("%H:%M")
+                ))
+
+            # One executemany UPDATE by primary key for the whole chunk
+            db.execute(update(Medicine), schedule_updates)
+            # Advance the schedule before sending: a crash mid-send loses a
+            # reminder rather than emailing it twice
+            db.commit()
+            # One concurrent batch per chunk over the pooled SMTP sessions
+            report = mailer.send_batch(messages, label="reminders")
+            sent += report.sent
+            failed += report.failed
+
+        if sent or failed or skipped:
+            logger.info(f"Medicine reminders: sent {sent}, failed {failed}, "
+                        f"skipped {skipped} stale (older than {REMINDER_CATCHUP_MINUTES} min)")
+        else:
+            logger.info("No medicines due at this time.")
     except Exception as e:
+        db.rollback()
         logger.error(f"Error checking reminders: {e}")
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
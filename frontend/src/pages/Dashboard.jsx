@@ -81,6 +81,8 @@ const Dashboard = () => {
           password: authFormData.password,
           full_name: authFormData.name || null,
           role: userType,
+          // Medicine reminders fire in the user's local time
+          timezone: Intl.DateTimeFormat().resolvedOptions().timeZone,
         };
 
         if (userType === 'patient') {
@@ -10,28 +10,23 @@ const History = () => {
   const [error, setError] = useState(null);
   const [selectedConsultation, setSelectedConsultation] = useState(null);
 
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+
+  // History is keyset-paginated and returns summaries only
+  const fetchPage = async (cursor = null) => {
+    const params = cursor ? { cursor } : {};
+    const response = await axiosClient.get('/disease/history', { params });
+    return response.data;
+  };
+
   useEffect(() => {
     const fetchHistory = async () => {
       try {
         setIsLoading(true);
-        const response = await axiosClient.get('/disease/history');
-        // Parse the diagnosis string if it's a JSON string
-        const parsedData = (response.data || []).map(item => {
-          let parsedDiagnosis = null;
-          try {
-            parsedDiagnosis = typeof item.diagnosis === 'string'
-              ? JSON.parse(item.diagnosis)
-              : item.diagnosis;
-          } catch (e) {
-            console.error("Failed to parse diagnosis JSON", e);
-            parsedDiagnosis = { diagnosis: item.diagnosis }; // Fallback for plain text
-          }
-          return {
-            ...item,
-            diagnosisData: parsedDiagnosis
-          };
-        });
-        setConsultations(parsedData);
+        const page = await fetchPage();
+        setConsultations(page.items || []);
+        setNextCursor(page.next_cursor);
         setError(null);
       } catch (err) {
         console.error('Error fetching history:', err);
@@ -45,6 +40,39 @@ const History = () => {
     fetchHistory();
   }, []);
 
+  const loadMore = async () => {
+    if (!nextCursor) return;
+    try {
+      setIsLoadingMore(true);
+      const page = await fetchPage(nextCursor);
+      setConsultations(prev => [...prev, ...(page.items || [])]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      console.error('Error fetching more history:', err);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
+  // Full diagnosis document is fetched on demand for the detail view
+  const openConsultation = async (summary) => {
+    try {
+      const { data: item } = await axiosClient.get(`/disease/history/${summary.id}`);
+      let parsedDiagnosis = null;
+      try {
+        parsedDiagnosis = typeof item.diagnosis === 'string'
+          ? JSON.parse(item.diagnosis)
+          : item.diagnosis;
+      } catch (e) {
+        console.error("Failed to parse diagnosis JSON", e);
+        parsedDiagnosis = { diagnosis: item.diagnosis }; // Fallback for plain text
+      }
+      setSelectedConsultation({ ...item, diagnosisData: parsedDiagnosis });
+    } catch (err) {
+      console.error('Error fetching consultation:', err);
+    }
+  };
+
   const formatDate = (dateString) => {
     return new Date(dateString).toLocaleDateString('en-US', {
       year: 'numeric',
@@ -105,7 +133,7 @@ const History = () => {
                 initial={{ opacity: 0, y: 20 }}
                 animate={{ opacity: 1, y: 0 }}
                 transition={{ delay: index * 0.1 }}
-                onClick={() => setSelectedConsultation(item)}
+                onClick={() => openConsultation(item)}
                 className="group bg-white/10 backdrop-blur-md border border-white/10 rounded-3xl p-6 cursor-pointer hover:bg-white/15 hover:border-cyan-500/30 hover:shadow-lg hover:shadow-cyan-500/10 transition-all duration-300 relative overflow-hidden"
               >
                 <div className="absolute top-0 right-0 p-4 opacity-0 group-hover:opacity-100 transition-opacity">
@@ -118,7 +146,7 @@ const History = () => {
                 </div>
 
                 <h3 className="text-xl font-bold text-white mb-3 line-clamp-2 min-h-[3.5rem]">
-                  {item.diagnosisData?.diagnosis || 'Unknown Condition'}
+                  {item.diagnosis || (item.pending ? 'Analysis Pending' : 'Unknown Condition')}
                 </h3>
 
                 <div className="space-y-4">
@@ -128,29 +156,12 @@ const History = () => {
                       {item.symptoms}
                     </p>
                   </div>
-
-                  {item.diagnosisData?.conditions && (
-                    <div>
-                      <span className="text-xs font-bold text-slate-500 uppercase tracking-wider">Top Match</span>
-                      <div className="flex items-center gap-2 mt-1">
-                        <div className="flex-1 h-1.5 bg-slate-700 rounded-full overflow-hidden">
-                          <div
-                            className="h-full bg-cyan-400"
-                            style={{ width: `${item.diagnosisData.conditions[0]?.confidence || 0}%` }}
-                          />
-                        </div>
-                        <span className="text-cyan-400 text-xs font-bold">
-                          {item.diagnosisData.conditions[0]?.confidence}%
-                        </span>
-                      </div>
-                    </div>
-                  )}
                 </div>
 
                 <div className="mt-6 pt-4 border-t border-white/10 flex justify-between items-center">
                   <div className="flex items-center gap-2 text-slate-400 text-xs">
                     <Activity className="w-3 h-3" />
-                    {item.diagnosisData?.conditions?.length || 0} conditions detected
+                    {item.pending ? 'Processing' : 'Analyzed'}
                   </div>
                   <span className="text-cyan-400 text-sm font-semibold group-hover:translate-x-1 transition-transform">
                     View Details
@@ -160,6 +171,18 @@ const History = () => {
             ))}
           </div>
         )}
+
+        {nextCursor && !isLoading && (
+          <div className="mt-10 text-center">
+            <button
+              onClick={loadMore}
+              disabled={isLoadingMore}
+              className="px-6 py-3 bg-white/10 hover:bg-white/15 border border-white/10 rounded-full text-cyan-300 font-semibold transition-colors disabled:opacity-50"
+            >
+              {isLoadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          </div>
+        )}
       </div>
 
       {/* Detailed View Modal */}
@@ -41,8 +41,8 @@ const Profile = () => {
 
     const fetchHistory = async () => {
         try {
-            const { data } = await axiosClient.get('/disease/history');
-            setHistory(data.slice(0, 3)); // Top 3 recent
+            const { data } = await axiosClient.get('/disease/history', { params: { limit: 3 } });
+            setHistory(data.items || []); // Top 3 recent
         } catch (error) {
             console.error("Error fetching history:", error);
         }
@@ -53,6 +53,7 @@ const Profile = () => {
             // Clean up data (convert empty strings to null if needed for backend, but backend handles Optional)
             const payload = { ...formData };
             if (payload.age) payload.age = parseInt(payload.age); // Ensure int
+            payload.timezone = Intl.DateTimeFormat().resolvedOptions().timeZone; // Reminder times are local
 
             const { data } = await axiosClient.put('/me', payload);
             setUser(data);
@@ -203,7 +204,7 @@ const Profile = () => {
                                         <p className="text-xs text-slate-400">{new Date(item.created_at).toLocaleDateString()}</p>
                                     </div>
                                     <div className="bg-blue-500/20 text-blue-300 px-3 py-1 rounded-full text-xs border border-blue-500/30">
-                                        {item.diagnosis ? 'Analyzed' : 'Pending'}
+                                        {item.pending ? 'Pending' : 'Analyzed'}
                                     </div>
                                 </div>
                             ))}